@@ -0,0 +1,84 @@
+"""Create restaurants, restaurant tables and bookings
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "restaurants",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=128), nullable=False),
+        sa.Column("opening_time", sa.Time(), nullable=False),
+        sa.Column("closing_time", sa.Time(), nullable=False),
+        sa.Column("booking_minutes", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    op.create_index(op.f("ix_restaurants_id"), "restaurants", ["id"], unique=False)
+    op.create_table(
+        "restaurant_tables",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("restaurant_id", sa.Integer(), nullable=False),
+        sa.Column("label", sa.String(length=56), nullable=False),
+        sa.Column("capacity", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["restaurant_id"], ["restaurants.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_restaurant_tables_id"), "restaurant_tables", ["id"], unique=False
+    )
+    op.create_table(
+        "bookings",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("restaurant_id", sa.Integer(), nullable=False),
+        sa.Column("table_id", sa.Integer(), nullable=False),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("start_time", sa.Time(), nullable=False),
+        sa.Column("end_time", sa.Time(), nullable=False),
+        sa.Column("party_size", sa.Integer(), nullable=False),
+        sa.Column("customer_name", sa.String(length=128), nullable=False),
+        sa.Column("customer_phone", sa.String(length=32), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=True,
+        ),
+        sa.ForeignKeyConstraint(["restaurant_id"], ["restaurants.id"]),
+        sa.ForeignKeyConstraint(["table_id"], ["restaurant_tables.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_bookings_id"), "bookings", ["id"], unique=False)
+    op.create_index(
+        "ix_bookings_restaurant_id_date",
+        "bookings",
+        ["restaurant_id", "date"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_bookings_restaurant_id_date", table_name="bookings")
+    op.drop_index(op.f("ix_bookings_id"), table_name="bookings")
+    op.drop_table("bookings")
+    op.drop_index(op.f("ix_restaurant_tables_id"), table_name="restaurant_tables")
+    op.drop_table("restaurant_tables")
+    op.drop_index(op.f("ix_restaurants_id"), table_name="restaurants")
+    op.drop_table("restaurants")
@@ -0,0 +1,40 @@
+"""Add restaurant booking version and booking idempotency key
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "restaurants",
+        sa.Column("booking_version", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "bookings",
+        sa.Column("idempotency_key", sa.String(length=64), nullable=True),
+    )
+    op.create_unique_constraint(
+        "uq_bookings_idempotency_key", "bookings", ["idempotency_key"]
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint("uq_bookings_idempotency_key", "bookings", type_="unique")
+    op.drop_column("bookings", "idempotency_key")
+    op.drop_column("restaurants", "booking_version")
@@ -0,0 +1,65 @@
+"""Add restaurant aliases and updated at
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, Sequence[str], None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "restaurants",
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+    )
+    op.create_index(
+        op.f("ix_restaurants_updated_at"), "restaurants", ["updated_at"], unique=False
+    )
+    op.create_table(
+        "restaurant_aliases",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("restaurant_id", sa.Integer(), nullable=False),
+        sa.Column("alias", sa.String(length=128), nullable=False),
+        sa.ForeignKeyConstraint(["restaurant_id"], ["restaurants.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "restaurant_id", "alias", name="uq_restaurant_aliases_alias"
+        ),
+    )
+    op.create_index(
+        op.f("ix_restaurant_aliases_id"), "restaurant_aliases", ["id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_restaurant_aliases_restaurant_id"),
+        "restaurant_aliases",
+        ["restaurant_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        op.f("ix_restaurant_aliases_restaurant_id"), table_name="restaurant_aliases"
+    )
+    op.drop_index(op.f("ix_restaurant_aliases_id"), table_name="restaurant_aliases")
+    op.drop_table("restaurant_aliases")
+    op.drop_index(op.f("ix_restaurants_updated_at"), table_name="restaurants")
+    op.drop_column("restaurants", "updated_at")
@@ -0,0 +1,128 @@
+"""Compare request size and server CPU per turn of stateless and session chat.
+
+Usage:
+    python -m benchmarks.agent_sessions [--conversations 20] [--turns 40]
+
+The app runs in process against a scratch SQLite database, with the booking
+agent and the summarizer stubbed, so only the API's own work is measured. Each
+conversation of the corpus in benchmarks.conversation_memory is replayed on
+/chat twice: resending the whole chat_history, and sending only the query with
+a sessionId. CPU is the process time spent in the ASGI app per request,
+including the database driver thread and the background summary refresh. The
+app's lifespan does not run, so requests get no Redis pool, which only the
+waitlist tools of the real agent use.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+DATABASE_PATH = os.path.join(tempfile.gettempdir(), "agent_sessions_benchmark.db")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{DATABASE_PATH}")
+
+import httpx  # noqa: E402
+
+from benchmarks.conversation_memory import make_conversation  # noqa: E402
+from src import config  # noqa: E402
+from src.database import async_engine  # noqa: E402
+from src.main import app  # noqa: E402
+from src.models.chat_model import Base  # noqa: E402
+from src.queue import get_redis_pool  # noqa: E402
+from src.routes import agent_route  # noqa: E402
+from src.utils import conversation_memory  # noqa: E402
+
+CHAT_URL = f"http://test/api/{config.API_VERSION}/agent/chat"
+
+
+async def stub_agent(input, context, mode) -> str:
+    return agent_responses.pop(0)
+
+
+async def no_redis_pool() -> None:
+    return None
+
+
+async def stub_summarize(summary, turns) -> str:
+    return "The user is booking a table for a group, details were confirmed."
+
+
+agent_responses: list = []
+cpu_times: list = []
+
+
+async def timed_app(scope, receive, send) -> None:
+    start = time.process_time()
+    await app(scope, receive, send)
+    if scope["type"] == "http":
+        cpu_times.append(time.process_time() - start)
+
+
+async def replay(client: httpx.AsyncClient, conversation: list, mode: str, key: str):
+    sizes = []
+    chat_history = []
+    session_id = uuid.uuid4().hex
+    for query, response in conversation:
+        body = {"query": query, "userId": key}
+        if mode == "session":
+            body["sessionId"] = session_id
+        else:
+            body["chatHistory"] = chat_history
+        content = json.dumps(body).encode()
+        sizes.append(len(content))
+        agent_responses.append(response)
+        reply = await client.post(
+            CHAT_URL, content=content, headers={"Content-Type": "application/json"}
+        )
+        reply.raise_for_status()
+        chat_history.append({"query": query, "response": response})
+    return sizes
+
+
+def report(name: str, sizes: list, cpu: list) -> None:
+    sizes, cpu = sorted(sizes), sorted(cpu)
+    print(
+        f"{name:<10} request p50 {statistics.median(sizes):>8.0f} B"
+        f"   max {sizes[-1]:>8} B   CPU p50 {statistics.median(cpu) * 1000:6.2f} ms"
+        f"   p95 {cpu[int(len(cpu) * 0.95)] * 1000:6.2f} ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    agent_route.run_table_booking_agent = stub_agent
+    app.dependency_overrides[get_redis_pool] = no_redis_pool
+    conversation_memory.summarize = stub_summarize
+
+    rng = random.Random(args.seed)
+    conversations = [
+        make_conversation(rng, args.turns) for _ in range(args.conversations)
+    ]
+    transport = httpx.ASGITransport(app=timed_app)
+    async with httpx.AsyncClient(transport=transport) as client:
+        for mode in ("stateless", "session"):
+            sizes = []
+            cpu_times.clear()
+            for number, conversation in enumerate(conversations):
+                sizes.extend(
+                    await replay(client, conversation, mode, f"{mode}-{number}")
+                )
+            report(mode, sizes, list(cpu_times))
+    await async_engine.dispose()
+    os.remove(DATABASE_PATH)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,304 @@
+"""Count the model turns per completed booking, with and without the date in the prompt.
+
+Usage:
+    python -m benchmarks.agent_turns [--conversations 200]
+
+The booking agent runs with a scripted model in place of the OpenAI one, against
+the real tools, availability index and a scratch SQLite database. Each scripted
+conversation asks for a table on a date written the way customers do ("tomorrow",
+"this Friday", "24/10/2026") and gives every detail in the first message, so a
+model goes straight to the availability check, the booking and its reply.
+
+The scripted model behaves like the real one given each configuration: with the
+static prompt and the fetch_current_date_time tool it has to call that tool before
+it can turn a relative date into dd/mm/yyyy, with the date in the instructions it
+passes the customer's words on and the tools resolve them. Every saved booking is
+checked to be on the date the customer meant.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+from datetime import time as clock
+
+DATABASE_PATH = os.path.join(tempfile.gettempdir(), "agent_turns_benchmark.db")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{DATABASE_PATH}")
+
+from agents import (  # noqa: E402
+    Model,
+    ModelResponse,
+    RunConfig,
+    Runner,
+    Usage,
+    function_tool,
+)
+from openai.types.responses import (  # noqa: E402
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+)
+from sqlalchemy import select  # noqa: E402
+
+from src import config  # noqa: E402
+from src.custom_agents.table_booking_agent import table_booking_agent  # noqa: E402
+from src.database import async_engine, get_database_session  # noqa: E402
+from src.models.chat_model import Base  # noqa: E402
+from src.models.restaurant_model import (  # noqa: E402
+    Booking,
+    Restaurant,
+    RestaurantTable,
+)
+from src.repositories.restaurant_repository import load_restaurants  # noqa: E402
+from src.schemas.schemas import UserInfo  # noqa: E402
+from src.utils.availability_index import availability_index  # noqa: E402
+from src.utils.restaurant_catalog import restaurant_catalog  # noqa: E402
+from src.utils.prompts import TABLE_BOOKING_AGENT_PROMPT  # noqa: E402
+from src.utils.relative_dates import (  # noqa: E402
+    DATE_FORMAT,
+    TIME_FORMAT,
+    local_now,
+    parse_date,
+    parse_time,
+)
+
+RELATIVE_DATES = [
+    "today",
+    "tomorrow",
+    "day after tomorrow",
+    "this Friday",
+    "Saturday",
+    "next Tuesday",
+    "in 3 days",
+]
+TIMES = ["8pm", "7.30 pm", "19:00", "noon", "20:30", "1pm"]
+RESTAURANTS = 5
+TABLES = 40
+
+
+@function_tool
+async def fetch_current_date_time() -> str:
+    """Fetch the today's date and time"""
+    return local_now(config.RESTAURANT_TIMEZONE).strftime("%c")
+
+
+def date_tool_agent():
+    """The agent as it was, static prompt and a tool for the current date"""
+    return table_booking_agent.clone(
+        instructions=TABLE_BOOKING_AGENT_PROMPT,
+        tools=[fetch_current_date_time, *table_booking_agent.tools],
+    )
+
+
+class ScriptedModel(Model):
+    """Plays one conversation: date if needed, availability, booking, reply"""
+
+    def __init__(self, request: dict):
+        self.request = request
+        self.turns = 0
+
+    def _call(self, name: str, arguments: dict) -> ModelResponse:
+        call = ResponseFunctionToolCall(
+            type="function_call",
+            id=f"fc_{self.turns}",
+            call_id=f"call_{self.turns}",
+            name=name,
+            arguments=json.dumps(arguments),
+        )
+        return ModelResponse(output=[call], usage=Usage(), response_id=None)
+
+    def _reply(self, text: str) -> ModelResponse:
+        message = ResponseOutputMessage(
+            type="message",
+            id=f"msg_{self.turns}",
+            role="assistant",
+            status="completed",
+            content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+        )
+        return ModelResponse(output=[message], usage=Usage(), response_id=None)
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id,
+        prompt,
+    ) -> ModelResponse:
+        self.turns += 1
+        names = {}
+        outputs = {}
+        for item in input if isinstance(input, list) else []:
+            if item.get("type") == "function_call":
+                names[item["call_id"]] = item["name"]
+            elif item.get("type") == "function_call_output":
+                outputs[names[item["call_id"]]] = item["output"]
+
+        request = self.request
+        date_text = request["date"]
+        time_text = request["time"]
+        if "Today is" not in (system_instructions or ""):
+            # Without the date in the prompt the model resolves dates itself and
+            # needs today's date to do so, unless the customer gave a full date
+            try:
+                datetime.strptime(date_text, DATE_FORMAT)
+            except ValueError:
+                if "fetch_current_date_time" not in outputs:
+                    return self._call("fetch_current_date_time", {})
+                today = datetime.strptime(
+                    outputs["fetch_current_date_time"], "%c"
+                ).date()
+                date_text = parse_date(date_text, today).strftime(DATE_FORMAT)
+            time_text = parse_time(time_text).strftime(TIME_FORMAT)
+
+        details = {
+            "restaurant_name": request["restaurant_name"],
+            "date": date_text,
+            "number_of_person": request["party_size"],
+        }
+        if "fetch_table_availability" not in outputs:
+            return self._call(
+                "fetch_table_availability",
+                {**details, "time_window": [time_text, "23:00"]},
+            )
+        if "save_booking" not in outputs:
+            return self._call(
+                "save_booking",
+                {
+                    **details,
+                    "time": time_text,
+                    "customer_name": request["customer_name"],
+                    "customer_phone": request["customer_phone"],
+                },
+            )
+        return self._reply(outputs["save_booking"])
+
+    def stream_response(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+def make_requests(rng: random.Random, count: int) -> list:
+    today = local_now(config.RESTAURANT_TIMEZONE).date()
+    requests = []
+    for number in range(count):
+        if rng.random() < 0.75:
+            date_text = rng.choice(RELATIVE_DATES)
+        else:
+            date_text = (today + timedelta(days=rng.randint(1, 20))).strftime(
+                DATE_FORMAT
+            )
+        # The time asked for today may have passed, such a booking is refused
+        if parse_date(date_text, today) == today:
+            date_text = "tomorrow"
+        requests.append(
+            {
+                "restaurant": rng.randint(1, RESTAURANTS),
+                "date": date_text,
+                "time": rng.choice(TIMES),
+                "party_size": rng.randint(1, 4),
+                "customer_name": f"Customer {number}",
+                "customer_phone": f"+44 7900 {number:06d}",
+            }
+        )
+    return requests
+
+
+async def create_restaurants() -> None:
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    db = await get_database_session()
+    try:
+        # Each configuration books its own restaurants, both start empty
+        for prefix in ("Date Tool", "Instructions"):
+            for number in range(1, RESTAURANTS + 1):
+                restaurant = Restaurant(
+                    name=f"{prefix} Trattoria {number}",
+                    opening_time=clock(11),
+                    closing_time=clock(23, 30),
+                    booking_minutes=90,
+                )
+                restaurant.tables = [
+                    RestaurantTable(label=f"T{table}", capacity=4)
+                    for table in range(TABLES)
+                ]
+                db.add(restaurant)
+        await db.commit()
+        await load_restaurants(
+            db=db, index=availability_index, catalog=restaurant_catalog
+        )
+    finally:
+        await db.close()
+
+
+async def run(name: str, agent, prefix: str, requests: list) -> None:
+    turns = 0
+    confirmed = {}
+    for number, request in enumerate(requests):
+        request = {
+            **request,
+            "restaurant_name": f"{prefix} Trattoria {request['restaurant']}",
+        }
+        model = ScriptedModel(request)
+        result = await Runner.run(
+            starting_agent=agent,
+            input=f"Book a table for {request['party_size']} at "
+            f"{request['restaurant_name']} {request['date']} at {request['time']}, "
+            f"{request['customer_name']}, {request['customer_phone']}",
+            context=UserInfo(uid=f"{prefix}-{number}"),
+            run_config=RunConfig(model=model),
+        )
+        turns += model.turns
+        if result.final_output.startswith("Booking confirmed"):
+            confirmed[request["customer_phone"]] = request
+
+    today = local_now(config.RESTAURANT_TIMEZONE).date()
+    db = await get_database_session()
+    try:
+        result = await db.execute(
+            select(Booking.customer_phone, Booking.date, Booking.start_time)
+            .join(Restaurant, Restaurant.id == Booking.restaurant_id)
+            .where(Restaurant.name.startswith(prefix))
+        )
+        rows = result.all()
+    finally:
+        await db.close()
+    assert len(rows) == len(confirmed)
+    for phone, booking_date, start_time in rows:
+        request = confirmed[phone]
+        assert booking_date == parse_date(request["date"], today), request
+        assert start_time == parse_time(request["time"]), request
+
+    print(
+        f"{name:<24} {len(requests)} conversations, {len(confirmed)} bookings,"
+        f" {turns} model turns, {turns / len(confirmed):.2f} turns per booking"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    requests = make_requests(random.Random(args.seed), args.conversations)
+    await create_restaurants()
+    await run("date tool", date_tool_agent(), "Date Tool", requests)
+    await run("date in instructions", table_booking_agent, "Instructions", requests)
+    relative = sum(request["date"] in RELATIVE_DATES for request in requests) / len(
+        requests
+    )
+    print(f"{relative:.0%} of the requests give a relative date, all bookings checked")
+    await async_engine.dispose()
+    os.remove(DATABASE_PATH)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
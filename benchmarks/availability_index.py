@@ -0,0 +1,228 @@
+"""Time availability queries on the in-memory index over thousands of restaurants.
+
+Usage:
+    python -m benchmarks.availability_index [--restaurants 5000] [--days 7]
+        [--queries 20000] [--booking-every 10]
+
+Every restaurant opens 11:00-23:00 with 12 to 30 tables of 2 to 10 seats and 90
+minute bookings. Tables are booked at random with a lunch peak around 50% and a
+dinner peak around 85% occupancy. Queries ask for a party of 1 to 10, mostly
+couples, within a two hour window. Alternatives are looked up when the window is
+full, as the tool does. A sample of queries is checked against a brute force scan
+of the bookings.
+
+The same queries then go through the availability cache the way conversations
+ask: restaurants by popularity, each request repeated up to three times while
+the user clarifies, with a booking applied every --booking-every queries so its
+restaurant and date are invalidated. Every cached answer is checked against the
+index.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+from src.utils.availability_cache import AvailabilityCache  # noqa: E402
+from src.utils.availability_index import (  # noqa: E402
+    AvailabilityIndex,
+    RestaurantInfo,
+    TableInfo,
+)
+
+OPEN_SLOT = 44  # 11:00
+CLOSE_SLOT = 92  # 23:00
+BOOKING_SLOTS = 6  # 90 minutes
+CAPACITIES = [2, 2, 2, 2, 4, 4, 4, 6, 6, 8, 10]
+PARTY_SIZES = [2] * 10 + [1, 3, 3, 4, 4, 4, 5, 6, 6, 8, 10]
+CHECKED_QUERIES = 500
+
+
+def occupancy_rate(slot: int) -> float:
+    if 48 <= slot < 56:  # 12:00-14:00
+        return 0.5
+    if 72 <= slot < 84:  # 18:00-21:00
+        return 0.85
+    return 0.2
+
+
+def build_index(rng: random.Random, restaurants: int, days: int, first: date):
+    index = AvailabilityIndex()
+    bookings = {}
+    table_id = 0
+    for restaurant_id in range(1, restaurants + 1):
+        tables = []
+        for number in range(rng.randint(12, 30)):
+            table_id += 1
+            tables.append(TableInfo(table_id, f"T{number}", rng.choice(CAPACITIES)))
+        index.add_restaurant(
+            RestaurantInfo(
+                id=restaurant_id,
+                name=f"Restaurant {restaurant_id}",
+                open_slot=OPEN_SLOT,
+                close_slot=CLOSE_SLOT,
+                booking_slots=BOOKING_SLOTS,
+                tables=tuple(sorted(tables, key=lambda table: table.capacity)),
+            )
+        )
+        for day in range(days):
+            booking_date = first + timedelta(days=day)
+            for table in tables:
+                slot = OPEN_SLOT
+                while slot + BOOKING_SLOTS <= CLOSE_SLOT:
+                    if rng.random() < occupancy_rate(slot) / BOOKING_SLOTS * 2:
+                        index.add_booking(
+                            restaurant_id,
+                            table.id,
+                            booking_date,
+                            slot,
+                            slot + BOOKING_SLOTS,
+                        )
+                        bookings.setdefault((table.id, booking_date), []).append(
+                            (slot, slot + BOOKING_SLOTS)
+                        )
+                        slot += BOOKING_SLOTS
+                    else:
+                        slot += 1
+    return index, bookings
+
+
+def brute_force_slots(index, bookings, restaurant_id, booking_date, party, start, end):
+    restaurant = index.restaurants[restaurant_id]
+    slots = []
+    for slot in range(max(start, OPEN_SLOT), min(end, CLOSE_SLOT - BOOKING_SLOTS) + 1):
+        for table in restaurant.tables:
+            busy = bookings.get((table.id, booking_date), [])
+            if table.capacity >= party and all(
+                slot + BOOKING_SLOTS <= busy_start or slot >= busy_end
+                for busy_start, busy_end in busy
+            ):
+                slots.append(slot)
+                break
+    return slots
+
+
+def percentiles(latencies) -> str:
+    latencies = sorted(latencies)
+    return (
+        f"p50 {statistics.median(latencies) * 1e6:7.1f} us"
+        f"   p99 {latencies[int(len(latencies) * 0.99)] * 1e6:7.1f} us"
+        f"   max {latencies[-1] * 1e6:7.1f} us"
+    )
+
+
+def run_cached(rng, index, args, first) -> None:
+    cache = AvailabilityCache(index=index, max_size=10000, ttl_seconds=300)
+    weights = [1 / rank for rank in range(1, args.restaurants + 1)]
+    requests = []
+    while len(requests) < args.queries:
+        request = (
+            rng.choices(range(1, args.restaurants + 1), weights)[0],
+            first + timedelta(days=rng.randrange(args.days)),
+            rng.choice(PARTY_SIZES),
+            rng.randint(OPEN_SLOT, CLOSE_SLOT - 8),
+        )
+        requests.extend([request] * rng.randint(1, 3))
+
+    cached_latencies = []
+    hit_latencies = []
+    index_latencies = []
+    for number, (restaurant_id, booking_date, party, window_start) in enumerate(
+        requests[: args.queries]
+    ):
+        if number % args.booking_every == 0:
+            table = rng.choice(index.restaurants[restaurant_id].tables)
+            slot = rng.randint(OPEN_SLOT, CLOSE_SLOT - BOOKING_SLOTS)
+            index.add_booking(
+                restaurant_id, table.id, booking_date, slot, slot + BOOKING_SLOTS
+            )
+        hits = cache.stats["hits"]
+        query_start = time.perf_counter()
+        lookup = cache.lookup(
+            restaurant_id, booking_date, party, window_start, window_start + 8, 1, 3
+        )
+        cached_latencies.append(time.perf_counter() - query_start)
+        if cache.stats["hits"] > hits:
+            hit_latencies.append(cached_latencies[-1])
+        query_start = time.perf_counter()
+        options = index.find_slots(
+            restaurant_id, booking_date, party, window_start, window_start + 8
+        )
+        alternatives = []
+        if not options:
+            alternatives = index.find_alternatives(
+                restaurant_id, booking_date, party, window_start, days=1, limit=3
+            )
+        index_latencies.append(time.perf_counter() - query_start)
+        assert lookup.options == options and lookup.alternatives == alternatives
+
+    stats = cache.get_stats()
+    print(
+        f"cache: {stats['hit_rate']:.1%} hits, {stats['stale']} entries invalidated"
+        f" by bookings, {stats['saved_ms']:.1f} ms of index time saved,"
+        f" {len(cached_latencies)} answers checked against the index"
+    )
+    print(f"index  {percentiles(index_latencies)}")
+    print(f"cached {percentiles(cached_latencies)}")
+    print(f"hits   {percentiles(hit_latencies)}")
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    first = date.today()
+    start = time.perf_counter()
+    index, bookings = build_index(rng, args.restaurants, args.days, first)
+    print(
+        f"Built {args.restaurants} restaurants x {args.days} days,"
+        f" {sum(len(value) for value in bookings.values())} bookings"
+        f" in {time.perf_counter() - start:.1f}s"
+    )
+
+    latencies = []
+    full = 0
+    for number in range(args.queries):
+        restaurant_id = rng.randint(1, args.restaurants)
+        booking_date = first + timedelta(days=rng.randrange(args.days))
+        party = rng.choice(PARTY_SIZES)
+        window_start = rng.randint(OPEN_SLOT, CLOSE_SLOT - 8)
+        query_start = time.perf_counter()
+        options = index.find_slots(
+            restaurant_id, booking_date, party, window_start, window_start + 8
+        )
+        if not options:
+            full += 1
+            index.find_alternatives(
+                restaurant_id, booking_date, party, window_start, days=1, limit=3
+            )
+        latencies.append(time.perf_counter() - query_start)
+        if number < CHECKED_QUERIES:
+            expected = brute_force_slots(
+                index,
+                bookings,
+                restaurant_id,
+                booking_date,
+                party,
+                window_start,
+                window_start + 8,
+            )
+            assert [option.start_slot for option in options] == expected
+    print(
+        f"{args.queries} queries, {full / args.queries:.1%} with a full window,"
+        f" {CHECKED_QUERIES} checked against a brute force scan"
+    )
+    print(percentiles(latencies))
+    run_cached(rng, index, args, first)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--restaurants", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--booking-every", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,195 @@
+"""Concurrent bookings of the same slot, checked for overbooking, and bookings/sec.
+
+Usage:
+    python -m benchmarks.booking_contention [--database-url sqlite+aiosqlite:///scratch.db]
+        [--tables 20] [--bookings 500] [--retries 100] [--restaurants 20]
+
+Use a scratch database, its tables are dropped and recreated. First every booking
+asks for the same restaurant, date and time at once, a share of them retried with
+the same idempotency key like an agent repeating the tool call. Exactly one
+booking per table has to be made, no table twice, and each retry has to get the
+booking of its first call. Then bookings spread over several restaurants and
+times measure the throughput when they do not all contend for one row.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import date, timedelta
+from datetime import time as clock
+
+DATABASE_URL_DEFAULT = "sqlite+aiosqlite:///booking_contention_benchmark.db"
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", DATABASE_URL_DEFAULT)
+
+from sqlalchemy import select  # noqa: E402
+
+from src import database  # noqa: E402
+from src.database import get_database_session  # noqa: E402
+from src.models.chat_model import Base  # noqa: E402
+from src.models.restaurant_model import (  # noqa: E402
+    Booking,
+    Restaurant,
+    RestaurantTable,
+)
+from src.repositories.booking_repository import (  # noqa: E402
+    booking_idempotency_key,
+    reserve_booking,
+)
+from src.repositories.restaurant_repository import load_restaurants  # noqa: E402
+from src.utils.availability_index import AvailabilityIndex, time_to_slot  # noqa: E402
+
+OPENING_TIME = clock(11)
+CLOSING_TIME = clock(23)
+PARTY_SIZE = 2
+
+
+async def reset_tables(restaurants: int, tables: int) -> AvailabilityIndex:
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    db = await get_database_session()
+    try:
+        for number in range(1, restaurants + 1):
+            restaurant = Restaurant(
+                name=f"Restaurant {number}",
+                opening_time=OPENING_TIME,
+                closing_time=CLOSING_TIME,
+                booking_minutes=90,
+            )
+            restaurant.tables = [
+                RestaurantTable(label=f"T{table}", capacity=PARTY_SIZE)
+                for table in range(tables)
+            ]
+            db.add(restaurant)
+        await db.commit()
+        index = AvailabilityIndex()
+        await load_restaurants(db=db, index=index)
+        return index
+    finally:
+        await db.close()
+
+
+async def book(index, restaurant_id, booking_date, start_slot, customer):
+    db = await get_database_session()
+    try:
+        return await reserve_booking(
+            db=db,
+            restaurant=index.restaurants[restaurant_id],
+            booking_date=booking_date,
+            start_slot=start_slot,
+            party_size=PARTY_SIZE,
+            customer_name=f"Customer {customer}",
+            customer_phone=f"+44 7900 {customer:06d}",
+            idempotency_key=booking_idempotency_key(
+                uid=f"user-{customer}",
+                restaurant_id=restaurant_id,
+                booking_date=booking_date,
+                start_slot=start_slot,
+                party_size=PARTY_SIZE,
+                customer_name=f"Customer {customer}",
+                customer_phone=f"+44 7900 {customer:06d}",
+            ),
+        )
+    finally:
+        await db.close()
+
+
+async def check_no_overbooking() -> int:
+    """Number of saved bookings, after checking no two of a table overlap"""
+    db = await get_database_session()
+    try:
+        result = await db.execute(
+            select(
+                Booking.table_id, Booking.date, Booking.start_time, Booking.end_time
+            ).order_by(Booking.table_id, Booking.date, Booking.start_time)
+        )
+        rows = result.all()
+    finally:
+        await db.close()
+    for previous, row in zip(rows, rows[1:]):
+        assert (
+            previous.table_id != row.table_id
+            or previous.date != row.date
+            or previous.end_time <= row.start_time
+        ), f"table {row.table_id} is booked twice at {row.start_time}"
+    return len(rows)
+
+
+async def same_slot(args: argparse.Namespace) -> None:
+    index = await reset_tables(restaurants=1, tables=args.tables)
+    booking_date = date.today() + timedelta(days=1)
+    start_slot = time_to_slot(clock(20))
+    customers = list(range(args.bookings))
+    calls = customers + random.sample(customers, args.retries)
+    random.shuffle(calls)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(book(index, 1, booking_date, start_slot, customer) for customer in calls)
+    )
+    elapsed = time.perf_counter() - start
+
+    booking_ids = {}
+    for customer, result in zip(calls, results):
+        if result is not None:
+            booking_ids.setdefault(customer, set()).add(result.booking.id)
+    assert all(len(ids) == 1 for ids in booking_ids.values()), "a retry booked twice"
+    saved = await check_no_overbooking()
+    assert saved == args.tables, f"{saved} bookings for {args.tables} tables"
+    print(
+        f"same slot     {len(calls)} concurrent calls ({args.retries} retries)"
+        f" for {args.tables} tables: {saved} booked, none twice,"
+        f" {len(calls) / elapsed:6.0f} calls/s"
+    )
+
+
+async def spread(args: argparse.Namespace) -> None:
+    index = await reset_tables(restaurants=args.restaurants, tables=args.tables)
+    booking_date = date.today() + timedelta(days=1)
+    slots = range(time_to_slot(OPENING_TIME), time_to_slot(clock(21, 30)) + 1, 6)
+    calls = [
+        (random.randint(1, args.restaurants), random.choice(slots), customer)
+        for customer in range(args.bookings)
+    ]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            book(index, restaurant_id, booking_date, slot, customer)
+            for restaurant_id, slot, customer in calls
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    saved = await check_no_overbooking()
+    assert saved == sum(result is not None for result in results)
+    print(
+        f"spread        {len(calls)} concurrent calls over {args.restaurants}"
+        f" restaurants: {saved} booked, none twice, {saved / elapsed:6.0f} bookings/s"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    await same_slot(args)
+    await spread(args)
+    await database.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--bookings", type=int, default=500)
+    parser.add_argument("--retries", type=int, default=100)
+    parser.add_argument("--restaurants", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    if args.database_url is not None:
+        # Point the application's session factory at the benchmark database
+        database.async_engine = database.create_async_engine(url=args.database_url)
+        database.AsyncSessionLocal.configure(bind=database.async_engine)
+    asyncio.run(main(args))
@@ -0,0 +1,166 @@
+"""Replay a conversation corpus and compare prompt tokens with and without the memory.
+
+Usage:
+    python -m benchmarks.conversation_memory [--conversations 200] [--turns 40]
+        [--token-budget 1000] [--keep-tokens 400] [--summary-tokens 150]
+
+Conversations mix short follow ups ("4 people", "yes") with long messages such
+as pasted menus and dietary notes. Every turn is replayed three ways: the last
+15 stored messages (the old WhatsApp path), the whole client history (the old
+API path) and the token-budgeted window with a rolling summary. The summarizer
+is stubbed with a summary of --summary-tokens tokens, by default the most the
+model may return, and the refresh lands before the next turn.
+"""
+
+import argparse
+import os
+import random
+import statistics
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+from src import config  # noqa: E402
+from src.utils.conversation_memory import (  # noqa: E402
+    Turn,
+    build_window,
+    select_turns_to_fold,
+)
+from src.utils.tokenizer import count_message_tokens  # noqa: E402
+
+LEGACY_HISTORY_LIMIT = 15
+
+SHORT_QUERIES = ["yes", "4 people", "8pm please", "John", "tomorrow", "thanks"]
+QUERIES = [
+    "Can I book a table for {n} at {time} on Friday at the Italian place downtown?",
+    "Is there availability for {n} people around {time} this weekend?",
+    "Actually make that {n} guests, and could we sit outside if it is warm?",
+]
+LONG_QUERY = (
+    "We are celebrating my parents' anniversary, {n} of us, two are vegetarian, one "
+    "is allergic to nuts and my father uses a wheelchair so we need step free access "
+    "and a table away from the kitchen. Could you also tell me whether they have a "
+    "set menu for groups, if we can bring our own cake and what the corkage fee is? "
+) * 3
+RESPONSES = [
+    "Sure, let me check availability for {n} people at {time}.",
+    "A table for {n} at {time} is available. Shall I book it, and under which name?",
+    "Your booking for {n} at {time} is confirmed, the reference is BK{ref}.",
+]
+LONG_RESPONSE = (
+    "Here is what I found: the restaurant has step free access and accessible "
+    "restrooms, the set menu for groups has three courses with vegetarian and nut "
+    "free options, cakes are welcome and there is no corkage fee on weekdays. "
+) * 2
+
+
+def make_conversation(rng: random.Random, turns: int) -> list:
+    messages = []
+    for _ in range(turns):
+        values = {
+            "n": rng.randint(2, 12),
+            "time": f"{rng.randint(5, 10)}pm",
+            "ref": rng.randint(1000, 9999),
+        }
+        roll = rng.random()
+        if roll < 0.35:
+            query = rng.choice(SHORT_QUERIES)
+        elif roll < 0.85:
+            query = rng.choice(QUERIES).format(**values)
+        else:
+            query = LONG_QUERY.format(**values)
+        response = (
+            LONG_RESPONSE if rng.random() < 0.2 else rng.choice(RESPONSES)
+        ).format(**values)
+        messages.append((query, response))
+    return messages
+
+
+def prompt_tokens(messages: list) -> int:
+    return sum(count_message_tokens(message) for message in messages)
+
+
+def replay(
+    conversation: list, token_budget: int, keep_tokens: int, summary_tokens: int
+) -> dict:
+    stub_summary = " ".join(["booking"] * summary_tokens)
+    history = []
+    summary = None
+    summarized_until = 0
+    tokens = {"last 15 messages": [], "full history": [], "memory": []}
+    refreshes = 0
+    for position, (query, response) in enumerate(conversation, start=1):
+        query_message = {"role": "user", "content": query}
+        tokens["last 15 messages"].append(
+            prompt_tokens(
+                [turn.message for turn in history[-LEGACY_HISTORY_LIMIT:]]
+                + [query_message]
+            )
+        )
+        tokens["full history"].append(
+            prompt_tokens([turn.message for turn in history] + [query_message])
+        )
+        turns = [turn for turn in history if turn.position > summarized_until]
+        window = build_window(
+            turns=turns, query=query, summary=summary, token_budget=token_budget
+        )
+        tokens["memory"].append(window.prompt_tokens)
+        history.append(Turn(position=position, message=query_message))
+        history.append(
+            Turn(position=position, message={"role": "assistant", "content": response})
+        )
+        if window.needs_summary:
+            folded = select_turns_to_fold(turns=turns, keep_tokens=keep_tokens)
+            if folded:
+                summary = stub_summary
+                summarized_until = folded[-1].position
+                refreshes += 1
+    return {"tokens": tokens, "refreshes": refreshes}
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    totals = {"last 15 messages": [], "full history": [], "memory": []}
+    refreshes = 0
+    for _ in range(args.conversations):
+        result = replay(
+            make_conversation(rng, args.turns),
+            args.token_budget,
+            args.keep_tokens,
+            args.summary_tokens,
+        )
+        for name, values in result["tokens"].items():
+            totals[name].extend(values)
+        refreshes += result["refreshes"]
+
+    turns = len(totals["memory"])
+    print(
+        f"{args.conversations} conversations, {turns} turns, "
+        f"budget {args.token_budget} tokens, {refreshes} summary refreshes"
+    )
+    for name, values in totals.items():
+        values.sort()
+        print(
+            f"{name:<18} total {sum(values):>10}   p50 {statistics.median(values):>7.0f}"
+            f"   p95 {values[int(len(values) * 0.95)]:>7}   max {values[-1]:>7}"
+        )
+    for baseline in ("last 15 messages", "full history"):
+        reduction = 1 - sum(totals["memory"]) / sum(totals[baseline])
+        print(f"Prompt tokens saved against {baseline}: {reduction:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument(
+        "--token-budget", type=int, default=config.CONVERSATION_TOKEN_BUDGET
+    )
+    parser.add_argument(
+        "--keep-tokens", type=int, default=config.CONVERSATION_SUMMARY_KEEP_TOKENS
+    )
+    parser.add_argument(
+        "--summary-tokens", type=int, default=config.CONVERSATION_SUMMARY_MAX_TOKENS
+    )
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,95 @@
+"""Offline evaluation of the local guardrail classifier.
+
+Usage:
+    python -m benchmarks.evaluate_guardrail [--threshold 0.8] [--with-llm]
+
+Reports the accuracy of the local tier, the escalation rate and the per-call
+latency. With --with-llm the escalated samples are sent to the guardrail agent
+so the end to end accuracy is reported as well (needs OPENAI_API_KEY).
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+from src.utils.guardrail_classifier import classify_table_booking
+
+SAMPLES_PATH = Path(__file__).parent / "data" / "guardrail_samples.jsonl"
+
+
+def load_samples(path: Path) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_input(sample: dict) -> list:
+    return sample["history"] + [{"role": "user", "content": sample["query"]}]
+
+
+async def evaluate(samples: list, threshold: float, with_llm: bool) -> None:
+    latencies = []
+    local_correct = 0
+    confident_correct = 0
+    escalated = []
+
+    for sample in samples:
+        start = time.perf_counter()
+        output = classify_table_booking(input=build_input(sample))
+        latencies.append((time.perf_counter() - start) * 1_000_000)
+
+        correct = output.is_table_booking == sample["is_table_booking"]
+        local_correct += correct
+        if output.confidence >= threshold:
+            confident_correct += correct
+        else:
+            escalated.append(sample)
+
+    total = len(samples)
+    confident = total - len(escalated)
+    latencies.sort()
+    print(f"Samples:                      {total}")
+    print(f"Threshold:                    {threshold}")
+    print(f"Local accuracy (all):         {local_correct / total:.1%}")
+    print(f"Local accuracy (confident):   {confident_correct / max(confident, 1):.1%}")
+    print(
+        f"Escalation rate:              {len(escalated) / total:.1%} ({len(escalated)})"
+    )
+    print(f"Latency mean:                 {statistics.mean(latencies):.1f} us")
+    print(f"Latency p50:                  {latencies[len(latencies) // 2]:.1f} us")
+    print(
+        f"Latency p95:                  {latencies[int(len(latencies) * 0.95)]:.1f} us"
+    )
+
+    if with_llm and escalated:
+        from src.custom_agents.guard_rail_agent import guardrail_agent
+        from agents import Runner
+        from src.schemas.schemas import TableBookingOutput
+
+        llm_correct = 0
+        for sample in escalated:
+            result = await Runner.run(
+                starting_agent=guardrail_agent, input=build_input(sample)
+            )
+            output = result.final_output_as(TableBookingOutput)
+            llm_correct += output.is_table_booking == sample["is_table_booking"]
+        print(
+            f"End to end accuracy:          {(confident_correct + llm_correct) / total:.1%}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=Path, default=SAMPLES_PATH)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--with-llm", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(
+        evaluate(
+            samples=load_samples(args.samples),
+            threshold=args.threshold,
+            with_llm=args.with_llm,
+        )
+    )
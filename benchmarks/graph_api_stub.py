@@ -0,0 +1,85 @@
+"""Local stand-in for the Graph API /messages endpoint.
+
+Usage:
+    python -m benchmarks.graph_api_stub [--port 8081] [--latency 0.02] [--error-rate 0.0]
+
+Point the service at it with GRAPH_API_URL=http://127.0.0.1:8081. Messages whose
+body looks like "<sequence>:<text>" are checked for per-recipient ordering, and
+GET /stats reports the received, rejected and out-of-order counts. GET /deliveries
+gives the times each recipient's messages were accepted, for end-to-end latency.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Graph API stub")
+app.state.latency = 0.02
+app.state.error_rate = 0.0
+
+stats = {"received": 0, "rejected": 0, "out_of_order": 0}
+last_sequence = defaultdict(lambda: -1)
+deliveries = defaultdict(list)
+
+
+@app.post("/{phone_number_id}/messages")
+async def post_message(phone_number_id: str, request: Request):
+    payload = await request.json()
+    await asyncio.sleep(app.state.latency)
+    if random.random() < app.state.error_rate:
+        stats["rejected"] += 1
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit hit", "code": 130429}},
+            headers={"Retry-After": "0"},
+        )
+    stats["received"] += 1
+    recipient = payload["to"]
+    deliveries[recipient].append(time.time())
+    sequence, _, _ = payload["text"]["body"].partition(":")
+    if sequence.isdigit():
+        if int(sequence) < last_sequence[recipient]:
+            stats["out_of_order"] += 1
+        last_sequence[recipient] = int(sequence)
+    return {
+        "messaging_product": "whatsapp",
+        "contacts": [{"input": recipient, "wa_id": recipient}],
+        "messages": [{"id": f"wamid.stub{stats['received']}"}],
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.get("/deliveries")
+async def get_deliveries():
+    return deliveries
+
+
+@app.post("/reset")
+async def reset_stats():
+    for key in stats:
+        stats[key] = 0
+    last_sequence.clear()
+    deliveries.clear()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    app.state.error_rate = args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,149 @@
+"""Seed millions of messages and time the chat history lookup.
+
+Usage:
+    python -m benchmarks.history_lookup --database-url postgresql+asyncpg://localhost/scratch
+        [--users 20000] [--messages 2000000] [--lookups 500]
+
+Use a scratch database, its users and messages tables are dropped and recreated.
+The latest page of random users is fetched with the old query, newest first without
+the composite index, and with the history repository on the (user_id, created_at,
+id) index. The keyset pagination is then checked to walk one conversation in order.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+from sqlalchemy import insert, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+
+from src.models.chat_model import Base, Message, User  # noqa: E402
+from src.repositories.history_repository import (  # noqa: E402
+    get_chat_history,
+    get_chat_history_page,
+    get_next_cursor,
+)
+
+BATCH_SIZE = 10000
+HISTORY_INDEX = next(
+    index
+    for index in Message.__table__.indexes
+    if index.name == "ix_messages_user_id_created_at"
+)
+
+
+async def seed(engine, users: int, messages: int) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(HISTORY_INDEX.drop)
+        await conn.execute(
+            insert(User),
+            [
+                {"id": i + 1, "whatsapp_id": f"4479{i:08d}", "channel": "whatsapp"}
+                for i in range(users)
+            ],
+        )
+    # Conversations are interleaved in time like real traffic
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for offset in range(0, messages, BATCH_SIZE):
+        rows = [
+            {
+                "user_id": random.randint(1, users),
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"message {i}",
+                "created_at": start + timedelta(seconds=i),
+            }
+            for i in range(offset, min(offset + BATCH_SIZE, messages))
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(insert(Message), rows)
+        print(f"\rSeeded {offset + len(rows)} messages", end="", flush=True)
+    print()
+
+
+async def time_lookups(engine, lookup, user_ids: list) -> list:
+    latencies = []
+    async with AsyncSession(engine) as db:
+        for user_id in user_ids:
+            start = time.perf_counter()
+            await lookup(db, user_id)
+            latencies.append(time.perf_counter() - start)
+    return sorted(latencies)
+
+
+async def legacy_lookup(db: AsyncSession, user_id: int) -> list:
+    result = await db.execute(
+        select(Message)
+        .filter(Message.user_id == user_id)
+        .order_by(Message.created_at.desc())
+        .limit(15)
+    )
+    return result.scalars().all()
+
+
+async def repository_lookup(db: AsyncSession, user_id: int) -> list:
+    return await get_chat_history(db=db, user_id=user_id, limit=15)
+
+
+def report(name: str, latencies: list) -> None:
+    p50 = statistics.median(latencies) * 1000
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    print(f"{name:<30} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms")
+
+
+async def check_pagination(engine, user_id: int) -> None:
+    async with AsyncSession(engine) as db:
+        result = await db.execute(
+            select(Message.id)
+            .where(Message.user_id == user_id)
+            .order_by(Message.created_at, Message.id)
+        )
+        expected = list(result.scalars().all())
+        walked = []
+        cursor = None
+        while True:
+            page = await get_chat_history_page(
+                db=db, user_id=user_id, limit=7, before=cursor
+            )
+            if not page:
+                break
+            walked = [message.id for message in page] + walked
+            cursor = get_next_cursor(page)
+    assert walked == expected, "keyset pages do not rebuild the conversation"
+    print(f"Pagination walked {len(walked)} messages of user {user_id} in order")
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(args.database_url)
+    await seed(engine, args.users, args.messages)
+    async with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            await conn.execute(text("ANALYZE messages"))
+    user_ids = [random.randint(1, args.users) for _ in range(args.lookups)]
+
+    report("without index, DESC", await time_lookups(engine, legacy_lookup, user_ids))
+    async with engine.begin() as conn:
+        await conn.run_sync(HISTORY_INDEX.create)
+        await conn.execute(text("ANALYZE messages"))
+    report(
+        "with index, repository",
+        await time_lookups(engine, repository_lookup, user_ids),
+    )
+    await check_pagination(engine, user_ids[0])
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--lookups", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,437 @@
+"""End-to-end load test of the service against local stand-ins for OpenAI and Meta.
+
+Usage:
+    python -m benchmarks.load_test [--scenarios chat,stream,whatsapp]
+        [--requests 300] [--concurrency 30] [--model-latency 0.3]
+        [--provider-max-concurrency 10] [--model-max-concurrency 8]
+        [--redis-url redis://localhost:6379/15]
+        [--database-url sqlite+aiosqlite:///load_test_benchmark.db]
+
+Needs a running Redis, use a scratch database and Redis database as both are
+emptied. The OpenAI stub (benchmarks.openai_stub), the Graph API stub
+(benchmarks.graph_api_stub), the API under uvicorn and the arq worker are started
+as separate processes, so nothing is patched and no credits are spent. A
+restaurant is seeded and every request books a table through the scripted agent:
+availability, save and reply, three model calls.
+
+chat and stream post to /agent/chat and /agent/chat/stream. whatsapp posts signed
+webhooks and waits for the replies to reach the Graph API stub, through the Redis
+mailbox, the worker and the sender. Each request carries a tag the OpenAI stub
+times its model calls by, so the latency splits into model time and the service's
+own. --provider-max-concurrency makes the OpenAI stub answer 429s beyond that
+many calls in flight, to check how the service's model limiters hold up under
+provider overload. Logs of the processes and the service's /metrics at the end go to the
+directory printed at the start.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import time as clock
+
+DATABASE_URL_DEFAULT = "sqlite+aiosqlite:///load_test_benchmark.db"
+APP_SECRET = "load-test-secret"
+RESTAURANT = "Load Test Bistro"
+SCENARIOS = ["chat", "stream", "whatsapp"]
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", DATABASE_URL_DEFAULT)
+
+import httpx  # noqa: E402
+from redis.asyncio import Redis  # noqa: E402
+
+from src import config, database  # noqa: E402
+from src.models.chat_model import Base  # noqa: E402
+from src.models.restaurant_model import Restaurant, RestaurantTable  # noqa: E402
+
+# The application logs every request of the load test's own client otherwise
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def percentiles(values: list) -> str:
+    values = sorted(values)
+    if not values:
+        return "no samples"
+    return (
+        f"p50 {statistics.median(values) * 1000:7.1f} ms"
+        f"   p95 {values[int(len(values) * 0.95)] * 1000:7.1f} ms"
+        f"   p99 {values[int(len(values) * 0.99)] * 1000:7.1f} ms"
+    )
+
+
+async def seed_database(tables: int) -> None:
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    db = await database.get_database_session()
+    try:
+        restaurant = Restaurant(
+            name=RESTAURANT,
+            opening_time=clock(11),
+            closing_time=clock(23, 30),
+            booking_minutes=90,
+        )
+        restaurant.tables = [
+            RestaurantTable(label=f"T{table}", capacity=4) for table in range(tables)
+        ]
+        db.add(restaurant)
+        await db.commit()
+    finally:
+        await db.close()
+    await database.async_engine.dispose()
+
+
+def start_processes(args: argparse.Namespace, log_dir: str) -> list:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "stub",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "GRAPH_API_URL": f"http://127.0.0.1:{args.graph_port}",
+        "PHONE_NUMBER_ID": "load-test",
+        "ACCESS_TOKEN": "stub",
+        "APP_SECRET": APP_SECRET,
+        "DATABASE_URL": args.database_url,
+        "REDIS_URL": args.redis_url,
+        "MESSAGE_DEBOUNCE_SECONDS": str(args.debounce),
+        "METRICS_PUSH_SECONDS": "1",
+    }
+    if args.worker_max_jobs is not None:
+        env["WORKER_MAX_JOBS"] = str(args.worker_max_jobs)
+    if args.model_max_concurrency is not None:
+        env["MODEL_MAX_CONCURRENCY"] = str(args.model_max_concurrency)
+    commands = {
+        "openai_stub": [
+            "-m",
+            "benchmarks.openai_stub",
+            "--port",
+            str(args.openai_port),
+            "--latency",
+            str(args.model_latency),
+            "--restaurant",
+            RESTAURANT,
+            "--max-concurrency",
+            str(args.provider_max_concurrency),
+        ],
+        "graph_api_stub": [
+            "-m",
+            "benchmarks.graph_api_stub",
+            "--port",
+            str(args.graph_port),
+            "--latency",
+            str(args.graph_latency),
+        ],
+        "api": [
+            "-m",
+            "uvicorn",
+            "src.main:app",
+            "--port",
+            str(args.api_port),
+            "--log-level",
+            "warning",
+        ],
+        "worker": ["-m", "arq", "worker.WorkerSettings"],
+    }
+    processes = []
+    for name, command in commands.items():
+        log = open(os.path.join(log_dir, f"{name}.log"), "w")
+        processes.append(
+            subprocess.Popen(
+                [sys.executable, *command], env=env, stdout=log, stderr=log
+            )
+        )
+    return processes
+
+
+async def wait_until_up(client: httpx.AsyncClient, url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            response = await client.get(url)
+            if response.status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{url} did not come up in {timeout:.0f}s")
+        await asyncio.sleep(0.2)
+
+
+async def model_stats(client: httpx.AsyncClient, args) -> tuple:
+    """Model seconds per tag and the calls rejected so far by the OpenAI stub"""
+    response = await client.get(f"http://127.0.0.1:{args.openai_port}/stats")
+    stats = response.json()
+    models = {tag: seconds for tag, (_, seconds) in stats["tags"].items()}
+    return models, stats["rejected"]
+
+
+def booking_query(tag: str) -> str:
+    return f"Book a table for 2 tomorrow at 8pm at {RESTAURANT} [{tag}]"
+
+
+async def run_chat(client, args, api_url: str, first: int) -> dict:
+    latencies = {}
+    errors = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def chat(number: int) -> None:
+        nonlocal errors
+        tag = f"lt-{first + number}"
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"{api_url}/agent/chat",
+                    json={"query": booking_query(tag), "userId": tag},
+                )
+            except httpx.HTTPError:
+                errors += 1
+                return
+            if response.status_code != 200:
+                errors += 1
+                return
+            latencies[tag] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(chat(number) for number in range(args.requests)))
+    return {
+        "elapsed": time.perf_counter() - start,
+        "errors": errors,
+        "total": latencies,
+    }
+
+
+async def run_stream(client, args, api_url: str, first: int) -> dict:
+    latencies = {}
+    first_bytes = {}
+    errors = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def stream(number: int) -> None:
+        nonlocal errors
+        tag = f"lt-{first + number}"
+        async with semaphore:
+            start = time.perf_counter()
+            lines = []
+            try:
+                async with client.stream(
+                    "POST",
+                    f"{api_url}/agent/chat/stream",
+                    json={"query": booking_query(tag), "userId": tag},
+                ) as response:
+                    if response.status_code != 200:
+                        errors += 1
+                        return
+                    async for line in response.aiter_lines():
+                        if line and not lines:
+                            first_bytes[tag] = time.perf_counter() - start
+                        lines.append(line)
+            except httpx.HTTPError:
+                # The stream is cut when the agent fails after the response started
+                errors += 1
+                return
+            if not any('"final_answer"' in line for line in lines):
+                errors += 1
+                return
+            latencies[tag] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(stream(number) for number in range(args.requests)))
+    return {
+        "elapsed": time.perf_counter() - start,
+        "errors": errors,
+        "total": latencies,
+        "first event": first_bytes,
+    }
+
+
+def webhook_payload(number: int, tag: str) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "id": "1",
+                "changes": [
+                    {
+                        "field": "messages",
+                        "value": {
+                            "messaging_product": "whatsapp",
+                            "messages": [
+                                {
+                                    "from": f"4479{number:08d}",
+                                    "id": f"wamid.{tag}",
+                                    "timestamp": str(int(time.time())),
+                                    "type": "text",
+                                    "text": {"body": booking_query(tag)},
+                                }
+                            ],
+                        },
+                    }
+                ],
+            }
+        ],
+    }
+
+
+async def run_whatsapp(client, args, api_url: str, first: int) -> dict:
+    acks = {}
+    sent_at = {}
+    errors = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def deliver(number: int) -> None:
+        nonlocal errors
+        tag = f"lt-{first + number}"
+        body = json.dumps(webhook_payload(first + number, tag)).encode()
+        signature = hmac.new(APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        async with semaphore:
+            sent_at[f"4479{first + number:08d}"] = (tag, time.time())
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"{api_url}/whatsapp/webhook",
+                    content=body,
+                    headers={
+                        "Content-Type": "application/json",
+                        "X-Hub-Signature-256": f"sha256={signature}",
+                    },
+                )
+            except httpx.HTTPError:
+                errors += 1
+                return
+            if response.status_code != 200:
+                errors += 1
+                return
+            acks[tag] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(deliver(number) for number in range(args.requests)))
+    # Replies are complete once every acked sender got one, or the timeout passes
+    deadline = time.monotonic() + args.reply_timeout
+    while True:
+        response = await client.get(f"http://127.0.0.1:{args.graph_port}/deliveries")
+        deliveries = response.json()
+        if len(deliveries) >= len(acks) or time.monotonic() > deadline:
+            break
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start
+
+    replies = {}
+    for sender, (tag, sent) in sent_at.items():
+        if sender in deliveries:
+            replies[tag] = deliveries[sender][0] - sent
+    return {
+        "elapsed": elapsed,
+        "errors": errors + len(acks) - len(replies),
+        "total": replies,
+        "webhook ack": acks,
+    }
+
+
+def report(name: str, result: dict, models: dict, rejected: int, args) -> None:
+    total = result["total"]
+    print(
+        f"{name:<9} {len(total)} completed, {result['errors']} failed,"
+        f" {len(total) / result['elapsed']:6.1f} req/s, {rejected} model calls"
+        " rate limited"
+    )
+    print(f"  {'total':<18} {percentiles(list(total.values()))}")
+    for stage, latencies in result.items():
+        if stage not in ("elapsed", "errors", "total"):
+            print(f"  {stage:<18} {percentiles(list(latencies.values()))}")
+    model = [models.get(tag, 0.0) for tag in total]
+    print(f"  {'model':<18} {percentiles(model)}")
+    if name == "whatsapp":
+        # The reply is sent once, through the Graph API stub's fixed latency
+        own = [total[tag] - models.get(tag, 0.0) - args.graph_latency for tag in total]
+        print(f"  {'queue and service':<18} {percentiles(own)}")
+    else:
+        own = [total[tag] - models.get(tag, 0.0) for tag in total]
+        print(f"  {'service':<18} {percentiles(own)}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    await seed_database(args.tables)
+    redis = Redis.from_url(args.redis_url)
+    await redis.flushdb()
+    await redis.aclose()
+
+    log_dir = tempfile.mkdtemp(prefix="load_test_")
+    print(f"Process logs in {log_dir}")
+    processes = start_processes(args, log_dir)
+    api_url = f"http://127.0.0.1:{args.api_port}/api/{config.API_VERSION}"
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    runners = {"chat": run_chat, "stream": run_stream, "whatsapp": run_whatsapp}
+    try:
+        async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+            for url in (
+                f"http://127.0.0.1:{args.openai_port}/stats",
+                f"http://127.0.0.1:{args.graph_port}/stats",
+                f"{api_url}/health",
+            ):
+                await wait_until_up(client, url, timeout=30)
+            # The worker has no endpoint, its startup loads the index like the API's
+            await asyncio.sleep(2)
+            rejected = 0
+            for number, name in enumerate(args.scenarios.split(",")):
+                result = await runners[name](
+                    client, args, api_url, first=number * args.requests
+                )
+                models, total_rejected = await model_stats(client, args)
+                report(name, result, models, total_rejected - rejected, args)
+                rejected = total_rejected
+            response = await client.get(f"http://127.0.0.1:{args.openai_port}/stats")
+            tokens = response.json()
+            print(
+                f"prompt cache: {tokens['cached_tokens']} of {tokens['input_tokens']}"
+                " input tokens cached"
+                f" ({tokens['cached_tokens'] / max(tokens['input_tokens'], 1):.1%})"
+            )
+            # The service's own stage timings, once the worker published its last
+            await asyncio.sleep(1.5)
+            response = await client.get(f"{api_url}/metrics")
+            with open(os.path.join(log_dir, "metrics.txt"), "w") as metrics_file:
+                metrics_file.write(response.text)
+            print(f"Service metrics in {os.path.join(log_dir, 'metrics.txt')}")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                # The arq worker waits for its running jobs on SIGTERM
+                process.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--model-latency", type=float, default=0.3)
+    parser.add_argument("--graph-latency", type=float, default=0.02)
+    parser.add_argument("--debounce", type=float, default=0.0)
+    parser.add_argument("--worker-max-jobs", type=int, default=None)
+    parser.add_argument("--model-max-concurrency", type=int, default=None)
+    parser.add_argument("--provider-max-concurrency", type=int, default=0)
+    parser.add_argument("--tables", type=int, default=200)
+    parser.add_argument("--reply-timeout", type=float, default=120)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--database-url", default=DATABASE_URL_DEFAULT)
+    parser.add_argument("--openai-port", type=int, default=8082)
+    parser.add_argument("--graph-port", type=int, default=8081)
+    parser.add_argument("--api-port", type=int, default=8090)
+    args = parser.parse_args()
+    # Point the application's session factory at the load test database
+    database.async_engine = database.create_async_engine(url=args.database_url)
+    database.AsyncSessionLocal.configure(bind=database.async_engine)
+    asyncio.run(main(args))
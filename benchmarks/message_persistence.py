@@ -0,0 +1,177 @@
+"""Throughput of WhatsApp turn persistence, per strategy.
+
+Usage:
+    python -m benchmarks.message_persistence [--database-url sqlite+aiosqlite:///scratch.db]
+        [--users 500] [--turns 5000] [--concurrency 50]
+
+Use a scratch database, its tables are dropped and recreated. Concurrent turns
+of random users, one at a time per user like in the worker, save their messages
+with each strategy:
+
+    legacy        select the user, insert it with its own commit and refresh on a
+                  miss, then one commit per message
+    transaction   user upsert, then both messages in one transaction
+    cached user   user id from the process cache, upserted on a miss, then both
+                  messages in one transaction
+    write-behind  user upsert, then both messages go to the MessageWriter buffer
+
+The critical path is the time a turn spends on the database before its reply
+can be sent. Write-behind throughput includes the final flush.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+DATABASE_URL_DEFAULT = "sqlite+aiosqlite:///message_persistence_benchmark.db"
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", DATABASE_URL_DEFAULT)
+
+from sqlalchemy import event, func, select  # noqa: E402
+
+from src import database  # noqa: E402
+from src.database import get_database_session  # noqa: E402
+from src.models.chat_model import Base, Message, User  # noqa: E402
+from src.repositories.message_repository import (  # noqa: E402
+    MessageWriter,
+    build_turn_rows,
+    save_turn,
+)
+from src.repositories.user_repository import (  # noqa: E402
+    get_user_id,
+    upsert_user,
+    user_id_cache,
+)
+
+QUERY = "Can I book a table for 4 at 8pm on Friday?"
+RESPONSE = "A table for 4 at 8pm on Friday is available. Under which name?"
+
+
+async def legacy_turn(whatsapp_id: str, writer: MessageWriter) -> None:
+    db = await get_database_session()
+    try:
+        result = await db.execute(select(User).filter(User.whatsapp_id == whatsapp_id))
+        db_user = result.scalars().first()
+        if not db_user:
+            db_user = User(whatsapp_id=whatsapp_id)
+            db.add(db_user)
+            await db.commit()
+            await db.refresh(db_user)
+        db.add(Message(user_id=db_user.id, role="user", content=QUERY))
+        await db.commit()
+        db.add(Message(user_id=db_user.id, role="assistant", content=RESPONSE))
+        await db.commit()
+    finally:
+        await db.close()
+
+
+async def transaction_turn(whatsapp_id: str, writer: MessageWriter) -> None:
+    db = await get_database_session()
+    try:
+        user_id = await upsert_user(db=db, whatsapp_id=whatsapp_id)
+        await save_turn(db=db, user_id=user_id, query=QUERY, response=RESPONSE)
+    finally:
+        await db.close()
+
+
+async def cached_user_turn(whatsapp_id: str, writer: MessageWriter) -> None:
+    db = await get_database_session()
+    try:
+        user_id = await get_user_id(db=db, whatsapp_id=whatsapp_id)
+        await save_turn(db=db, user_id=user_id, query=QUERY, response=RESPONSE)
+    finally:
+        await db.close()
+
+
+async def write_behind_turn(whatsapp_id: str, writer: MessageWriter) -> None:
+    db = await get_database_session()
+    try:
+        user_id = await upsert_user(db=db, whatsapp_id=whatsapp_id)
+    finally:
+        await db.close()
+    writer.add(build_turn_rows(user_id=user_id, query=QUERY, response=RESPONSE))
+
+
+statement_count = 0
+
+
+def count_statement(*args) -> None:
+    global statement_count
+    statement_count += 1
+
+
+async def reset_tables() -> None:
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def run_strategy(name: str, turn, args: argparse.Namespace) -> None:
+    await reset_tables()
+    user_id_cache.user_ids.clear()
+    writer = MessageWriter(batch_size=args.batch_size, flush_seconds=args.flush_seconds)
+    writer.start()
+    whatsapp_ids = [
+        f"4479{random.randint(1, args.users):08d}" for _ in range(args.turns)
+    ]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    # Turns of a user run one at a time, like the worker's per-user lock
+    user_locks = {whatsapp_id: asyncio.Lock() for whatsapp_id in whatsapp_ids}
+    latencies = []
+
+    async def timed_turn(whatsapp_id: str) -> None:
+        async with semaphore, user_locks[whatsapp_id]:
+            start = time.perf_counter()
+            await turn(whatsapp_id, writer)
+            latencies.append(time.perf_counter() - start)
+
+    statements_before = statement_count
+    start = time.perf_counter()
+    await asyncio.gather(*(timed_turn(whatsapp_id) for whatsapp_id in whatsapp_ids))
+    await writer.stop()
+    elapsed = time.perf_counter() - start
+
+    async with database.async_engine.connect() as conn:
+        saved = await conn.scalar(select(func.count()).select_from(Message))
+    assert saved == 2 * args.turns, f"{name} saved {saved} messages"
+    statements = statement_count - statements_before
+    latencies.sort()
+    print(
+        f"{name:<13} {args.turns / elapsed:8.0f} turns/s"
+        f"   {statements / args.turns:4.2f} statements/turn   critical path"
+        f" p50 {statistics.median(latencies) * 1000:7.2f} ms"
+        f"   p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.2f} ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    event.listen(
+        database.async_engine.sync_engine, "before_cursor_execute", count_statement
+    )
+    for name, turn in (
+        ("legacy", legacy_turn),
+        ("transaction", transaction_turn),
+        ("cached user", cached_user_turn),
+        ("write-behind", write_behind_turn),
+    ):
+        await run_strategy(name, turn, args)
+    await database.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--flush-seconds", type=float, default=0.5)
+    args = parser.parse_args()
+    if args.database_url is not None:
+        # Point the application's session factory at the benchmark database
+        database.async_engine = database.create_async_engine(url=args.database_url)
+        database.AsyncSessionLocal.configure(bind=database.async_engine)
+    asyncio.run(main(args))
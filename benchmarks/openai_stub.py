@@ -0,0 +1,416 @@
+"""Local stand-in for the OpenAI Responses and Chat Completions endpoints.
+
+Usage:
+    python -m benchmarks.openai_stub [--port 8082] [--latency 0.3] [--jitter 0.2]
+        [--restaurant "Load Test Bistro"] [--max-concurrency 20] [--retry-after 1]
+
+Point the service at it with OPENAI_BASE_URL=http://127.0.0.1:8082/v1. Every model
+call waits the configured latency, streamed answers spread it over their chunks.
+The booking agent is scripted: it checks the availability, saves the booking and
+replies with the confirmation, so each booking takes three model calls and runs
+the real tools. The guardrail always passes, summaries and refusals are canned.
+
+With --max-concurrency the stub behaves like a provider under overload: calls
+beyond that many in flight get a 429 with a Retry-After header, counted in /stats.
+
+Responses report cached input tokens the way providers cache prompts: the
+request is rendered as its instructions, tools and input, in that order, and the
+leading 128 token blocks seen in a request of the last 10 minutes count as cached
+once at least 1024 tokens are. /stats has the input and cached tokens of every call.
+
+Requests whose messages carry a tag like "[lt-42]" are timed per tag, and GET
+/stats reports the calls and model seconds of every tag so a load test can tell
+the model time of each of its requests from the service's own.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import zlib
+from collections import defaultdict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="OpenAI stub")
+app.state.latency = 0.3
+app.state.jitter = 0.2
+app.state.chunks = 8
+app.state.restaurant = "Load Test Bistro"
+app.state.max_concurrency = 0
+app.state.retry_after = 1.0
+
+TAG = re.compile(r"\[(lt-\d+)\]")
+TIMES = ["12:00", "13:00", "18:00", "19:00", "20:00", "21:00"]
+
+# Prompt caching of the provider, tokens are estimated from the characters
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+CHARACTERS_PER_TOKEN = 4
+
+stats = {
+    "calls": 0,
+    "kinds": defaultdict(int),
+    "tags": {},
+    "rejected": 0,
+    "input_tokens": 0,
+    "cached_tokens": 0,
+}
+in_flight = 0
+
+
+class PromptCache:
+    """Leading blocks of the prompts seen, by the hash of the prefix they end.
+
+    A prefix is forgotten ttl_seconds after it was last used, as providers do.
+    """
+
+    def __init__(self, ttl_seconds: float = 600):
+        self.ttl_seconds = ttl_seconds
+        self.prefixes = {}
+
+    def count(self, body: dict, now: float) -> tuple:
+        """Input tokens of the request and how many of them a provider had cached"""
+        prompt = json.dumps(
+            [
+                body.get("model"),
+                body.get("instructions"),
+                body.get("tools"),
+                body.get("input"),
+            ]
+        )
+        block = CACHE_BLOCK_TOKENS * CHARACTERS_PER_TOKEN
+        digest = hashlib.sha256()
+        cached, hit = 0, True
+        for start in range(0, len(prompt) - block + 1, block):
+            digest.update(prompt[start : start + block].encode())
+            prefix = digest.digest()
+            last_used = self.prefixes.get(prefix)
+            if hit and last_used is not None and now - last_used <= self.ttl_seconds:
+                cached += CACHE_BLOCK_TOKENS
+            else:
+                hit = False
+            self.prefixes[prefix] = now
+        if cached < CACHE_MIN_TOKENS:
+            cached = 0
+        return len(prompt) // CHARACTERS_PER_TOKEN, cached
+
+
+prompt_cache = PromptCache()
+
+
+def model_latency() -> float:
+    return app.state.latency * random.uniform(
+        1 - app.state.jitter, 1 + app.state.jitter
+    )
+
+
+def record(kind: str, tag: str, seconds: float) -> None:
+    stats["calls"] += 1
+    stats["kinds"][kind] += 1
+    if tag is not None:
+        calls, total = stats["tags"].get(tag, (0, 0.0))
+        stats["tags"][tag] = (calls + 1, total + seconds)
+
+
+def rate_limited() -> JSONResponse:
+    stats["rejected"] += 1
+    return JSONResponse(
+        status_code=429,
+        headers={"retry-after": str(app.state.retry_after)},
+        content={
+            "error": {
+                "message": "Rate limit reached, please retry later.",
+                "type": "requests",
+                "param": None,
+                "code": "rate_limit_exceeded",
+            }
+        },
+    )
+
+
+def overloaded() -> bool:
+    return 0 < app.state.max_concurrency <= in_flight
+
+
+async def in_flight_stream(events):
+    """Count a streamed call in flight until its last event"""
+    global in_flight
+    in_flight += 1
+    try:
+        async for event in events:
+            yield event
+    finally:
+        in_flight -= 1
+
+
+async def wait_model_latency() -> None:
+    global in_flight
+    in_flight += 1
+    try:
+        await asyncio.sleep(model_latency())
+    finally:
+        in_flight -= 1
+
+
+def find_tag(body: dict) -> str:
+    tags = TAG.findall(json.dumps(body.get("input") or body.get("messages")))
+    return tags[-1] if tags else None
+
+
+def usage(body: dict) -> dict:
+    input_tokens, cached_tokens = prompt_cache.count(body, now=time.monotonic())
+    stats["input_tokens"] += input_tokens
+    stats["cached_tokens"] += cached_tokens
+    return {
+        "input_tokens": input_tokens,
+        "input_tokens_details": {"cached_tokens": cached_tokens},
+        "output_tokens": 40,
+        "output_tokens_details": {"reasoning_tokens": 0},
+        "total_tokens": input_tokens + 40,
+    }
+
+
+def booking_step(body: dict, tag: str) -> dict:
+    """Next output item of the scripted booking conversation"""
+    names = {}
+    outputs = {}
+    for item in body["input"] if isinstance(body["input"], list) else []:
+        if item.get("type") == "function_call":
+            names[item["call_id"]] = item["name"]
+        elif item.get("type") == "function_call_output":
+            outputs[names.get(item["call_id"])] = item["output"]
+
+    number = zlib.crc32((tag or "lt-0").encode())
+    details = {
+        "restaurant_name": app.state.restaurant,
+        "date": "tomorrow",
+        "number_of_person": 2,
+    }
+    if "fetch_table_availability" not in outputs:
+        name, arguments = "fetch_table_availability", {
+            **details,
+            "time_window": [TIMES[number % len(TIMES)], "23:00"],
+        }
+    elif "save_booking" not in outputs:
+        name, arguments = "save_booking", {
+            **details,
+            "time": TIMES[number % len(TIMES)],
+            "customer_name": f"Customer {tag}",
+            "customer_phone": f"+44 7900 {number % 1000000:06d}",
+        }
+    else:
+        return message_item(outputs["save_booking"])
+    return {
+        "type": "function_call",
+        "id": f"fc_{stats['calls']}",
+        "call_id": f"call_{stats['calls']}",
+        "name": name,
+        "arguments": json.dumps(arguments),
+        "status": "completed",
+    }
+
+
+def message_item(text: str) -> dict:
+    return {
+        "type": "message",
+        "id": f"msg_{stats['calls']}",
+        "role": "assistant",
+        "status": "completed",
+        "content": [{"type": "output_text", "text": text, "annotations": []}],
+    }
+
+
+def response_output(body: dict, tag: str) -> tuple:
+    tools = {tool.get("name") for tool in body.get("tools") or []}
+    text_format = (body.get("text") or {}).get("format") or {}
+    if text_format.get("type") == "json_schema":
+        verdict = {"is_table_booking": True, "reasoning": "Stub", "confidence": 1.0}
+        return "guardrail", message_item(json.dumps(verdict))
+    if "save_booking" in tools:
+        return "agent", booking_step(body, tag)
+    return "response", message_item("Stub answer.")
+
+
+def response(body: dict, output: list, status: str) -> dict:
+    return {
+        "id": f"resp_{stats['calls']}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model", "stub"),
+        "status": status,
+        "output": output,
+        "usage": usage(body) if status == "completed" else None,
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "instructions": None,
+        "metadata": {},
+        "error": None,
+        "incomplete_details": None,
+        "temperature": 1.0,
+        "top_p": 1.0,
+        "text": {"format": {"type": "text"}},
+    }
+
+
+def sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def split_text(text: str, chunks: int) -> list:
+    size = max(1, -(-len(text) // chunks))
+    return [text[start : start + size] for start in range(0, len(text), size)]
+
+
+async def stream_response(body: dict, kind: str, item: dict, tag: str):
+    start = time.perf_counter()
+    latency = model_latency()
+    sequence = 0
+
+    def event(**fields) -> str:
+        nonlocal sequence
+        sequence += 1
+        return sse({**fields, "sequence_number": sequence})
+
+    # Half the latency before the first token, the rest spread over the chunks
+    await asyncio.sleep(latency / 2)
+    yield event(type="response.created", response=response(body, [], "in_progress"))
+    if item["type"] == "message":
+        text = item["content"][0]["text"]
+        pieces = split_text(text, app.state.chunks)
+        yield event(
+            type="response.output_item.added",
+            output_index=0,
+            item={**item, "status": "in_progress", "content": []},
+        )
+        for piece in pieces:
+            await asyncio.sleep(latency / 2 / len(pieces))
+            yield event(
+                type="response.output_text.delta",
+                item_id=item["id"],
+                output_index=0,
+                content_index=0,
+                delta=piece,
+                logprobs=[],
+            )
+    else:
+        await asyncio.sleep(latency / 2)
+        yield event(type="response.output_item.added", output_index=0, item=item)
+    yield event(type="response.output_item.done", output_index=0, item=item)
+    yield event(type="response.completed", response=response(body, [item], "completed"))
+    record(kind, tag, time.perf_counter() - start)
+
+
+@app.post("/v1/responses")
+async def create_response(request: Request):
+    body = await request.json()
+    if overloaded():
+        return rate_limited()
+    tag = find_tag(body)
+    kind, item = response_output(body, tag)
+    if body.get("stream"):
+        return StreamingResponse(
+            in_flight_stream(stream_response(body, kind, item, tag)),
+            media_type="text/event-stream",
+        )
+    start = time.perf_counter()
+    await wait_model_latency()
+    record(kind, tag, time.perf_counter() - start)
+    return response(body, [item], "completed")
+
+
+def completion_chunk(body: dict, delta: dict, finish_reason) -> str:
+    chunk = {
+        "id": f"chatcmpl-{stats['calls']}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+async def stream_completion(body: dict, text: str, tag: str):
+    start = time.perf_counter()
+    latency = model_latency()
+    await asyncio.sleep(latency / 2)
+    pieces = split_text(text, app.state.chunks)
+    for piece in pieces:
+        await asyncio.sleep(latency / 2 / len(pieces))
+        yield completion_chunk(body, {"role": "assistant", "content": piece}, None)
+    yield completion_chunk(body, {}, "stop")
+    yield "data: [DONE]\n\n"
+    record("completion", tag, time.perf_counter() - start)
+
+
+@app.post("/v1/chat/completions")
+async def create_completion(request: Request):
+    body = await request.json()
+    if overloaded():
+        return rate_limited()
+    tag = find_tag(body)
+    text = "Sorry, I can only help with restaurant table bookings."
+    if body.get("stream"):
+        return StreamingResponse(
+            in_flight_stream(stream_completion(body, text, tag)),
+            media_type="text/event-stream",
+        )
+    start = time.perf_counter()
+    await wait_model_latency()
+    record("completion", tag, time.perf_counter() - start)
+    return {
+        "id": f"chatcmpl-{stats['calls']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 400, "completion_tokens": 40, "total_tokens": 440},
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+@app.post("/reset")
+async def reset_stats():
+    stats["calls"] = 0
+    stats["kinds"].clear()
+    stats["tags"].clear()
+    stats["rejected"] = 0
+    stats["input_tokens"] = 0
+    stats["cached_tokens"] = 0
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--restaurant", default="Load Test Bistro")
+    parser.add_argument("--max-concurrency", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    app.state.jitter = args.jitter
+    app.state.chunks = args.chunks
+    app.state.restaurant = args.restaurant
+    app.state.max_concurrency = args.max_concurrency
+    app.state.retry_after = args.retry_after
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
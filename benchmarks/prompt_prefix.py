@@ -0,0 +1,238 @@
+"""Share of the booking agent's input tokens a provider serves from its prompt cache.
+
+Usage:
+    python -m benchmarks.prompt_prefix [--conversations 300] [--hours 2]
+
+Replays multi-turn conversations through the real agent and SDK with the OpenAI
+client replaced by a scripted one, so the requests counted are the ones the SDK
+would send: instructions, converted tool schemas and input items. Conversations
+start over --hours, a customer answers 15 seconds to 4 minutes after the previous
+reply, on a simulated clock. Questions about a table check the availability
+first, so those turns make two model calls.
+
+Each request goes through the OpenAI stub's prompt cache model (128 token blocks,
+1024 tokens at least, prefixes kept 10 minutes) under two prompt layouts:
+
+- time in instructions, the current time at the end of the instructions and the
+  tools in the order the agent lists them, as the agent was built before
+- stable prefix, the date only in the instructions, the tools sorted with
+  canonical schemas and the time in a message after the query
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///prompt_prefix.db")
+
+from agents import OpenAIResponsesModel, RunConfig, Runner  # noqa: E402
+from openai import NOT_GIVEN  # noqa: E402
+from openai.types.responses import Response  # noqa: E402
+
+from benchmarks.openai_stub import PromptCache, message_item, response  # noqa: E402
+from src import config  # noqa: E402
+from src.custom_agents import table_booking_agent as agent_module  # noqa: E402
+from src.schemas.schemas import UserInfo  # noqa: E402
+from src.tools.cancel_booking_tool import CancelBookingTool  # noqa: E402
+from src.tools.join_waitlist_tool import JoinWaitlistTool  # noqa: E402
+from src.tools.leave_waitlist_tool import LeaveWaitlistTool  # noqa: E402
+from src.tools.save_booking_tool import SaveBookingTool  # noqa: E402
+from src.tools.table_availability_tool import FetchTableAvailabilityTool  # noqa: E402
+from src.utils.availability_index import (  # noqa: E402
+    RestaurantInfo,
+    TableInfo,
+    availability_index,
+)
+from src.utils.metrics import timed_tool  # noqa: E402
+from src.utils.prompt_prefix import with_current_time  # noqa: E402
+from src.utils.prompts import (  # noqa: E402
+    CURRENT_DATE_PROMPT,
+    TABLE_BOOKING_AGENT_PROMPT,
+)
+from src.utils.relative_dates import describe_time, describe_today  # noqa: E402
+from src.utils.restaurant_catalog import restaurant_catalog  # noqa: E402
+
+RESTAURANT = "Prompt Prefix Bistro"
+QUESTIONS = [
+    "Hi, what time do you open on Saturday?",
+    "Is there a table for 4 tomorrow evening?",
+    "Do you have vegetarian options?",
+    "Could we get a table for 2 on Friday around 8pm?",
+    "And is there parking nearby?",
+    "What about a table for 6 next week?",
+    "Thanks, can I bring a dog?",
+]
+
+
+class Clock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def local_now(self, timezone: str) -> datetime:
+        return self.now.astimezone(ZoneInfo(timezone))
+
+
+class ScriptedClient:
+    """OpenAI client counting cached tokens, availability first for table questions"""
+
+    def __init__(self, clock: Clock):
+        self.clock = clock
+        self.cache = PromptCache()
+        self.responses = self
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.calls = 0
+
+    async def create(self, **kwargs) -> Response:
+        body = {key: value for key, value in kwargs.items() if value is not NOT_GIVEN}
+        input_tokens, cached_tokens = self.cache.count(
+            body, now=self.clock.now.timestamp()
+        )
+        self.input_tokens += input_tokens
+        self.cached_tokens += cached_tokens
+        self.calls += 1
+        items = body["input"]
+        last_user = max(
+            position
+            for position, item in enumerate(items)
+            if item.get("role") == "user"
+        )
+        query = items[last_user]["content"]
+        called = any(
+            item.get("type") == "function_call_output" for item in items[last_user:]
+        )
+        if "table" in query and not called:
+            item = {
+                "type": "function_call",
+                "id": f"fc_{self.calls}",
+                "call_id": f"call_{self.calls}",
+                "name": "fetch_table_availability",
+                "arguments": json.dumps(
+                    {
+                        "restaurant_name": RESTAURANT,
+                        "date": "tomorrow",
+                        "time_window": ["19:00", "22:00"],
+                        "number_of_person": 2,
+                    }
+                ),
+                "status": "completed",
+            }
+        else:
+            item = message_item(
+                f"Here is what I found about that, answer {self.calls}."
+            )
+        payload = response(body, [item], "in_progress")
+        payload["status"] = "completed"
+        payload["usage"] = {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": cached_tokens},
+            "output_tokens": 20,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + 20,
+        }
+        return Response.model_validate(payload)
+
+
+def make_turns(rng: random.Random, args, start: datetime) -> list:
+    """Every customer message as (time, conversation, turn), in time order"""
+    turns = []
+    for conversation in range(args.conversations):
+        at = start + timedelta(seconds=rng.uniform(0, args.hours * 3600))
+        for turn in range(rng.randint(2, 6)):
+            turns.append((at, conversation, turn))
+            at += timedelta(seconds=rng.uniform(15, 240))
+    heapq.heapify(turns)
+    return [heapq.heappop(turns) for _ in range(len(turns))]
+
+
+async def replay(name: str, agent, stable: bool, turns: list, clock: Clock) -> None:
+    client = ScriptedClient(clock)
+    model = OpenAIResponsesModel(model=config.OPENAI_AGENT_MODEL, openai_client=client)
+    histories = {}
+    for at, conversation, turn in turns:
+        clock.now = at
+        history = histories.setdefault(conversation, [])
+        query = QUESTIONS[(conversation + turn) % len(QUESTIONS)]
+        input = [*history, {"role": "user", "content": query}]
+        context = UserInfo(uid=f"pp-{conversation}")
+        if stable:
+            input = with_current_time(input, clock.local_now(context.timezone))
+        result = await Runner.run(
+            starting_agent=agent,
+            input=input,
+            context=context,
+            run_config=RunConfig(model=model),
+        )
+        history.extend(
+            [
+                {"role": "user", "content": query},
+                {"role": "assistant", "content": result.final_output},
+            ]
+        )
+    print(
+        f"{name:<20} {client.calls} model calls,"
+        f" {client.input_tokens / client.calls:6.0f} input tokens per call,"
+        f" {client.cached_tokens / client.input_tokens:6.1%} cached,"
+        f" {(client.input_tokens - client.cached_tokens) / client.calls:4.0f}"
+        " uncached"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    clock = Clock(datetime(2026, 10, 16, 11, 0, tzinfo=ZoneInfo("UTC")))
+    # The tools' own dates are resolved on the real clock, only the prompt matters
+    agent_module.local_now = clock.local_now
+    availability_index.add_restaurant(
+        RestaurantInfo(
+            id=1,
+            name=RESTAURANT,
+            open_slot=44,
+            close_slot=92,
+            booking_slots=6,
+            tables=tuple(TableInfo(table, f"T{table}", 4) for table in range(1, 11)),
+        )
+    )
+    restaurant_catalog.set_names(1, [RESTAURANT])
+
+    def time_in_instructions(ctx, agent) -> str:
+        now = clock.local_now(ctx.context.timezone)
+        today = describe_today(now, days=config.AGENT_UPCOMING_DAYS)
+        return (
+            f"{TABLE_BOOKING_AGENT_PROMPT}\n"
+            f"{CURRENT_DATE_PROMPT.format(today=f'{today} {describe_time(now)}')}"
+        )
+
+    before = agent_module.table_booking_agent.clone(
+        instructions=time_in_instructions,
+        tools=[
+            timed_tool(tool)
+            for tool in (
+                FetchTableAvailabilityTool,
+                SaveBookingTool,
+                JoinWaitlistTool,
+                LeaveWaitlistTool,
+                CancelBookingTool,
+            )
+        ],
+    )
+    turns = make_turns(rng, args, clock.now)
+    print(f"{args.conversations} conversations, {len(turns)} customer messages")
+    asyncio.run(replay("time in instructions", before, False, turns, clock))
+    asyncio.run(
+        replay("stable prefix", agent_module.table_booking_agent, True, turns, clock)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", type=int, default=300)
+    parser.add_argument("--hours", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
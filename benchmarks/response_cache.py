@@ -0,0 +1,231 @@
+"""Replay a synthetic WhatsApp traffic log through the response cache.
+
+Usage:
+    python -m benchmarks.response_cache [--messages 20000] [--restaurants 3]
+        [--similarity 0.85] [--agent-seconds 1.8]
+
+Messages are drawn from labelled intents, each asked in several phrasings with
+typos, casing and punctuation varied: opening hours, address, parking, vegan
+and vegetarian options, availability for a party and a day, bookings and the
+short replies of a booking flow. Informational questions name their restaurant
+unless there is only one. Bookings are applied to the index, so the
+availability answers of their restaurant are invalidated.
+
+The stub agent answers each message from its intent, restaurant and, for
+availability, party, day and the bookings of the restaurant, and takes a
+lognormal --agent-seconds. A hit is wrong when the cached answer differs from
+the one the agent would give, which a paraphrase of a different intent, like
+vegan and vegetarian, would cause at too low a --similarity.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import time
+from datetime import date
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+from src.utils.availability_index import (  # noqa: E402
+    AvailabilityIndex,
+    RestaurantInfo,
+    TableInfo,
+)
+from src.utils.response_cache import ResponseCache  # noqa: E402
+from src.utils.restaurant_catalog import RestaurantCatalog  # noqa: E402
+
+NAMES = [
+    "Trattoria Roma",
+    "Sakura Sushi",
+    "The Green Fork",
+    "Casa Lola",
+    "Le Petit Bistro",
+]
+DAYS = ["today", "tonight", "tomorrow", "on friday", "on saturday", "this weekend"]
+
+# Phrasings per intent, {name} is the restaurant, {party} and {day} the request
+PHRASINGS = {
+    "hours": [
+        "What are your opening hours?",
+        "what are ur opening hours",
+        "When do you open?",
+        "What time does {name} open?",
+        "what are the opening hours of {name}?",
+        "How late are you open?",
+    ],
+    "address": [
+        "Where are you located?",
+        "What is your address?",
+        "where is {name}?",
+        "Whats the address of {name}",
+    ],
+    "parking": [
+        "Do you have parking?",
+        "is there parking near {name}?",
+        "Is there any parking nearby?",
+    ],
+    "vegan": [
+        "Do you have vegan options?",
+        "any vegan dishes at {name}?",
+        "Is the menu vegan friendly?",
+    ],
+    "vegetarian": [
+        "Do you have vegetarian options?",
+        "any vegetarian dishes at {name}?",
+    ],
+    "availability": [
+        "Is there a table for {party} {day}?",
+        "do you have a table for {party} {day} at {name}?",
+        "Can I get a table for {party} people {day}?",
+    ],
+    "booking": [
+        "Can you book a table for {party} {day} at 8pm?",
+        "please book {name} for {party} people {day}",
+    ],
+    "reply": ["yes", "{party} people", "8pm please", "my name is Alex", "thanks!"],
+}
+INTENT_WEIGHTS = {
+    "hours": 14,
+    "address": 8,
+    "parking": 4,
+    "vegan": 4,
+    "vegetarian": 3,
+    "availability": 22,
+    "booking": 10,
+    "reply": 35,
+}
+TOOLS = {"availability": "fetch_table_availability", "booking": "save_booking"}
+
+
+def vary(rng: random.Random, text: str) -> str:
+    if rng.random() < 0.3:
+        text = text.lower()
+    if rng.random() < 0.2:
+        text = text.rstrip("?")
+    if rng.random() < 0.15:
+        text = text.replace("you", "u").replace("your", "ur")
+    if rng.random() < 0.1:
+        text = f"hi, {text}"
+    return text
+
+
+def build_log(rng: random.Random, messages: int, restaurants: int) -> list:
+    weights = [1 / rank for rank in range(1, restaurants + 1)]
+    log = []
+    for _ in range(messages):
+        intent = rng.choices(list(INTENT_WEIGHTS), list(INTENT_WEIGHTS.values()))[0]
+        restaurant_id = rng.choices(range(1, restaurants + 1), weights)[0]
+        party = rng.choice([2, 2, 2, 3, 4, 4, 6])
+        day = rng.choice(DAYS)
+        phrasings = PHRASINGS[intent]
+        if restaurants > 1 and intent != "reply":
+            phrasings = [text for text in phrasings if "{name}" in text]
+        text = rng.choice(phrasings).format(
+            name=NAMES[restaurant_id - 1], party=party, day=day
+        )
+        log.append((vary(rng, text), intent, restaurant_id, party, day))
+    return log
+
+
+def answer(index: AvailabilityIndex, intent, restaurant_id, party, day) -> str:
+    """What the stub agent replies, the truth cached answers are checked against"""
+    if intent == "availability":
+        version = index.get_restaurant_version(restaurant_id)
+        return f"{intent}:{restaurant_id}:{party}:{day}:{version}"
+    if intent in ("booking", "reply"):
+        return f"{intent}:{restaurant_id}:{party}:{day}"
+    return f"{intent}:{restaurant_id}"
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    index = AvailabilityIndex()
+    catalog = RestaurantCatalog(min_similarity=0.5, margin=0.1)
+    for restaurant_id in range(1, args.restaurants + 1):
+        index.add_restaurant(
+            RestaurantInfo(
+                id=restaurant_id,
+                name=NAMES[restaurant_id - 1],
+                open_slot=48,
+                close_slot=92,
+                booking_slots=6,
+                tables=(TableInfo(restaurant_id, "T1", 4),),
+            )
+        )
+        catalog.set_names(restaurant_id, [NAMES[restaurant_id - 1]])
+    cache = ResponseCache(
+        index=index,
+        catalog=catalog,
+        max_size=10000,
+        ttl_seconds=600,
+        similarity=args.similarity,
+        min_words=3,
+    )
+    today = date.today()
+    log = build_log(rng, args.messages, args.restaurants)
+
+    uncached_seconds = 0.0
+    cached_seconds = 0.0
+    lookup_latencies = []
+    wrong = []
+    cacheable = 0
+    for text, intent, restaurant_id, party, day in log:
+        cost = rng.lognormvariate(math.log(args.agent_seconds), 0.4)
+        truth = answer(index, intent, restaurant_id, party, day)
+        uncached_seconds += cost
+        start = time.perf_counter()
+        query = cache.prepare(text, today)
+        entry = cache.lookup(query) if query is not None else None
+        lookup_latencies.append(time.perf_counter() - start)
+        cacheable += query is not None
+        if entry is not None:
+            if entry.response != truth:
+                wrong.append((text, entry.response, truth))
+            continue
+        cached_seconds += cost
+        tool_calls = []
+        if intent in TOOLS:
+            arguments = json.dumps({"restaurant_name": NAMES[restaurant_id - 1]})
+            tool_calls.append((TOOLS[intent], arguments))
+        if intent == "booking":
+            index.add_booking(restaurant_id, restaurant_id, today, 80, 86)
+        if query is not None:
+            cache.store(query, truth, tool_calls, cost)
+
+    stats = cache.get_stats()
+    lookups = stats["hits"] + stats["misses"]
+    print(
+        f"{len(log)} messages to {args.restaurants} restaurants,"
+        f" {cacheable / len(log):.1%} cacheable standalone questions"
+    )
+    print(
+        f"cache: {stats['hits']} hits of {lookups} lookups ({stats['hit_rate']:.1%}),"
+        f" {stats['hits'] / len(log):.1%} of all messages, {stats['stale']} entries"
+        f" invalidated, {stats['size']} cached"
+    )
+    print(
+        f"agent time {uncached_seconds:.0f}s -> {cached_seconds:.0f}s,"
+        f" {stats['saved_ms'] / 1000:.0f}s saved,"
+        f" {(uncached_seconds - cached_seconds) / len(log) * 1000:.0f} ms per message"
+    )
+    latencies = sorted(lookup_latencies)
+    print(
+        f"prepare and lookup p50 {statistics.median(latencies) * 1e6:.1f} us"
+        f"   p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us"
+    )
+    print(f"{len(wrong)} wrong hits")
+    for text, cached, truth in wrong[:10]:
+        print(f"  {text!r}: cached {cached}, expected {truth}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--restaurants", type=int, default=3)
+    parser.add_argument("--similarity", type=float, default=0.85)
+    parser.add_argument("--agent-seconds", type=float, default=1.8)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,299 @@
+"""Time and check restaurant name resolution on a catalog of many restaurants.
+
+Usage:
+    python -m benchmarks.restaurant_catalog [--restaurants 100000] [--queries 20000]
+        [--similarity 0.5] [--margin 0.1]
+
+Restaurant names are made of a cuisine or place word, a name and sometimes a
+second word, like "Trattoria Roma" or "The Golden Dragon Garden", with accents
+on some of them. One in five restaurants has an alias, its name without the
+kind of place or a nickname.
+
+Queries are written the way customers and the model write them: the exact name
+or alias, a different case or no accents, the start of the name, one or two
+typos, a missing or swapped word, skipping those that spell another restaurant's
+name. A query resolves correctly to the restaurant it was made from, is
+ambiguous when that restaurant is among the candidates returned instead, missed
+when it is not, or wrong. The few common words make the catalog denser than a
+real one, so fuzzy queries read long posting lists. The catalog is then updated
+for 1000 restaurants, as an incremental refresh would, and looked up again.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+from src.utils.restaurant_catalog import (  # noqa: E402
+    RestaurantCatalog,
+    normalize_name,
+)
+
+KINDS = [
+    "Trattoria",
+    "Osteria",
+    "Bistro",
+    "Café",
+    "Brasserie",
+    "Taverna",
+    "Cantina",
+    "Sushi",
+    "Ramen",
+    "Pizzeria",
+    "Grill",
+    "Kitchen",
+    "Bar",
+    "Diner",
+    "Steakhouse",
+    "Bodega",
+]
+WORDS = [
+    "Roma",
+    "Milano",
+    "Sakura",
+    "Golden",
+    "Dragon",
+    "Lola",
+    "Verde",
+    "Olive",
+    "Fig",
+    "Saffron",
+    "Harbor",
+    "Lantern",
+    "Crown",
+    "Maple",
+    "Copper",
+    "Juniper",
+    "Amalfi",
+    "Kyoto",
+    "Lisboa",
+    "Médina",
+    "Señor",
+    "Pepe",
+    "Luna",
+    "Sol",
+    "Fuego",
+    "Rosa",
+    "Bella",
+    "Vista",
+    "Garden",
+    "Market",
+    "Corner",
+    "House",
+    "Island",
+    "Coast",
+    "River",
+    "Stone",
+    "Oak",
+    "Pine",
+    "Cedar",
+    "Willow",
+    "Ember",
+    "Smoke",
+    "Salt",
+    "Pepper",
+    "Basil",
+    "Thyme",
+    "Clove",
+    "Honey",
+    "Almond",
+    "Walnut",
+]
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def made_up_word(rng: random.Random) -> str:
+    consonants, vowels = "bcdfgklmnprstvz", "aeiou"
+    return "".join(
+        rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(2, 4))
+    ).capitalize()
+
+
+def build_names(rng: random.Random, restaurants: int) -> dict:
+    """Name and aliases of every restaurant, names unique"""
+    names = {}
+    seen = set()
+    while len(names) < restaurants:
+        words = [rng.choice(KINDS), rng.choice(WORDS + [made_up_word(rng)])]
+        if rng.random() < 0.6:
+            words.append(made_up_word(rng))
+        if rng.random() < 0.3:
+            words.append(rng.choice(WORDS))
+        if rng.random() < 0.1:
+            words.insert(0, "The")
+        name = " ".join(words)
+        if normalize_name(name) in seen:
+            continue
+        seen.add(normalize_name(name))
+        aliases = []
+        if rng.random() < 0.2:
+            alias = (
+                " ".join(words[1:])
+                if rng.random() < 0.5 and len(words) > 2
+                else made_up_word(rng) + " " + made_up_word(rng)
+            )
+            if normalize_name(alias) not in seen:
+                seen.add(normalize_name(alias))
+                aliases.append(alias)
+        names[len(names) + 1] = [name, *aliases]
+    return names
+
+
+def typo(rng: random.Random, text: str) -> str:
+    position = rng.randrange(len(text))
+    kind = rng.random()
+    if kind < 0.3:
+        return text[:position] + text[position + 1 :]
+    if kind < 0.6:
+        return text[:position] + rng.choice(LETTERS) + text[position + 1 :]
+    if kind < 0.8:
+        return text[:position] + rng.choice(LETTERS) + text[position:]
+    if position + 1 < len(text):
+        return (
+            text[:position] + text[position + 1] + text[position] + text[position + 2 :]
+        )
+    return text
+
+
+def strip_accents(text: str) -> str:
+    return text.translate(str.maketrans("éñÉ", "enE"))
+
+
+def make_query(rng: random.Random, names: list) -> tuple:
+    name = rng.choice(names)
+    words = name.split()
+    kind = rng.choice(
+        ["exact", "case", "prefix", "typo", "typos", "missing word", "word order"]
+    )
+    if kind == "exact":
+        return kind, name
+    if kind == "case":
+        return kind, strip_accents(name).upper() if rng.random() < 0.5 else name.lower()
+    if kind == "prefix":
+        return kind, name[: max(len(words[0]) + 3, len(name) * 2 // 3)]
+    if kind == "typo":
+        return kind, typo(rng, name)
+    if kind == "typos":
+        return kind, typo(rng, typo(rng, name))
+    if kind == "missing word" and len(words) > 2:
+        words.pop(rng.randrange(1, len(words)))
+        return kind, " ".join(words)
+    if len(words) > 1:
+        first, second = rng.sample(range(len(words)), 2)
+        words[first], words[second] = words[second], words[first]
+        return "word order", " ".join(words)
+    return "exact", name
+
+
+def percentile(latencies: list, share: float) -> float:
+    return sorted(latencies)[int(len(latencies) * share)] * 1e6
+
+
+def build(args: argparse.Namespace, names: dict) -> RestaurantCatalog:
+    catalog = RestaurantCatalog(min_similarity=args.similarity, margin=args.margin)
+    for restaurant_id, restaurant_names in names.items():
+        catalog.set_names(restaurant_id, restaurant_names)
+    catalog.resolve("warm up")
+    return catalog
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    names = build_names(rng, args.restaurants)
+
+    start = time.perf_counter()
+    catalog = build(args, names)
+    built = time.perf_counter() - start
+    tracemalloc.start()
+    traced = build(args, names)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+    aliases = sum(len(restaurant_names) - 1 for restaurant_names in names.values())
+    print(
+        f"{len(catalog)} restaurants, {aliases} aliases: built in {built:.2f}s,"
+        f" {memory / 2**20:.0f} MiB"
+    )
+
+    def run(label: str) -> None:
+        results = {}
+        for _ in range(args.queries):
+            restaurant_id = rng.randrange(1, args.restaurants + 1)
+            kind, query = make_query(rng, names[restaurant_id])
+            # A missing word can make the name of another restaurant
+            while restaurant_id not in catalog.exact.get(
+                normalize_name(query), {restaurant_id}
+            ):
+                kind, query = make_query(rng, names[restaurant_id])
+            start = time.perf_counter()
+            resolution = catalog.resolve(query)
+            latency = time.perf_counter() - start
+            if resolution.restaurant_id == restaurant_id:
+                outcome = "correct"
+            elif resolution.restaurant_id is None:
+                # Ambiguity is only a good answer when the restaurant is offered
+                offered = any(
+                    match.restaurant_id == restaurant_id
+                    for match in resolution.candidates
+                )
+                outcome = "ambiguous" if offered else "missed"
+            else:
+                outcome = "wrong"
+            latencies, outcomes = results.setdefault(kind, ([], {}))
+            latencies.append(latency)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        print(label)
+        print(
+            f"  {'query':<13}{'p50 us':>9}{'p99 us':>9}"
+            f"{'correct':>10}{'ambiguous':>11}{'missed':>9}{'wrong':>8}"
+        )
+        every = []
+        for kind, (latencies, outcomes) in sorted(results.items()):
+            every.extend(latencies)
+            shares = [
+                outcomes.get(outcome, 0) / len(latencies)
+                for outcome in ("correct", "ambiguous", "missed", "wrong")
+            ]
+            print(
+                f"  {kind:<13}{statistics.median(latencies) * 1e6:9.1f}"
+                f"{percentile(latencies, 0.99):9.1f}"
+                + "".join(
+                    f"{share:{width}.1%}"
+                    for share, width in zip(shares, (10, 11, 9, 8))
+                )
+            )
+        print(
+            f"  {'all':<13}{statistics.median(every) * 1e6:9.1f}"
+            f"{percentile(every, 0.99):9.1f}"
+        )
+
+    run(f"{args.queries} queries")
+
+    updated = rng.sample(list(names), 1000)
+    start = time.perf_counter()
+    for restaurant_id in updated:
+        names[restaurant_id] = [
+            *names[restaurant_id][:1],
+            made_up_word(rng) + " " + made_up_word(rng),
+        ]
+        catalog.set_names(restaurant_id, names[restaurant_id])
+    catalog.resolve("warm up")
+    print(
+        f"1000 restaurants given a new alias in"
+        f" {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+    run(f"{args.queries} queries after the update")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--restaurants", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--similarity", type=float, default=0.5)
+    parser.add_argument("--margin", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
@@ -0,0 +1,113 @@
+"""Check that other requests keep being served while a refusal streams.
+
+Usage:
+    python -m benchmarks.stream_concurrency [--chunks 20] [--delay 0.05] [--blocking]
+
+An out-of-scope query is streamed from /chat/stream in the generate refusal mode
+against a stub model client that yields one chunk per delay, while /health is
+polled concurrently. With
+--blocking the stub sleeps synchronously like the previous sync client did, to
+show the event loop stall for comparison. The app runs against a scratch SQLite
+database and, as its lifespan does not run, without a Redis pool.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+DATABASE_PATH = os.path.join(tempfile.gettempdir(), "stream_concurrency_benchmark.db")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{DATABASE_PATH}")
+
+import httpx  # noqa: E402
+
+from src import config  # noqa: E402
+from src.database import async_engine  # noqa: E402
+from src.main import app  # noqa: E402
+from src.models.chat_model import Base  # noqa: E402
+from src.queue import get_redis_pool  # noqa: E402
+from src.utils import openai_client  # noqa: E402
+
+
+class StubCompletions:
+    def __init__(self, chunks: int, delay: float, blocking: bool):
+        self.chunks = chunks
+        self.delay = delay
+        self.blocking = blocking
+
+    async def create(self, **kwargs):
+        async def stream():
+            for i in range(self.chunks):
+                if self.blocking:
+                    time.sleep(self.delay)
+                else:
+                    await asyncio.sleep(self.delay)
+                yield SimpleNamespace(
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content=f"{i} "))]
+                )
+
+        return stream()
+
+
+async def no_redis_pool() -> None:
+    return None
+
+
+async def main(chunks: int, delay: float, blocking: bool) -> None:
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    app.dependency_overrides[get_redis_pool] = no_redis_pool
+    config.GUARDRAIL_BACKEND = "local"
+    config.REFUSAL_MODE = "generate"
+    openai_client.async_client = SimpleNamespace(
+        chat=SimpleNamespace(completions=StubCompletions(chunks, delay, blocking))
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+
+        async def stream_refusal() -> float:
+            start = time.perf_counter()
+            response = await client.post(
+                f"/api/{config.API_VERSION}/agent/chat/stream",
+                json={"query": "What's the weather in Paris?", "userId": "bench"},
+            )
+            lines = response.text.splitlines()
+            assert len([line for line in lines if line]) == chunks, lines
+            return time.perf_counter() - start
+
+        async def poll_health() -> list:
+            latencies = []
+            deadline = time.perf_counter() + chunks * delay
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await client.get(f"/api/{config.API_VERSION}/health")
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(delay / 2)
+            return latencies
+
+        stream_time, health_latencies = await asyncio.gather(
+            stream_refusal(), poll_health()
+        )
+    await async_engine.dispose()
+    os.remove(DATABASE_PATH)
+
+    health_latencies.sort()
+    print(f"Refusal stream duration:  {stream_time * 1000:.1f} ms")
+    print(f"Health requests served:   {len(health_latencies)}")
+    print(
+        f"Health latency p50:       {health_latencies[len(health_latencies) // 2] * 1000:.1f} ms"
+    )
+    print(f"Health latency max:       {health_latencies[-1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--blocking", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(chunks=args.chunks, delay=args.delay, blocking=args.blocking))
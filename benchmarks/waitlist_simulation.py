@@ -0,0 +1,328 @@
+"""Simulate large waitlists with frequent cancellations and time the queue operations.
+
+Usage:
+    python -m benchmarks.waitlist_simulation [--redis-url redis://localhost:6379/15]
+        [--database-url sqlite+aiosqlite:///scratch.db] [--entries 50000]
+        [--cancellations 1000]
+
+Needs a running Redis, use a scratch database and Redis database as both are
+emptied. Every table of the restaurants is booked for the whole day, then entries
+join the waitlists, most of them for dinner so those queues grow to hundreds. Then
+bookings are cancelled at random, each followed by the waitlist promotion the arq
+job runs, while other customers leave the waitlists. Checked at the end: no table
+is booked twice, promoted entries left their queue, and no entry that joined
+earlier for the same slot with a party as small is still waiting.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from datetime import time as clock
+
+DATABASE_URL_DEFAULT = "sqlite+aiosqlite:///waitlist_simulation_benchmark.db"
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("DATABASE_URL", DATABASE_URL_DEFAULT)
+
+from arq import create_pool  # noqa: E402
+from arq.connections import RedisSettings  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+
+from src import database  # noqa: E402
+from src.database import get_database_session  # noqa: E402
+from src.models.chat_model import Base  # noqa: E402
+from src.models.restaurant_model import (  # noqa: E402
+    Booking,
+    Restaurant,
+    RestaurantTable,
+)
+from src.repositories.booking_repository import (  # noqa: E402
+    booking_idempotency_key,
+    cancel_booking,
+)
+from src.repositories.restaurant_repository import load_restaurants  # noqa: E402
+from src.repositories.waitlist_repository import (  # noqa: E402
+    WaitlistEntry,
+    get_waitlist_position,
+    join_waitlist,
+    leave_waitlist,
+    promote_waitlist,
+    waitlist_key,
+)
+from src.utils.availability_index import (  # noqa: E402
+    AvailabilityIndex,
+    slot_start_time,
+    time_to_slot,
+)
+
+OPENING_TIME = clock(11)
+CLOSING_TIME = clock(23)
+BOOKING_MINUTES = 90
+CAPACITIES = [2, 2, 2, 4, 4, 6]
+PARTY_SIZES = [2] * 6 + [1, 3, 4, 4, 5, 6]
+DINNER_SLOTS = range(time_to_slot(clock(19)), time_to_slot(clock(20)) + 1)
+POSITION_LOOKUPS = 2000
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return (
+        f"p50 {statistics.median(latencies) * 1e6:7.1f} us"
+        f"   p99 {latencies[int(len(latencies) * 0.99)] * 1e6:7.1f} us"
+    )
+
+
+async def fill_restaurants(args, booking_date) -> AvailabilityIndex:
+    """Restaurants with every table booked back to back for the whole day"""
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    db = await get_database_session()
+    try:
+        for number in range(1, args.restaurants + 1):
+            restaurant = Restaurant(
+                name=f"Restaurant {number}",
+                opening_time=OPENING_TIME,
+                closing_time=CLOSING_TIME,
+                booking_minutes=BOOKING_MINUTES,
+            )
+            restaurant.tables = [
+                RestaurantTable(label=f"T{table}", capacity=random.choice(CAPACITIES))
+                for table in range(args.tables)
+            ]
+            db.add(restaurant)
+        await db.commit()
+        index = AvailabilityIndex()
+        await load_restaurants(db=db, index=index)
+        rows = []
+        for restaurant in index.restaurants.values():
+            for table in restaurant.tables:
+                for start_slot in range(
+                    restaurant.open_slot,
+                    restaurant.close_slot - restaurant.booking_slots + 1,
+                    restaurant.booking_slots,
+                ):
+                    rows.append(
+                        {
+                            "restaurant_id": restaurant.id,
+                            "table_id": table.id,
+                            "date": booking_date,
+                            "start_time": slot_start_time(start_slot),
+                            "end_time": slot_start_time(
+                                start_slot + restaurant.booking_slots
+                            ),
+                            "party_size": table.capacity,
+                            "customer_name": "Regular",
+                            "customer_phone": f"+44 7000 {len(rows):06d}",
+                        }
+                    )
+        await db.execute(insert(Booking), rows)
+        await db.commit()
+        return index
+    finally:
+        await db.close()
+
+
+async def join_entries(args, redis_pool, index, booking_date):
+    """Queue the entries, most of them for dinner, returns the entries by queue key"""
+    queues = {}
+    latencies = []
+    restaurant_ids = list(index.restaurants)
+    semaphore = asyncio.Semaphore(100)
+
+    async def join(number: int) -> None:
+        restaurant = index.restaurants[random.choice(restaurant_ids)]
+        if random.random() < 0.8:
+            slot = random.choice(DINNER_SLOTS)
+        else:
+            slot = random.randint(
+                restaurant.open_slot, restaurant.close_slot - restaurant.booking_slots
+            )
+        party_size = random.choice(PARTY_SIZES)
+        uid = f"4479{number:08d}"
+        entry = WaitlistEntry(
+            entry_id=booking_idempotency_key(
+                uid=uid,
+                restaurant_id=restaurant.id,
+                booking_date=booking_date,
+                start_slot=slot,
+                party_size=party_size,
+                customer_name=f"Customer {number}",
+                customer_phone=uid,
+            ),
+            uid=uid,
+            party_size=party_size,
+            customer_name=f"Customer {number}",
+            customer_phone=uid,
+        )
+        async with semaphore:
+            start = time.perf_counter()
+            await join_waitlist(redis_pool, restaurant.id, booking_date, slot, entry)
+            latencies.append(time.perf_counter() - start)
+        queues.setdefault(waitlist_key(restaurant.id, booking_date, slot), []).append(
+            entry
+        )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(join(number) for number in range(args.entries)))
+    elapsed = time.perf_counter() - start
+    sizes = sorted(len(entries) for entries in queues.values())
+    print(
+        f"joined      {args.entries} entries in {len(queues)} queues"
+        f" (largest {sizes[-1]}, median {statistics.median(sizes):.0f}),"
+        f" {args.entries / elapsed:6.0f} joins/s   {percentiles(latencies)}"
+    )
+    return queues
+
+
+async def time_positions(redis_pool, queues) -> None:
+    by_size = sorted(queues.items(), key=lambda item: len(item[1]))
+    for label, (key, entries) in (("smallest", by_size[0]), ("largest", by_size[-1])):
+        latencies = []
+        for _ in range(POSITION_LOOKUPS):
+            entry = random.choice(entries)
+            start = time.perf_counter()
+            await get_waitlist_position(redis_pool, key, entry.entry_id)
+            latencies.append(time.perf_counter() - start)
+        print(
+            f"position    {label} queue ({len(entries)} entries)"
+            f"   {percentiles(latencies)}"
+        )
+
+
+async def cancel_and_promote(args, redis_pool, index, booking_date, queues):
+    db = await get_database_session()
+    try:
+        result = await db.execute(
+            select(Booking.id, Booking.customer_phone, Booking.restaurant_id)
+        )
+        bookings = random.sample(result.all(), args.cancellations)
+        waiting = [(key, entry) for key, entries in queues.items() for entry in entries]
+        promoted = []
+        left = 0
+        latencies = []
+        start = time.perf_counter()
+        for booking_id, customer_phone, restaurant_id in bookings:
+            cancel_start = time.perf_counter()
+            booking = await cancel_booking(
+                db=db, booking_id=booking_id, customer_phone=customer_phone
+            )
+            start_slot = time_to_slot(booking.start_time)
+            promoted += await promote_waitlist(
+                db=db,
+                redis_pool=redis_pool,
+                restaurant=index.restaurants[restaurant_id],
+                booking_date=booking_date,
+                start_slot=start_slot,
+                end_slot=time_to_slot(booking.end_time, end_of_day=True),
+                scan=args.scan,
+            )
+            latencies.append(time.perf_counter() - cancel_start)
+            for _ in range(args.leaves_per_cancellation):
+                key, entry = random.choice(waiting)
+                left += await leave_waitlist(redis_pool, key, entry.entry_id)
+        elapsed = time.perf_counter() - start
+    finally:
+        await db.close()
+    print(
+        f"cancelled   {args.cancellations} bookings, {len(promoted)} entries promoted,"
+        f" {left} left the waitlist, {args.cancellations / elapsed:6.0f}"
+        f" cancellations/s with promotion   {percentiles(latencies)}"
+    )
+    return promoted
+
+
+async def check(redis_pool, promoted) -> None:
+    db = await get_database_session()
+    try:
+        result = await db.execute(
+            select(Booking.table_id, Booking.date, Booking.start_time, Booking.end_time)
+            .where(Booking.cancelled_at.is_(None))
+            .order_by(Booking.table_id, Booking.date, Booking.start_time)
+        )
+        rows = result.all()
+    finally:
+        await db.close()
+    for previous, row in zip(rows, rows[1:]):
+        assert (
+            previous.table_id != row.table_id
+            or previous.date != row.date
+            or previous.end_time <= row.start_time
+        ), f"table {row.table_id} is booked twice at {row.start_time}"
+
+    for entry, booking in promoted:
+        key = waitlist_key(
+            booking.restaurant_id, booking.date, time_to_slot(booking.start_time)
+        )
+        assert await redis_pool.zscore(key, entry.entry_id) is None
+    print(f"checked     no overbooking, {len(promoted)} promoted entries dequeued")
+
+
+async def snapshot_sequences(redis_pool, queues):
+    """Joining sequence of every entry, before the promotions dequeue them"""
+    sequences = {}
+    for key in queues:
+        for member, sequence in await redis_pool.zrange(key, 0, -1, withscores=True):
+            sequences[member.decode()] = sequence
+    return sequences
+
+
+async def check_order(redis_pool, queues, promoted, sequences) -> None:
+    """No entry of a promoted one's queue that joined before it with a party as small waits.
+
+    That entry was tried first in the same promotion, had it found no table the
+    promoted party would not have either.
+    """
+    parties = {
+        entry.entry_id: entry.party_size
+        for entries in queues.values()
+        for entry in entries
+    }
+    for entry, booking in promoted:
+        key = waitlist_key(
+            booking.restaurant_id, booking.date, time_to_slot(booking.start_time)
+        )
+        for member, sequence in await redis_pool.zrange(key, 0, -1, withscores=True):
+            assert not (
+                sequence < sequences[entry.entry_id]
+                and parties[member.decode()] <= entry.party_size
+            ), f"{member.decode()} joined before {entry.entry_id} and still waits"
+    print("checked     promotions followed the joining order")
+
+
+async def main(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+    booking_date = date.today() + timedelta(days=1)
+    redis_pool = await create_pool(RedisSettings.from_dsn(args.redis_url))
+    await redis_pool.flushdb()
+    index = await fill_restaurants(args, booking_date)
+    queues = await join_entries(args, redis_pool, index, booking_date)
+    await time_positions(redis_pool, queues)
+    sequences = await snapshot_sequences(redis_pool, queues)
+    promoted = await cancel_and_promote(args, redis_pool, index, booking_date, queues)
+    await check(redis_pool, promoted)
+    await check_order(redis_pool, queues, promoted, sequences)
+    await redis_pool.aclose()
+    await database.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--restaurants", type=int, default=10)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--cancellations", type=int, default=1000)
+    parser.add_argument("--leaves-per-cancellation", type=int, default=5)
+    parser.add_argument("--scan", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    if args.database_url is not None:
+        # Point the application's session factory at the benchmark database
+        database.async_engine = database.create_async_engine(url=args.database_url)
+        database.AsyncSessionLocal.configure(bind=database.async_engine)
+    asyncio.run(main(args))
@@ -0,0 +1,133 @@
+"""Compare outbound WhatsApp throughput before and after the pooled sender.
+
+Usage:
+    python -m benchmarks.whatsapp_send [--messages 2000] [--recipients 200]
+        [--concurrency 100] [--latency 0.02] [--error-rate 0.0]
+
+Starts the Graph API stub in a subprocess, then sends the same messages with a
+new httpx client per message (the previous behaviour) and with WhatsAppSender,
+and reports messages/sec, retries absorbed and per-recipient ordering.
+"""
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+import httpx
+
+from src import config
+from src.utils.whatsapp_sender import WhatsAppSender, create_graph_api_client
+
+
+async def wait_for_stub(base_url: str) -> None:
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"{base_url}/stats")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("Graph API stub did not start")
+
+
+async def send_per_request_client(phone_number: str, message: str) -> None:
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            f"{config.GRAPH_API_URL}/{config.PHONE_NUMBER_ID}/messages",
+            json={
+                "messaging_product": "whatsapp",
+                "to": phone_number,
+                "type": "text",
+                "text": {"body": message},
+            },
+            headers={"Authorization": f"Bearer {config.ACCESS_TOKEN}"},
+        )
+        response.raise_for_status()
+
+
+async def run(name: str, send, messages: list, concurrency: int) -> None:
+    async with httpx.AsyncClient() as client:
+        await client.post(f"{config.GRAPH_API_URL}/reset")
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def send_one(phone_number: str, message: str) -> None:
+        nonlocal failures
+        async with semaphore:
+            try:
+                await send(phone_number, message)
+            except Exception:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(send_one(phone_number, message) for phone_number, message in messages)
+    )
+    elapsed = time.perf_counter() - start
+    async with httpx.AsyncClient() as client:
+        stats = (await client.get(f"{config.GRAPH_API_URL}/stats")).json()
+    print(
+        f"{name:<22} {len(messages) / elapsed:>8.1f} msg/s  failures={failures} "
+        f"rejected={stats['rejected']} out_of_order={stats['out_of_order']}"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    config.GRAPH_API_URL = f"http://127.0.0.1:{args.port}"
+    config.PHONE_NUMBER_ID = "stub"
+    stub = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.graph_api_stub",
+            f"--port={args.port}",
+            f"--latency={args.latency}",
+            f"--error-rate={args.error_rate}",
+        ]
+    )
+    try:
+        await wait_for_stub(config.GRAPH_API_URL)
+        messages = [
+            (f"4479{i % args.recipients:08d}", f"{i // args.recipients}:hello")
+            for i in range(args.messages)
+        ]
+        await run(
+            "per-request client", send_per_request_client, messages, args.concurrency
+        )
+
+        sender = WhatsAppSender(
+            client=create_graph_api_client(),
+            messages_per_second=args.rate,
+            max_retries=config.WHATSAPP_SEND_MAX_RETRIES,
+        )
+        try:
+            await run(
+                "pooled sender",
+                lambda phone_number, message: sender.send_text(phone_number, message),
+                messages,
+                args.concurrency,
+            )
+        finally:
+            await sender.aclose()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--recipients", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1000,
+        help="Sender rate limit in messages/sec, the highest Graph API tier by default",
+    )
+    parser.add_argument("--port", type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
@@ -1,10 +1,18 @@
+import os
 import sys
 import logging
 
 logging_str = "[%(asctime)s]: %(levelname)s -> %(module)s -> %(message)s"
 
+# Messages, prompts and tool arguments are logged at DEBUG only, INFO keeps them and
+# their formatting off the request path
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
 logging.basicConfig(
-    level=logging.INFO, format=logging_str, handlers=[logging.StreamHandler(sys.stdout)]
+    level=LOG_LEVEL, format=logging_str, handlers=[logging.StreamHandler(sys.stdout)]
 )
+# httpx logs every model call and WhatsApp send at INFO
+if LOG_LEVEL != "DEBUG":
+    logging.getLogger("httpx").setLevel(logging.WARNING)
 
 logger = logging.getLogger("Table-Booking-Agent")
@@ -2,8 +2,7 @@ import os
 
 from dotenv import load_dotenv, find_dotenv
 from agents import set_tracing_disabled
-from redis import Redis
-from arq.connections import create_pool
+from arq.connections import RedisSettings
 
 set_tracing_disabled(disabled=True)
 
@@ -21,13 +20,164 @@ API_VERSION = "v0"
 
 OPENAI_AGENT_MODEL = "gpt-4.1-mini"
 OPENAI_GUARDRAIL_MODEL = "gpt-4.1-mini"
+OPENAI_SUMMARY_MODEL = "gpt-4.1-mini"
 
 ERROR_MESSAGE = "We are facing an issue, please try after sometimes."
 
-CHAT_HISTORY_LIMIT = 15
+# Model calls per process, at most this many in flight per model. A call waits for a
+# slot and is retried on rate limits and server errors until its deadline, each
+# attempt timing out on its own. The guardrail agent sends a second identical call
+# when the first is slower than the hedge delay and a slot is free, 0 disables it.
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "32"))
+MODEL_CALL_TIMEOUT_SECONDS = float(os.getenv("MODEL_CALL_TIMEOUT_SECONDS", "30"))
+MODEL_CALL_DEADLINE_SECONDS = float(os.getenv("MODEL_CALL_DEADLINE_SECONDS", "60"))
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+MODEL_RETRY_BACKOFF_SECONDS = float(os.getenv("MODEL_RETRY_BACKOFF_SECONDS", "0.5"))
+GUARDRAIL_HEDGE_AFTER_SECONDS = float(os.getenv("GUARDRAIL_HEDGE_AFTER_SECONDS", "0"))
 
-redis_conn = Redis(host="localhost", port=6379, db=0)
+# Upper bound on the stored messages read per turn, the token budget decides what is sent
+CHAT_HISTORY_LIMIT = 50
 
+# Conversation memory, the agent input (summary, history and query) is trimmed to this
+# many tokens and older turns are folded into a rolling summary after the reply is sent.
+# A refresh folds turns until the unsummarized history fits in the keep budget, so the
+# summary is refreshed once every few turns rather than on every turn.
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "700"))
+CONVERSATION_SUMMARY_KEEP_TOKENS = int(
+    os.getenv("CONVERSATION_SUMMARY_KEEP_TOKENS", "250")
+)
+CONVERSATION_SUMMARY_MAX_TOKENS = 150
 
-async def get_redis_pool():
-    return await create_pool()
+# WhatsApp turns are saved before the reply is sent, with write-behind the reply is sent
+# first and the messages of many turns are saved together in one batched insert
+MESSAGE_WRITE_BEHIND = os.getenv("MESSAGE_WRITE_BEHIND", "false").lower() == "true"
+MESSAGE_WRITE_BATCH_SIZE = int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", "200"))
+MESSAGE_WRITE_FLUSH_SECONDS = float(os.getenv("MESSAGE_WRITE_FLUSH_SECONDS", "0.5"))
+
+# User ids by WhatsApp number or session, cached per process and, when enabled, in Redis
+# so they are shared by the arq workers
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "100000"))
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "86400"))
+USER_CACHE_REDIS = os.getenv("USER_CACHE_REDIS", "true").lower() == "true"
+
+# Table availability index, refreshed with the bookings saved by other processes. When
+# the requested window is full, the closest free times of that day and the next ones
+# are offered.
+AVAILABILITY_REFRESH_SECONDS = float(os.getenv("AVAILABILITY_REFRESH_SECONDS", "5"))
+AVAILABILITY_ALTERNATIVE_DAYS = 1
+AVAILABILITY_ALTERNATIVES_LIMIT = 3
+# Availability lookups cached per process, a booking applied to a restaurant and date
+# invalidates its entries
+AVAILABILITY_CACHE_SIZE = int(os.getenv("AVAILABILITY_CACHE_SIZE", "10000"))
+AVAILABILITY_CACHE_TTL_SECONDS = float(
+    os.getenv("AVAILABILITY_CACHE_TTL_SECONDS", "300")
+)
+
+# Timezone of the restaurants, the agent is told the current date and time there and
+# resolves relative dates like "tomorrow" or "this Friday" from it
+RESTAURANT_TIMEZONE = os.getenv("RESTAURANT_TIMEZONE", "UTC")
+AGENT_UPCOMING_DAYS = 7
+
+# Agent responses to standalone questions about one restaurant, like its opening hours,
+# reused for near-identical questions asked the same day. Turns that changed a booking
+# or a waitlist are never cached, a change of the restaurant or, when the answer
+# checked the availability, of its bookings invalidates its entries.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.85"))
+RESPONSE_CACHE_MIN_WORDS = 3
+
+# Restaurant names the tools are given are resolved to the catalog's names and aliases,
+# exactly, by the start of a name or by trigram similarity (0 to 1) when no other
+# restaurant comes within the margin, otherwise the closest ones are suggested
+RESTAURANT_MATCH_SIMILARITY = float(os.getenv("RESTAURANT_MATCH_SIMILARITY", "0.5"))
+RESTAURANT_MATCH_MARGIN = float(os.getenv("RESTAURANT_MATCH_MARGIN", "0.1"))
+
+# Waitlist queues per restaurant, date and time, kept in Redis. When a booking is
+# cancelled the first entries of each queue it makes room for are tried, oldest first.
+WAITLIST_PROMOTION_SCAN = 20
+
+# Sessions of the agent API kept in memory, least recently used ones are evicted
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+
+GRAPH_API_VERSION = "v22.0"
+GRAPH_API_URL = os.getenv(
+    "GRAPH_API_URL", f"https://graph.facebook.com/{GRAPH_API_VERSION}"
+)
+
+# Outbound WhatsApp sends, the default rate matches the Graph API base throughput tier
+WHATSAPP_MESSAGES_PER_SECOND = float(os.getenv("WHATSAPP_MESSAGES_PER_SECOND", "80"))
+WHATSAPP_SEND_MAX_RETRIES = int(os.getenv("WHATSAPP_SEND_MAX_RETRIES", "3"))
+WHATSAPP_MAX_CONNECTIONS = int(os.getenv("WHATSAPP_MAX_CONNECTIONS", "20"))
+WHATSAPP_SEND_TIMEOUT_SECONDS = float(os.getenv("WHATSAPP_SEND_TIMEOUT_SECONDS", "10"))
+
+# Framing of the /chat/stream events, "ndjson" (one JSON object per line) or "sse"
+STREAM_TRANSPORT = os.getenv("STREAM_TRANSPORT", "ndjson")
+if STREAM_TRANSPORT not in ("ndjson", "sse"):
+    raise ValueError(
+        f"STREAM_TRANSPORT must be 'ndjson' or 'sse', got {STREAM_TRANSPORT!r}"
+    )
+
+# Guardrail execution mode per entry point, "serial" runs the guardrail before the
+# agent, "speculative" starts both together and holds the agent output until it passes.
+GUARDRAIL_MODE_CHAT = os.getenv("GUARDRAIL_MODE_CHAT", "serial")
+GUARDRAIL_MODE_CHAT_STREAM = os.getenv("GUARDRAIL_MODE_CHAT_STREAM", "serial")
+GUARDRAIL_MODE_WHATSAPP = os.getenv("GUARDRAIL_MODE_WHATSAPP", "serial")
+for name, mode in (
+    ("GUARDRAIL_MODE_CHAT", GUARDRAIL_MODE_CHAT),
+    ("GUARDRAIL_MODE_CHAT_STREAM", GUARDRAIL_MODE_CHAT_STREAM),
+    ("GUARDRAIL_MODE_WHATSAPP", GUARDRAIL_MODE_WHATSAPP),
+):
+    if mode not in ("serial", "speculative"):
+        raise ValueError(f"{name} must be 'serial' or 'speculative', got {mode!r}")
+
+# Guardrail backend, "local" uses the rule classifier and escalates to the LLM below
+# the confidence threshold, "llm" sends every message to the guardrail agent.
+GUARDRAIL_BACKEND = os.getenv("GUARDRAIL_BACKEND", "local")
+if GUARDRAIL_BACKEND not in ("local", "llm"):
+    raise ValueError(
+        f"GUARDRAIL_BACKEND must be 'local' or 'llm', got {GUARDRAIL_BACKEND!r}"
+    )
+GUARDRAIL_CONFIDENCE_THRESHOLD = float(
+    os.getenv("GUARDRAIL_CONFIDENCE_THRESHOLD", "0.8")
+)
+
+# Refusal for out-of-scope messages, "static" picks a template without a model call,
+# "cached" serves a pool of generated refusals refreshed in the background and
+# "generate" asks the model for a refusal to every query.
+REFUSAL_MODE = os.getenv("REFUSAL_MODE", "static")
+if REFUSAL_MODE not in ("static", "cached", "generate"):
+    raise ValueError(
+        f"REFUSAL_MODE must be 'static', 'cached' or 'generate', got {REFUSAL_MODE!r}"
+    )
+REFUSAL_LANGUAGE = os.getenv("REFUSAL_LANGUAGE", "en")
+REFUSAL_POOL_SIZE = int(os.getenv("REFUSAL_POOL_SIZE", "10"))
+REFUSAL_POOL_REFRESH_SECONDS = int(os.getenv("REFUSAL_POOL_REFRESH_SECONDS", "3600"))
+
+# Worker metrics are saved to Redis this often and exported by the API's /metrics
+METRICS_PUSH_SECONDS = float(os.getenv("METRICS_PUSH_SECONDS", "10"))
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_SETTINGS = RedisSettings.from_dsn(REDIS_URL)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "100"))
+
+# arq worker, at most one job per WhatsApp user runs at a time whatever max_jobs is
+WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", "10"))
+WORKER_JOB_TIMEOUT_SECONDS = int(os.getenv("WORKER_JOB_TIMEOUT_SECONDS", "300"))
+
+# Messages from one user arriving within the debounce window are merged into one turn
+MESSAGE_DEBOUNCE_SECONDS = float(os.getenv("MESSAGE_DEBOUNCE_SECONDS", "2"))
+MESSAGE_DEBOUNCE_MAX_SECONDS = float(os.getenv("MESSAGE_DEBOUNCE_MAX_SECONDS", "10"))
+MAILBOX_TTL_SECONDS = 24 * 60 * 60
+
+# Meta retries undelivered webhooks for up to 7 days, message ids are remembered as long
+WEBHOOK_DEDUPE_TTL_SECONDS = int(
+    os.getenv("WEBHOOK_DEDUPE_TTL_SECONDS", str(7 * 24 * 60 * 60))
+)
+
+# The webhook acks Meta within this budget, messages Redis could not take in time are
+# spooled in memory and queued in the background
+WEBHOOK_ACK_BUDGET_SECONDS = float(os.getenv("WEBHOOK_ACK_BUDGET_SECONDS", "0.5"))
+WEBHOOK_SPOOL_MAX_SIZE = int(os.getenv("WEBHOOK_SPOOL_MAX_SIZE", "10000"))
+WEBHOOK_SPOOL_SHUTDOWN_SECONDS = 10
@@ -0,0 +1,223 @@
+import asyncio
+import dataclasses
+import time
+from typing import Any, AsyncIterator, List, NamedTuple, Tuple, Union
+
+from agents import (
+    Agent,
+    FunctionTool,
+    RunConfig,
+    RunContextWrapper,
+    RunHooks,
+    Runner,
+    TResponseInputItem,
+)
+from agents.stream_events import StreamEvent
+
+from src import logging
+from src.custom_agents.guard_rail_agent import (
+    check_table_booking,
+    create_table_booking_guardrail,
+)
+from src.custom_agents.table_booking_agent import table_booking_agent
+from src.utils.metrics import record_usage
+from src.utils.prompt_prefix import with_current_time
+from src.utils.relative_dates import local_now
+from src.schemas.schemas import TableBookingOutput, UserInfo
+
+logger = logging.getLogger(__name__)
+
+GUARDRAIL_MODE_SERIAL = "serial"
+GUARDRAIL_MODE_SPECULATIVE = "speculative"
+
+
+class AgentReply(NamedTuple):
+    output: str
+    # Name and JSON arguments of every tool the agent called, in order
+    tool_calls: List[Tuple[str, str]]
+
+
+class GuardrailTripped(Exception):
+    """Raised when the guardrail rejects the user input"""
+
+    def __init__(self, output: TableBookingOutput):
+        super().__init__(output.reasoning)
+        self.output = output
+
+
+async def _wait_for_verdict(verdict: asyncio.Future) -> None:
+    final_output = await asyncio.shield(verdict)
+    if not final_output.is_table_booking:
+        raise GuardrailTripped(final_output)
+
+
+class GuardrailGateHooks(RunHooks[UserInfo]):
+    """Hold back the final output of a speculative run until the guardrail passes"""
+
+    def __init__(self, verdict: asyncio.Future):
+        self.verdict = verdict
+
+    async def on_agent_end(
+        self, context: RunContextWrapper[UserInfo], agent: Agent[UserInfo], output: Any
+    ) -> None:
+        await _wait_for_verdict(self.verdict)
+
+
+def _gate_tool(tool: FunctionTool, verdict: asyncio.Future) -> FunctionTool:
+    """Delay a tool call until the guardrail passes so no booking is made speculatively"""
+
+    async def on_invoke_tool(ctx: RunContextWrapper[Any], args: str) -> Any:
+        await _wait_for_verdict(verdict)
+        return await tool.on_invoke_tool(ctx, args)
+
+    return dataclasses.replace(tool, on_invoke_tool=on_invoke_tool)
+
+
+def _start_speculative_run(
+    input: Union[str, List[TResponseInputItem]], context: UserInfo
+) -> tuple:
+    verdict = asyncio.get_running_loop().create_future()
+    input = with_current_time(input, local_now(context.timezone))
+    agent = table_booking_agent.clone(
+        tools=[
+            _gate_tool(tool, verdict) if isinstance(tool, FunctionTool) else tool
+            for tool in table_booking_agent.tools
+        ]
+    )
+    result = Runner.run_streamed(
+        starting_agent=agent,
+        input=input,
+        context=context,
+        hooks=GuardrailGateHooks(verdict),
+        run_config=RunConfig(
+            input_guardrails=[create_table_booking_guardrail(verdict=verdict)]
+        ),
+    )
+    return result, verdict
+
+
+def _raise_if_tripped(verdict: asyncio.Future) -> None:
+    """Raise once the guardrail tripped, or failed, so output is only released on a pass"""
+    if verdict.done():
+        # Raises the guardrail's own error when it failed
+        final_output = verdict.result()
+        if not final_output.is_table_booking:
+            raise GuardrailTripped(final_output)
+
+
+async def stream_table_booking_agent(
+    input: Union[str, List[TResponseInputItem]],
+    context: UserInfo,
+    mode: str = GUARDRAIL_MODE_SERIAL,
+) -> AsyncIterator[StreamEvent]:
+    """Stream the table booking agent events behind the guardrail.
+
+    In speculative mode the guardrail and the agent start together, events are
+    buffered until the guardrail passes and the run is cancelled if it trips or
+    fails. Raises GuardrailTripped when the input is out of scope.
+    """
+    start = time.perf_counter()
+    if mode == GUARDRAIL_MODE_SPECULATIVE:
+        result, verdict = _start_speculative_run(input=input, context=context)
+        buffered_events = []
+        try:
+            async for event in result.stream_events():
+                if not verdict.done():
+                    buffered_events.append(event)
+                    continue
+                _raise_if_tripped(verdict)
+                for buffered_event in buffered_events:
+                    yield buffered_event
+                buffered_events.clear()
+                yield event
+            await _wait_for_verdict(verdict)
+        except GuardrailTripped:
+            raise
+        except Exception:
+            _raise_if_tripped(verdict)
+            raise
+        finally:
+            # Stops the run when the guardrail tripped or the client went away
+            result.cancel()
+            # A cancelled speculative run still paid for the calls it made
+            record_usage("booking", result.context_wrapper.usage)
+        for buffered_event in buffered_events:
+            yield buffered_event
+    else:
+        final_output = await check_table_booking(input=input)
+        if not final_output.is_table_booking:
+            raise GuardrailTripped(final_output)
+        result = Runner.run_streamed(
+            starting_agent=table_booking_agent,
+            input=with_current_time(input, local_now(context.timezone)),
+            context=context,
+        )
+        try:
+            async for event in result.stream_events():
+                yield event
+        finally:
+            record_usage("booking", result.context_wrapper.usage)
+    logger.info(
+        f"Agent turn finished in {time.perf_counter() - start:.3f}s ({mode} guardrail)"
+    )
+
+
+async def run_table_booking_agent(
+    input: Union[str, List[TResponseInputItem]],
+    context: UserInfo,
+    mode: str = GUARDRAIL_MODE_SERIAL,
+) -> str:
+    """Run the table booking agent behind the guardrail and return its final output.
+
+    Raises GuardrailTripped when the input is out of scope.
+    """
+    reply = await run_table_booking_turn(input=input, context=context, mode=mode)
+    return reply.output
+
+
+async def run_table_booking_turn(
+    input: Union[str, List[TResponseInputItem]],
+    context: UserInfo,
+    mode: str = GUARDRAIL_MODE_SERIAL,
+) -> AgentReply:
+    """Run the table booking agent behind the guardrail, with the tools it called.
+
+    Raises GuardrailTripped when the input is out of scope.
+    """
+    start = time.perf_counter()
+    if mode == GUARDRAIL_MODE_SPECULATIVE:
+        # The streamed runner is used so a tripped guardrail cancels the agent run
+        result, verdict = _start_speculative_run(input=input, context=context)
+        try:
+            async for _ in result.stream_events():
+                _raise_if_tripped(verdict)
+            await _wait_for_verdict(verdict)
+        except GuardrailTripped:
+            raise
+        except Exception:
+            _raise_if_tripped(verdict)
+            raise
+        finally:
+            result.cancel()
+            record_usage("booking", result.context_wrapper.usage)
+    else:
+        final_output = await check_table_booking(input=input)
+        if not final_output.is_table_booking:
+            raise GuardrailTripped(final_output)
+        result = await Runner.run(
+            starting_agent=table_booking_agent,
+            input=with_current_time(input, local_now(context.timezone)),
+            context=context,
+        )
+        record_usage("booking", result.context_wrapper.usage)
+    logger.info(
+        f"Agent turn finished in {time.perf_counter() - start:.3f}s ({mode} guardrail)"
+    )
+    return AgentReply(
+        output=result.final_output,
+        tool_calls=[
+            (item.raw_item.name, item.raw_item.arguments)
+            for item in result.new_items
+            if item.type == "tool_call_item"
+        ],
+    )
@@ -1,17 +1,83 @@
-from agents import Agent, OpenAIResponsesModel
-from openai import AsyncOpenAI
+import asyncio
+from typing import Any, List, Optional, Union
+
+from agents import (
+    Agent,
+    GuardrailFunctionOutput,
+    InputGuardrail,
+    RunContextWrapper,
+    Runner,
+    TResponseInputItem,
+)
 
 from src import config
+from src import logging
 from src.schemas.schemas import TableBookingOutput
+from src.utils.guardrail_classifier import classify_table_booking
+from src.utils.metrics import record_usage, timed
+from src.utils.openai_client import create_agent_model
 from src.utils.prompts import GAURDRAIL_PROMPT
 
+logger = logging.getLogger(__name__)
+
 
 guardrail_agent = Agent(
     name="Gaurdrail Check",
     instructions=GAURDRAIL_PROMPT,
     output_type=TableBookingOutput,
-    model=OpenAIResponsesModel(
+    model=create_agent_model(
         model=config.OPENAI_GUARDRAIL_MODEL,
-        openai_client=AsyncOpenAI(api_key=config.OPENAI_API_KEY),
+        agent="guardrail",
+        hedge_after_seconds=config.GUARDRAIL_HEDGE_AFTER_SECONDS or None,
     ),
 )
+
+
+async def check_table_booking(
+    input: Union[str, List[TResponseInputItem]],
+) -> TableBookingOutput:
+    """Check the input with the configured guardrail backend and return its verdict"""
+    with timed("guardrail"):
+        if config.GUARDRAIL_BACKEND == "local":
+            final_output = classify_table_booking(input=input)
+            if final_output.confidence >= config.GUARDRAIL_CONFIDENCE_THRESHOLD:
+                return final_output
+            logger.debug(
+                "Escalating to the guardrail agent, confidence "
+                f"{final_output.confidence:.2f}"
+            )
+        input_checks = await Runner.run(starting_agent=guardrail_agent, input=input)
+        record_usage("guardrail", input_checks.context_wrapper.usage)
+        return input_checks.final_output_as(TableBookingOutput)
+
+
+def create_table_booking_guardrail(
+    verdict: Optional[asyncio.Future] = None,
+) -> InputGuardrail[Any]:
+    """Create an input guardrail for the table booking agent.
+
+    When a verdict future is given, it is resolved with the guardrail output so the
+    caller can release buffered agent output as soon as the check passes.
+    """
+
+    async def table_booking_guardrail(
+        ctx: RunContextWrapper[Any],
+        agent: Agent[Any],
+        input: Union[str, List[TResponseInputItem]],
+    ) -> GuardrailFunctionOutput:
+        try:
+            final_output = await check_table_booking(input=input)
+        except Exception as e:
+            if verdict is not None and not verdict.done():
+                verdict.set_exception(e)
+            raise
+        if verdict is not None and not verdict.done():
+            verdict.set_result(final_output)
+        return GuardrailFunctionOutput(
+            output_info=final_output,
+            tripwire_triggered=not final_output.is_table_booking,
+        )
+
+    return InputGuardrail(
+        guardrail_function=table_booking_guardrail, name="table_booking_guardrail"
+    )
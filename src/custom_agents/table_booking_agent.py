@@ -1,26 +1,48 @@
-from agents import Agent, OpenAIResponsesModel
-from openai import AsyncOpenAI
+from agents import Agent, RunContextWrapper
 
 from src import config
-from src.tools.current_date_tool import fetch_current_date_time
+from src.tools.cancel_booking_tool import CancelBookingTool
 from src.tools.join_waitlist_tool import JoinWaitlistTool
+from src.tools.leave_waitlist_tool import LeaveWaitlistTool
 from src.tools.save_booking_tool import SaveBookingTool
 from src.tools.table_availability_tool import FetchTableAvailabilityTool
-from src.utils.prompts import TABLE_BOOKING_AGENT_PROMPT
+from src.utils.metrics import timed_tool
+from src.utils.openai_client import create_agent_model
+from src.utils.prompt_prefix import stable_tools
+from src.utils.prompts import CURRENT_DATE_PROMPT, TABLE_BOOKING_AGENT_PROMPT
+from src.utils.relative_dates import describe_today, local_now
 from src.schemas.schemas import UserInfo
 
 
+def table_booking_instructions(
+    ctx: RunContextWrapper[UserInfo], agent: Agent[UserInfo]
+) -> str:
+    """The prompt with the current date at the restaurant.
+
+    The date comes after the fixed prompt and changes once a day, so the model does
+    not spend a turn asking a tool for it. The time is added after the input by
+    the runner, here it would change the prompt prefix every minute.
+    """
+    today = describe_today(
+        local_now(ctx.context.timezone), days=config.AGENT_UPCOMING_DAYS
+    )
+    return f"{TABLE_BOOKING_AGENT_PROMPT}\n{CURRENT_DATE_PROMPT.format(today=today)}"
+
+
 table_booking_agent = Agent[UserInfo](
     name="Table Booking Agent",
     tools=[
-        fetch_current_date_time,
-        FetchTableAvailabilityTool,
-        SaveBookingTool,
-        JoinWaitlistTool,
+        timed_tool(tool)
+        for tool in stable_tools(
+            (
+                FetchTableAvailabilityTool,
+                SaveBookingTool,
+                JoinWaitlistTool,
+                LeaveWaitlistTool,
+                CancelBookingTool,
+            )
+        )
     ],
-    model=OpenAIResponsesModel(
-        model=config.OPENAI_AGENT_MODEL,
-        openai_client=AsyncOpenAI(api_key=config.OPENAI_API_KEY),
-    ),
-    instructions=TABLE_BOOKING_AGENT_PROMPT,
+    model=create_agent_model(model=config.OPENAI_AGENT_MODEL, agent="booking"),
+    instructions=table_booking_instructions,
 )
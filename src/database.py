@@ -1,4 +1,5 @@
 from typing import AsyncGenerator
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
@@ -19,21 +20,31 @@ AsyncSessionLocal = sessionmaker(
 
 
 async def get_database() -> AsyncGenerator[AsyncSession, None]:
-    logger.info("Creating a new database session...")
+    logger.debug("Creating a new database session...")
     try:
         async with AsyncSessionLocal() as async_session:
             yield async_session
-            logger.info("Database session closed...")
+            logger.debug("Database session closed...")
     except Exception as e:
         logger.error(f"Unable to create database session: {str(e)}")
         raise
 
 
 async def get_database_session() -> AsyncSession:
-    logger.info("Creating a new database session...")
+    logger.debug("Creating a new database session...")
     try:
         session = AsyncSessionLocal()
         return session
     except Exception as e:
         logger.error(f"Unable to create database session: {str(e)}")
         raise
+
+
+def get_insert(db: AsyncSession):
+    """Dialect insert of the session, which supports ON CONFLICT clauses.
+
+    Postgres in production, SQLite for local benchmarks.
+    """
+    if db.bind.dialect.name == "sqlite":
+        return sqlite.insert
+    return postgresql.insert
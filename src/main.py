@@ -1,15 +1,47 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from src.routes import health_route
+from src.routes import metrics_route
 from src.routes import agent_route
 from src.routes import whatsapp_route
 from src import config
+from src.queue import InboundSpool, create_redis_pool
+from src.repositories.restaurant_repository import (
+    AvailabilityRefresher,
+    load_availability_index,
+)
+from src.utils.availability_index import availability_index
+from src.utils.restaurant_catalog import restaurant_catalog
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.redis_pool = await create_redis_pool()
+    app.state.inbound_spool = InboundSpool(
+        redis_pool=app.state.redis_pool, max_size=config.WEBHOOK_SPOOL_MAX_SIZE
+    )
+    app.state.inbound_spool.start()
+    await load_availability_index(availability_index, catalog=restaurant_catalog)
+    app.state.availability_refresher = AvailabilityRefresher(
+        index=availability_index,
+        interval_seconds=config.AVAILABILITY_REFRESH_SECONDS,
+        catalog=restaurant_catalog,
+    )
+    app.state.availability_refresher.start()
+    yield
+    app.state.availability_refresher.stop()
+    await app.state.inbound_spool.stop(timeout=config.WEBHOOK_SPOOL_SHUTDOWN_SECONDS)
+    await app.state.redis_pool.aclose()
+
 
 app = FastAPI(
     title="Table Booking Agent",
     description="AI agent to handle reservation at businesses.",
     version=config.API_VERSION,
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -21,5 +53,6 @@ app.add_middleware(
 )
 
 app.include_router(health_route.router)
+app.include_router(metrics_route.router)
 app.include_router(agent_route.router)
 app.include_router(whatsapp_route.router)
@@ -8,6 +8,7 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     Enum,
+    Index,
 )
 from sqlalchemy.sql import func
 from sqlalchemy.orm import DeclarativeBase, relationship
@@ -36,6 +37,11 @@ class User(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Serves the latest messages of a user, id breaks ties between messages
+        # saved in the same transaction
+        Index("ix_messages_user_id_created_at", "user_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -44,3 +50,18 @@ class Message(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="messages")
+
+
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # "whatsapp:<whatsapp id>" or "api:<user id>"
+    conversation_id = Column(String(128), unique=True, nullable=False)
+    content = Column(Text, nullable=False)
+    # Position of the last message folded into the summary, a message id for
+    # WhatsApp and an index in the client supplied history for the API
+    summarized_until = Column(Integer, nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
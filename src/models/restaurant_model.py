@@ -0,0 +1,97 @@
+from sqlalchemy import (
+    Column,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Time,
+    UniqueConstraint,
+)
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+
+from src.models.chat_model import Base
+
+
+class Restaurant(Base):
+    __tablename__ = "restaurants"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(128), unique=True, nullable=False)
+    opening_time = Column(Time, nullable=False)
+    # 00:00 means the restaurant closes at midnight
+    closing_time = Column(Time, nullable=False)
+    booking_minutes = Column(Integer, nullable=False, default=90)
+    # Bumped by every booking, the update locks the row so the bookings of a
+    # restaurant are made one at a time
+    booking_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Set by changes to the restaurant or its aliases, not by bookings, so the
+    # processes reload only the restaurants changed since their last refresh
+    updated_at = Column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False, index=True
+    )
+
+    tables = relationship(
+        "RestaurantTable", back_populates="restaurant", cascade="all, delete-orphan"
+    )
+    aliases = relationship(
+        "RestaurantAlias", back_populates="restaurant", cascade="all, delete-orphan"
+    )
+
+
+class RestaurantAlias(Base):
+    """Another name customers know a restaurant by, like "Roma" for "Trattoria Roma" """
+
+    __tablename__ = "restaurant_aliases"
+    __table_args__ = (
+        UniqueConstraint("restaurant_id", "alias", name="uq_restaurant_aliases_alias"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    restaurant_id = Column(
+        Integer, ForeignKey("restaurants.id"), nullable=False, index=True
+    )
+    alias = Column(String(128), nullable=False)
+
+    restaurant = relationship("Restaurant", back_populates="aliases")
+
+
+class RestaurantTable(Base):
+    __tablename__ = "restaurant_tables"
+
+    id = Column(Integer, primary_key=True, index=True)
+    restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=False)
+    label = Column(String(56), nullable=False)
+    capacity = Column(Integer, nullable=False)
+
+    restaurant = relationship("Restaurant", back_populates="tables")
+
+
+class Booking(Base):
+    __tablename__ = "bookings"
+    __table_args__ = (
+        # Serves the availability index, which loads bookings by restaurant and date
+        Index("ix_bookings_restaurant_id_date", "restaurant_id", "date"),
+        UniqueConstraint("idempotency_key", name="uq_bookings_idempotency_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=False)
+    table_id = Column(Integer, ForeignKey("restaurant_tables.id"), nullable=False)
+    date = Column(Date, nullable=False)
+    start_time = Column(Time, nullable=False)
+    # 00:00 means the booking ends at midnight
+    end_time = Column(Time, nullable=False)
+    party_size = Column(Integer, nullable=False)
+    customer_name = Column(String(128), nullable=False)
+    customer_phone = Column(String(32), nullable=False)
+    # Hash of the customer and the booking asked for, a retried tool call gets the
+    # booking already made
+    idempotency_key = Column(String(64), nullable=True)
+    # Cancelled bookings are kept, their idempotency key is cleared so the same
+    # booking can be made again
+    cancelled_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    # The refresher also reads recent bookings by creation time, see load_bookings
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from arq import ArqRedis, create_pool
+from arq.constants import job_key_prefix
+from arq.jobs import serialize_job
+from arq.utils import timestamp_ms
+from fastapi import Request
+
+from src import config
+from src import logging
+from src.schemas.schemas import InboundMessage
+
+logger = logging.getLogger(__name__)
+
+MAILBOX_KEY_PREFIX = "whatsapp:mailbox:"
+MAILBOX_LOCK_KEY_PREFIX = "whatsapp:mailbox-lock:"
+SEEN_MESSAGE_KEY_PREFIX = "whatsapp:seen:"
+JOB_ID_PREFIX = "whatsapp:"
+
+# Marks the message as seen and, only if it was not seen before, appends it to the
+# sender's mailbox and enqueues its arq job the same way ArqRedis.enqueue_job does.
+ENQUEUE_INBOUND_MESSAGE_SCRIPT = """
+if not redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+redis.call('RPUSH', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('SET', KEYS[3], ARGV[4], 'PX', ARGV[5], 'NX')
+redis.call('ZADD', KEYS[4], ARGV[6], ARGV[7])
+return 1
+"""
+
+
+async def create_redis_pool() -> ArqRedis:
+    """Create the ArqRedis pool shared by every request of the application"""
+    redis_pool = await create_pool(config.REDIS_SETTINGS)
+    redis_pool.connection_pool.max_connections = config.REDIS_MAX_CONNECTIONS
+    logger.info("Redis pool created...")
+    return redis_pool
+
+
+async def get_redis_pool(request: Request) -> ArqRedis:
+    return request.app.state.redis_pool
+
+
+async def get_inbound_spool(request: Request) -> "InboundSpool":
+    return request.app.state.inbound_spool
+
+
+def get_redis_pool_stats(redis_pool: ArqRedis) -> Dict[str, Any]:
+    connection_pool = redis_pool.connection_pool
+    in_use = len(connection_pool._in_use_connections)
+    available = len(connection_pool._available_connections)
+    return {
+        "in_use": in_use,
+        "available": available,
+        "max_connections": connection_pool.max_connections,
+        "saturation": in_use / connection_pool.max_connections,
+    }
+
+
+async def enqueue_inbound_messages(
+    redis_pool: ArqRedis, messages: List[InboundMessage]
+) -> int:
+    """Queue inbound messages in their sender's mailbox, in one Redis round trip.
+
+    Each message gets a job whose id is derived from the WhatsApp message id, and
+    messages seen before, such as Meta redeliveries, are skipped. Returns the
+    number of messages queued.
+    """
+    if not messages:
+        return 0
+    script = redis_pool.register_script(ENQUEUE_INBOUND_MESSAGE_SCRIPT)
+    enqueue_time_ms = timestamp_ms()
+    score = enqueue_time_ms + int(config.MESSAGE_DEBOUNCE_SECONDS * 1000)
+    expires_ms = score - enqueue_time_ms + redis_pool.expires_extra_ms
+    async with redis_pool.pipeline(transaction=False) as pipe:
+        for message in messages:
+            job_id = f"{JOB_ID_PREFIX}{message.message_id}"
+            job = serialize_job(
+                "process_whatsapp_message",
+                (message.from_number,),
+                {},
+                None,
+                enqueue_time_ms,
+                serializer=redis_pool.job_serializer,
+            )
+            entry = json.dumps({"text": message.text, "received_at": time.time()})
+            await script(
+                keys=[
+                    f"{SEEN_MESSAGE_KEY_PREFIX}{message.message_id}",
+                    f"{MAILBOX_KEY_PREFIX}{message.from_number}",
+                    f"{job_key_prefix}{job_id}",
+                    redis_pool.default_queue_name,
+                ],
+                args=[
+                    config.WEBHOOK_DEDUPE_TTL_SECONDS,
+                    entry,
+                    config.MAILBOX_TTL_SECONDS,
+                    job,
+                    expires_ms,
+                    score,
+                    job_id,
+                ],
+                client=pipe,
+            )
+        results = await pipe.execute()
+    return sum(results)
+
+
+class InboundSpool:
+    """In-memory spool of inbound messages that Redis did not take within the ack budget.
+
+    A background task queues the spooled batches, retrying until Redis takes them.
+    Queueing a batch twice is harmless as messages are deduplicated by their id.
+    """
+
+    def __init__(self, redis_pool: ArqRedis, max_size: int):
+        self.redis_pool = redis_pool
+        self.batches: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.drain_task: Optional[asyncio.Task] = None
+
+    def put(self, messages: List[InboundMessage]) -> None:
+        """Spool a batch of messages, raises asyncio.QueueFull when the spool is full"""
+        self.batches.put_nowait(messages)
+
+    def start(self) -> None:
+        self.drain_task = asyncio.create_task(self.drain())
+
+    async def stop(self, timeout: float) -> None:
+        """Give the spooled batches up to timeout seconds to be queued, then stop"""
+        try:
+            await asyncio.wait_for(self.batches.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"{self.batches.qsize()} spooled batches were not queued")
+        self.drain_task.cancel()
+
+    async def drain(self) -> None:
+        while True:
+            messages = await self.batches.get()
+            delay = 0.1
+            while True:
+                try:
+                    await enqueue_inbound_messages(
+                        redis_pool=self.redis_pool, messages=messages
+                    )
+                    break
+                except Exception as e:
+                    logger.error(f"Error queueing spooled messages: {str(e)}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 5)
+            self.batches.task_done()
+
+
+async def ingest_inbound_messages(
+    redis_pool: ArqRedis, spool: InboundSpool, messages: List[InboundMessage]
+) -> None:
+    """Queue the messages within the ack budget, or spool them if Redis is slow or down.
+
+    Raises asyncio.QueueFull when the spool is full too.
+    """
+    try:
+        await asyncio.wait_for(
+            enqueue_inbound_messages(redis_pool=redis_pool, messages=messages),
+            timeout=config.WEBHOOK_ACK_BUDGET_SECONDS,
+        )
+    except Exception as e:
+        logger.warning(f"Spooling {len(messages)} messages: {e!r}")
+        spool.put(messages)
+
+
+async def wait_for_mailbox_quiet(redis_pool: ArqRedis, from_number: str) -> None:
+    """Wait until no message arrived for the debounce window, capped by the max wait"""
+    key = f"{MAILBOX_KEY_PREFIX}{from_number}"
+    deadline = time.monotonic() + config.MESSAGE_DEBOUNCE_MAX_SECONDS
+    while time.monotonic() < deadline:
+        last_entry = await redis_pool.lindex(key, -1)
+        if last_entry is None:
+            return
+        idle = time.time() - json.loads(last_entry)["received_at"]
+        if idle >= config.MESSAGE_DEBOUNCE_SECONDS:
+            return
+        await asyncio.sleep(
+            min(config.MESSAGE_DEBOUNCE_SECONDS - idle, deadline - time.monotonic())
+        )
+
+
+async def pop_mailbox(redis_pool: ArqRedis, from_number: str) -> List[str]:
+    """Atomically take every pending message of the sender, oldest first"""
+    key = f"{MAILBOX_KEY_PREFIX}{from_number}"
+    async with redis_pool.pipeline(transaction=True) as pipe:
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+        entries, _ = await pipe.execute()
+    return [json.loads(entry)["text"] for entry in entries]
+
+
+async def has_mail(redis_pool: ArqRedis, from_number: str) -> bool:
+    return await redis_pool.llen(f"{MAILBOX_KEY_PREFIX}{from_number}") > 0
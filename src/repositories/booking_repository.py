@@ -0,0 +1,165 @@
+import hashlib
+from datetime import date, datetime, timezone
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.restaurant_model import Booking, Restaurant
+from src.utils.availability_index import (
+    RestaurantInfo,
+    free_table,
+    slot_mask,
+    slot_start_time,
+    time_to_slot,
+)
+
+
+class BookingResult(NamedTuple):
+    booking: Booking
+    # False when the idempotency key matched a booking made before
+    created: bool
+
+
+def digits_only(value: str) -> str:
+    return "".join(char for char in value if char.isdigit())
+
+
+def booking_idempotency_key(
+    uid: str,
+    restaurant_id: int,
+    booking_date: date,
+    start_slot: int,
+    party_size: int,
+    customer_name: str,
+    customer_phone: str,
+) -> str:
+    """Key of a booking asked for by a user, the same for a retried tool call.
+
+    Names are compared casefolded and phone numbers by their digits, so the model
+    formatting the arguments differently on a retry still finds the first booking.
+    """
+    parts = [
+        uid,
+        str(restaurant_id),
+        booking_date.isoformat(),
+        str(start_slot),
+        str(party_size),
+        customer_name.strip().casefold(),
+        digits_only(customer_phone),
+    ]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def booking_reference(booking_id: int) -> str:
+    """Reference given to the customer, unique as it is the booking id"""
+    return f"{booking_id:06d}"
+
+
+def parse_booking_reference(reference: str) -> Optional[int]:
+    digits = digits_only(reference)
+    if not digits:
+        return None
+    return int(digits)
+
+
+async def load_day_occupancy(
+    db: AsyncSession, restaurant_id: int, booking_date: date
+) -> Dict[int, int]:
+    """Slot bitsets of the restaurant's tables on a date, from the saved bookings"""
+    result = await db.execute(
+        select(Booking.table_id, Booking.start_time, Booking.end_time).where(
+            Booking.restaurant_id == restaurant_id,
+            Booking.date == booking_date,
+            Booking.cancelled_at.is_(None),
+        )
+    )
+    occupancy = {}
+    for table_id, start, end in result.all():
+        occupancy[table_id] = occupancy.get(table_id, 0) | slot_mask(
+            time_to_slot(start), time_to_slot(end, end_of_day=True)
+        )
+    return occupancy
+
+
+async def reserve_booking(
+    db: AsyncSession,
+    restaurant: RestaurantInfo,
+    booking_date: date,
+    start_slot: int,
+    party_size: int,
+    customer_name: str,
+    customer_phone: str,
+    idempotency_key: str,
+) -> Optional[BookingResult]:
+    """Book the smallest table free for the whole booking, None when there is none.
+
+    Bumping the restaurant's booking_version first locks its row until the commit,
+    so concurrent bookings of a restaurant check the saved bookings one at a time
+    and cannot both take the same table. On SQLite the update takes the database
+    write lock, which serializes them too. The bookings of other restaurants are
+    not blocked on Postgres.
+    """
+    await db.execute(
+        update(Restaurant)
+        .where(Restaurant.id == restaurant.id)
+        .values(booking_version=Restaurant.booking_version + 1)
+    )
+    result = await db.execute(
+        select(Booking).where(Booking.idempotency_key == idempotency_key)
+    )
+    existing = result.scalars().first()
+    if existing is not None:
+        await db.commit()
+        return BookingResult(booking=existing, created=False)
+
+    occupancy = await load_day_occupancy(db, restaurant.id, booking_date)
+    table = free_table(restaurant, occupancy, party_size, start_slot)
+    if table is None:
+        # Only the version was bumped. Unlike a rollback, a commit keeps the bookings
+        # this session returned before loaded, the waitlist promotion reuses it.
+        await db.commit()
+        return None
+
+    booking = Booking(
+        restaurant_id=restaurant.id,
+        table_id=table.id,
+        date=booking_date,
+        start_time=slot_start_time(start_slot),
+        end_time=slot_start_time(start_slot + restaurant.booking_slots),
+        party_size=party_size,
+        customer_name=customer_name,
+        customer_phone=customer_phone,
+        idempotency_key=idempotency_key,
+    )
+    db.add(booking)
+    await db.commit()
+    return BookingResult(booking=booking, created=True)
+
+
+async def cancel_booking(
+    db: AsyncSession, booking_id: int, customer_phone: str
+) -> Optional[Booking]:
+    """Cancel a booking made with this phone number, None when there is no such booking.
+
+    The update only matches a booking not cancelled yet, so a cancellation racing
+    another one of the same booking returns None instead of freeing the table twice.
+    """
+    result = await db.execute(
+        select(Booking).where(Booking.id == booking_id, Booking.cancelled_at.is_(None))
+    )
+    booking = result.scalars().first()
+    if booking is None or digits_only(booking.customer_phone) != digits_only(
+        customer_phone
+    ):
+        await db.commit()
+        return None
+    result = await db.execute(
+        update(Booking)
+        .where(Booking.id == booking_id, Booking.cancelled_at.is_(None))
+        .values(cancelled_at=datetime.now(timezone.utc), idempotency_key=None)
+    )
+    await db.commit()
+    if result.rowcount != 1:
+        return None
+    return booking
@@ -0,0 +1,66 @@
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import config
+from src.models.chat_model import Message
+
+
+class HistoryCursor(NamedTuple):
+    """Position of the oldest message of a page, the next page starts before it"""
+
+    created_at: datetime
+    id: int
+
+
+async def get_chat_history_page(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = config.CHAT_HISTORY_LIMIT,
+    before: Optional[HistoryCursor] = None,
+    after_id: Optional[int] = None,
+) -> List[Message]:
+    """Page of the user's messages, oldest first, ending right before the cursor.
+
+    Without a cursor this is the latest page. Messages up to after_id, such as the
+    ones folded into the conversation summary, are left out. The query walks the
+    (user_id, created_at, id) index backwards and stops after `limit` rows, so
+    its cost does not grow with the size of the table or of the conversation.
+    """
+    query = select(Message).where(Message.user_id == user_id)
+    if before is not None:
+        query = query.where(
+            tuple_(Message.created_at, Message.id)
+            < tuple_(before.created_at, before.id)
+        )
+    if after_id is not None:
+        query = query.where(Message.id > after_id)
+    query = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit)
+    result = await db.execute(query)
+    messages = list(result.scalars().all())
+    messages.reverse()
+    return messages
+
+
+def get_next_cursor(page: List[Message]) -> Optional[HistoryCursor]:
+    if not page:
+        return None
+    return HistoryCursor(created_at=page[0].created_at, id=page[0].id)
+
+
+async def get_chat_history(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = config.CHAT_HISTORY_LIMIT,
+    after_id: Optional[int] = None,
+) -> List[Message]:
+    """Latest `limit` messages of the user after after_id, in chronological order"""
+    return await get_chat_history_page(
+        db=db, user_id=user_id, limit=limit, after_id=after_id
+    )
+
+
+def format_chat_history(messages: List[Message]) -> List[Dict[str, str]]:
+    return [{"role": msg.role.value, "content": msg.content} for msg in messages]
@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import logging
+from src.database import get_database_session
+from src.models.chat_model import Message
+
+logger = logging.getLogger(__name__)
+
+
+def build_turn_rows(user_id: int, query: str, response: str) -> List[Dict[str, Any]]:
+    """Rows of the user and assistant messages of a turn.
+
+    created_at is set here rather than by the database so buffered messages keep the
+    time of their turn, id orders the two messages.
+    """
+    created_at = datetime.now(timezone.utc)
+    return [
+        {
+            "user_id": user_id,
+            "role": "user",
+            "content": query,
+            "created_at": created_at,
+        },
+        {
+            "user_id": user_id,
+            "role": "assistant",
+            "content": response,
+            "created_at": created_at,
+        },
+    ]
+
+
+async def save_turn(db: AsyncSession, user_id: int, query: str, response: str) -> None:
+    """Save the user and assistant messages of a turn in one transaction"""
+    await db.execute(insert(Message), build_turn_rows(user_id, query, response))
+    await db.commit()
+
+
+class MessageWriter:
+    """Write-behind buffer of messages, flushed from many conversations as one insert.
+
+    A flush runs once batch_size messages are buffered or flush_seconds after the
+    previous one. Messages of a failed flush are kept and retried with the next one.
+    """
+
+    def __init__(self, batch_size: int, flush_seconds: float):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.rows: List[Dict[str, Any]] = []
+        self.full = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.flush_task: Optional[asyncio.Task] = None
+
+    def add(self, rows: List[Dict[str, Any]]) -> None:
+        self.rows.extend(rows)
+        if len(self.rows) >= self.batch_size:
+            self.full.set()
+
+    def has_pending(self, user_id: int) -> bool:
+        """Messages of the user are buffered or being flushed"""
+        return self.lock.locked() or any(row["user_id"] == user_id for row in self.rows)
+
+    def start(self) -> None:
+        self.flush_task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop the flush loop, waiting for a flush in progress, then flush the rest"""
+        self.flush_task.cancel()
+        try:
+            await self.flush_task
+        except asyncio.CancelledError:
+            pass
+        # Waits on the lock for a shielded flush that outlived the loop
+        await self.flush()
+        if self.rows:
+            logger.error(f"{len(self.rows)} buffered messages were not saved")
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            # Cancelling the loop must not interrupt an insert half way
+            await asyncio.shield(self.flush())
+
+    async def flush(self) -> None:
+        async with self.lock:
+            if not self.rows:
+                return None
+            rows, self.rows = self.rows, []
+            saved = False
+            db = await get_database_session()
+            try:
+                await db.execute(insert(Message), rows)
+                await db.commit()
+                saved = True
+                logger.info(f"Flushed {len(rows)} buffered messages")
+            except Exception as e:
+                logger.error(f"Unable to flush {len(rows)} messages: {str(e)}")
+            finally:
+                # Also reached when the flush is cancelled
+                if not saved:
+                    self.rows = rows + self.rows
+                await db.close()
+        return None
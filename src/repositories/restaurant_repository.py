@@ -0,0 +1,270 @@
+import asyncio
+import math
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import logging
+from src.database import get_database_session
+from src.models.restaurant_model import (
+    Booking,
+    Restaurant,
+    RestaurantAlias,
+    RestaurantTable,
+)
+from src.repositories.booking_repository import load_day_occupancy
+from src.utils.availability_index import (
+    SLOT_MINUTES,
+    AvailabilityIndex,
+    RestaurantInfo,
+    TableInfo,
+    time_to_slot,
+)
+from src.utils.restaurant_catalog import RestaurantCatalog
+
+logger = logging.getLogger(__name__)
+
+BOOKING_COLUMNS = (
+    Booking.id,
+    Booking.restaurant_id,
+    Booking.table_id,
+    Booking.date,
+    Booking.start_time,
+    Booking.end_time,
+)
+
+# Booking, cancellation and catalog update times come from the clocks of other
+# processes, changes this long before the previous refresh are reloaded again
+CANCELLATION_OVERLAP = timedelta(seconds=30)
+
+
+async def load_restaurants(
+    db: AsyncSession,
+    index: AvailabilityIndex,
+    catalog: Optional[RestaurantCatalog] = None,
+    since: Optional[datetime] = None,
+) -> int:
+    """Load the restaurants, only those updated since the given time when given.
+
+    With a catalog their names and aliases are indexed for the tools to resolve.
+    """
+    query = select(Restaurant)
+    if since is not None:
+        query = query.where(Restaurant.updated_at >= since)
+    restaurants = (await db.execute(query)).scalars().all()
+    if not restaurants:
+        return 0
+    restaurant_ids = [restaurant.id for restaurant in restaurants]
+    tables_by_restaurant = {}
+    result = await db.execute(
+        select(
+            RestaurantTable.id,
+            RestaurantTable.restaurant_id,
+            RestaurantTable.label,
+            RestaurantTable.capacity,
+        ).where(RestaurantTable.restaurant_id.in_(restaurant_ids))
+    )
+    for table_id, restaurant_id, label, capacity in result.all():
+        tables_by_restaurant.setdefault(restaurant_id, []).append(
+            TableInfo(id=table_id, label=label, capacity=capacity)
+        )
+    aliases_by_restaurant = {}
+    if catalog is not None:
+        result = await db.execute(
+            select(RestaurantAlias.restaurant_id, RestaurantAlias.alias).where(
+                RestaurantAlias.restaurant_id.in_(restaurant_ids)
+            )
+        )
+        for restaurant_id, alias in result.all():
+            aliases_by_restaurant.setdefault(restaurant_id, []).append(alias)
+    for restaurant in restaurants:
+        tables = tables_by_restaurant.get(restaurant.id, [])
+        index.add_restaurant(
+            RestaurantInfo(
+                id=restaurant.id,
+                name=restaurant.name,
+                open_slot=time_to_slot(restaurant.opening_time),
+                close_slot=time_to_slot(restaurant.closing_time, end_of_day=True),
+                booking_slots=math.ceil(restaurant.booking_minutes / SLOT_MINUTES),
+                tables=tuple(sorted(tables, key=lambda table: table.capacity)),
+            )
+        )
+        if catalog is not None:
+            catalog.set_names(
+                restaurant.id,
+                [restaurant.name, *aliases_by_restaurant.get(restaurant.id, [])],
+            )
+    return len(restaurants)
+
+
+async def set_restaurant_aliases(
+    db: AsyncSession, restaurant_id: int, aliases: List[str]
+) -> None:
+    """Replace the aliases of a restaurant, the processes pick them up on refresh"""
+    await db.execute(
+        delete(RestaurantAlias).where(RestaurantAlias.restaurant_id == restaurant_id)
+    )
+    db.add_all(
+        RestaurantAlias(restaurant_id=restaurant_id, alias=alias)
+        for alias in dict.fromkeys(aliases)
+    )
+    await db.execute(
+        update(Restaurant)
+        .where(Restaurant.id == restaurant_id)
+        .values(updated_at=func.now())
+    )
+    await db.commit()
+
+
+async def load_bookings(
+    db: AsyncSession,
+    index: AvailabilityIndex,
+    first_date: date,
+    after_id: Optional[int] = None,
+    created_since: Optional[datetime] = None,
+) -> int:
+    """Apply the bookings from first_date on, only those after after_id when given.
+
+    Ids are taken at insert, so a booking committed after one with a higher id has
+    a lower one, bookings created since created_since are applied again to catch
+    it. Applying a booking twice leaves the index unchanged.
+    """
+    query = select(*BOOKING_COLUMNS).where(
+        Booking.date >= first_date, Booking.cancelled_at.is_(None)
+    )
+    if after_id is not None:
+        condition = Booking.id > after_id
+        if created_since is not None:
+            condition = or_(condition, Booking.created_at >= created_since)
+        query = query.where(condition)
+    result = await db.execute(query)
+    count = 0
+    for booking_id, restaurant_id, table_id, booking_date, start, end in result.all():
+        index.add_booking(
+            restaurant_id=restaurant_id,
+            table_id=table_id,
+            booking_date=booking_date,
+            start_slot=time_to_slot(start),
+            end_slot=time_to_slot(end, end_of_day=True),
+            booking_id=booking_id,
+        )
+        count += 1
+    return count
+
+
+async def reload_day(
+    db: AsyncSession, index: AvailabilityIndex, restaurant_id: int, booking_date: date
+) -> None:
+    """Rebuild the occupancy of a restaurant on a date, which drops cancelled bookings.
+
+    Clearing the slots of a cancelled booking instead could clear those of a later
+    booking of the same table and time, if the cancellation is applied after it.
+    """
+    occupancy = await load_day_occupancy(db, restaurant_id, booking_date)
+    index.replace_day(restaurant_id, booking_date, occupancy)
+
+
+async def reload_cancelled_days(
+    db: AsyncSession, index: AvailabilityIndex, first_date: date, since: datetime
+) -> int:
+    """Reload the days with bookings cancelled since the given time"""
+    result = await db.execute(
+        select(Booking.restaurant_id, Booking.date)
+        .where(Booking.cancelled_at >= since, Booking.date >= first_date)
+        .distinct()
+    )
+    days = result.all()
+    for restaurant_id, booking_date in days:
+        await reload_day(
+            db=db, index=index, restaurant_id=restaurant_id, booking_date=booking_date
+        )
+    return len(days)
+
+
+async def load_availability_index(
+    index: AvailabilityIndex, catalog: Optional[RestaurantCatalog] = None
+) -> None:
+    """Load the restaurants, their tables and the upcoming bookings into the index"""
+    db = await get_database_session()
+    try:
+        await load_restaurants(db=db, index=index, catalog=catalog)
+        count = await load_bookings(db=db, index=index, first_date=date.today())
+        logger.info(f"Loaded {len(index.restaurants)} restaurants and {count} bookings")
+    except Exception as e:
+        logger.error(f"Unable to load the availability index: {str(e)}")
+    finally:
+        await db.close()
+
+
+class AvailabilityRefresher:
+    """Background task applying the bookings other processes saved to the index.
+
+    New bookings are found by id and creation time, the days with cancellations
+    are reloaded,
+    past dates are evicted on every refresh. Restaurants added or changed since
+    the previous refresh are reloaded with their names and aliases.
+    """
+
+    def __init__(
+        self,
+        index: AvailabilityIndex,
+        interval_seconds: float,
+        catalog: Optional[RestaurantCatalog] = None,
+    ):
+        self.index = index
+        self.catalog = catalog
+        self.interval_seconds = interval_seconds
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.refreshed_at = datetime.now(timezone.utc)
+
+    def start(self) -> None:
+        self.refresh_task = asyncio.create_task(self.run())
+
+    def stop(self) -> None:
+        self.refresh_task.cancel()
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.refresh()
+
+    async def refresh(self) -> None:
+        today = date.today()
+        self.index.evict_before(today)
+        refreshed_at = datetime.now(timezone.utc)
+        db = await get_database_session()
+        try:
+            restaurants = await load_restaurants(
+                db=db,
+                index=self.index,
+                catalog=self.catalog,
+                since=self.refreshed_at - CANCELLATION_OVERLAP,
+            )
+            if restaurants:
+                logger.info(f"Reloaded {restaurants} updated restaurants")
+            count = await load_bookings(
+                db=db,
+                index=self.index,
+                first_date=today,
+                after_id=self.index.last_booking_id,
+                created_since=self.refreshed_at - CANCELLATION_OVERLAP,
+            )
+            if count:
+                logger.info(
+                    f"Applied {count} new and recent bookings to the availability index"
+                )
+            days = await reload_cancelled_days(
+                db=db,
+                index=self.index,
+                first_date=today,
+                since=self.refreshed_at - CANCELLATION_OVERLAP,
+            )
+            if days:
+                logger.info(f"Reloaded {days} days with cancelled bookings")
+            self.refreshed_at = refreshed_at
+        except Exception as e:
+            logger.error(f"Unable to refresh the availability index: {str(e)}")
+        finally:
+            await db.close()
@@ -0,0 +1,127 @@
+import hashlib
+from collections import OrderedDict
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import config
+from src.models.chat_model import Message
+from src.repositories.user_repository import get_user_id
+from src.utils.conversation_memory import (
+    SESSION_CONVERSATION_PREFIX,
+    Turn,
+    get_stored_turns,
+    refresh_stored_summary,
+)
+
+SESSION_CHANNEL = "api"
+SESSION_USER_PREFIX = "api:"
+
+
+class SessionState:
+    """Conversation of a session as the agent sees it, its summary and the turns after it"""
+
+    def __init__(
+        self, key: str, user_id: int, summary: Optional[str], turns: List[Turn]
+    ):
+        self.key = key
+        self.user_id = user_id
+        self.summary = summary
+        self.turns = turns
+
+
+class SessionCache:
+    """Least recently used sessions kept in memory in front of the messages table.
+
+    The cache is per process, so requests of a session should reach the same process.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        state = self.sessions.get(session_id)
+        if state is None:
+            self.misses += 1
+            return None
+        self.sessions.move_to_end(session_id)
+        self.hits += 1
+        return state
+
+    def put(self, session_id: str, state: SessionState) -> None:
+        self.sessions[session_id] = state
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_size:
+            self.sessions.popitem(last=False)
+
+    def discard(self, session_id: str) -> None:
+        self.sessions.pop(session_id, None)
+
+
+session_cache = SessionCache(max_size=config.SESSION_CACHE_SIZE)
+
+
+def get_session_key(user_id: str, session_id: str) -> str:
+    """Key of the session of a user, another user sending the same id gets another one"""
+    return hashlib.sha256(f"{user_id}\0{session_id}".encode()).hexdigest()[:48]
+
+
+def get_session_conversation_id(session_key: str) -> str:
+    return f"{SESSION_CONVERSATION_PREFIX}{session_key}"
+
+
+async def load_session(db: AsyncSession, user_id: str, session_id: str) -> SessionState:
+    """State of the user's session from the cache, or from the database on a miss.
+
+    A session is stored as a user of the api channel and its messages, keyed by
+    the user id and the session id together.
+    """
+    key = get_session_key(user_id=user_id, session_id=session_id)
+    state = session_cache.get(key)
+    if state is not None:
+        return state
+    session_user_id = await get_user_id(
+        db=db,
+        whatsapp_id=f"{SESSION_USER_PREFIX}{key}",
+        channel=SESSION_CHANNEL,
+    )
+    summary, turns = await get_stored_turns(
+        db=db,
+        user_id=session_user_id,
+        conversation_id=get_session_conversation_id(key),
+    )
+    state = SessionState(key=key, user_id=session_user_id, summary=summary, turns=turns)
+    session_cache.put(key, state)
+    return state
+
+
+async def save_session_turn(
+    db: AsyncSession, state: SessionState, query: str, response: str
+) -> None:
+    """Persist the query and the response and append them to the cached state"""
+    user_message = Message(user_id=state.user_id, role="user", content=query)
+    assistant_message = Message(
+        user_id=state.user_id, role="assistant", content=response
+    )
+    db.add_all([user_message, assistant_message])
+    await db.commit()
+    state.turns.append(
+        Turn(position=user_message.id, message={"role": "user", "content": query})
+    )
+    state.turns.append(
+        Turn(
+            position=assistant_message.id,
+            message={"role": "assistant", "content": response},
+        )
+    )
+
+
+async def refresh_session_summary(session_key: str, user_id: int) -> None:
+    """Fold the oldest turns of the session, its next turn reloads the new summary"""
+    await refresh_stored_summary(
+        user_id=user_id, conversation_id=get_session_conversation_id(session_key)
+    )
+    session_cache.discard(session_key)
@@ -0,0 +1,41 @@
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import get_insert
+from src.models.chat_model import ConversationSummary
+
+
+async def get_summary(
+    db: AsyncSession, conversation_id: str
+) -> Optional[ConversationSummary]:
+    result = await db.execute(
+        select(ConversationSummary).where(
+            ConversationSummary.conversation_id == conversation_id
+        )
+    )
+    return result.scalars().first()
+
+
+async def save_summary(
+    db: AsyncSession, conversation_id: str, content: str, summarized_until: int
+) -> None:
+    """Insert or replace the summary, never moving it back to an older position"""
+    insert = get_insert(db)
+    statement = insert(ConversationSummary).values(
+        conversation_id=conversation_id,
+        content=content,
+        summarized_until=summarized_until,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[ConversationSummary.conversation_id],
+        set_={
+            "content": statement.excluded.content,
+            "summarized_until": statement.excluded.summarized_until,
+            "updated_at": func.now(),
+        },
+        where=ConversationSummary.summarized_until < summarized_until,
+    )
+    await db.execute(statement)
+    await db.commit()
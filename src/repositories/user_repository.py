@@ -0,0 +1,130 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from arq import ArqRedis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import config
+from src import logging
+from src.database import get_insert
+from src.models.chat_model import User
+from src.utils.metrics import USER_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+USER_ID_KEY_PREFIX = "user-id:"
+
+
+async def upsert_user(
+    db: AsyncSession, whatsapp_id: str, channel: str = "whatsapp"
+) -> int:
+    """Id of the user with this external id, created if missing, in one round trip.
+
+    The no-op update on conflict makes RETURNING yield the existing row too, so
+    concurrent workers creating the same user both get its id.
+    """
+    insert = get_insert(db)
+    statement = insert(User).values(whatsapp_id=whatsapp_id, channel=channel)
+    statement = statement.on_conflict_do_update(
+        index_elements=[User.whatsapp_id],
+        set_={"whatsapp_id": statement.excluded.whatsapp_id},
+    ).returning(User.id)
+    result = await db.execute(statement)
+    user_id = result.scalar_one()
+    await db.commit()
+    return user_id
+
+
+class UserIdCache:
+    """Least recently used user ids by external id, each kept up to ttl_seconds.
+
+    The mapping never changes once a user exists, the TTL only bounds how long a
+    deleted user is remembered.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.user_ids: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self.stats: Dict[str, int] = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def get(self, key: str) -> Optional[int]:
+        entry = self.user_ids.get(key)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self.user_ids[key]
+            return None
+        self.user_ids.move_to_end(key)
+        return user_id
+
+    def put(self, key: str, user_id: int) -> None:
+        self.user_ids[key] = (user_id, time.monotonic() + self.ttl_seconds)
+        self.user_ids.move_to_end(key)
+        while len(self.user_ids) > self.max_size:
+            self.user_ids.popitem(last=False)
+
+    def get_hit_rate(self) -> float:
+        total = sum(self.stats.values())
+        if total == 0:
+            return 0.0
+        return (self.stats["local_hits"] + self.stats["redis_hits"]) / total
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "hit_rate": self.get_hit_rate(),
+            "size": len(self.user_ids),
+        }
+
+
+user_id_cache = UserIdCache(
+    max_size=config.USER_CACHE_SIZE, ttl_seconds=config.USER_CACHE_TTL_SECONDS
+)
+
+
+async def get_user_id(
+    db: AsyncSession,
+    whatsapp_id: str,
+    channel: str = "whatsapp",
+    redis_pool: Optional[ArqRedis] = None,
+) -> int:
+    """Id of the user, from the process cache, then Redis when given, then the database.
+
+    Only the first turn of a user in a while reaches the database, where the user is
+    upserted. Redis errors fall through to the database.
+    """
+    key = f"{channel}:{whatsapp_id}"
+    user_id = user_id_cache.get(key)
+    if user_id is not None:
+        user_id_cache.stats["local_hits"] += 1
+        USER_CACHE_LOOKUPS.inc(result="local_hit")
+        return user_id
+    if redis_pool is not None:
+        try:
+            cached = await redis_pool.get(f"{USER_ID_KEY_PREFIX}{key}")
+        except Exception as e:
+            logger.warning(f"Unable to read the user id from Redis: {str(e)}")
+            cached = None
+        if cached is not None:
+            user_id_cache.stats["redis_hits"] += 1
+            USER_CACHE_LOOKUPS.inc(result="redis_hit")
+            user_id_cache.put(key, int(cached))
+            return int(cached)
+    user_id_cache.stats["misses"] += 1
+    USER_CACHE_LOOKUPS.inc(result="miss")
+    user_id = await upsert_user(db=db, whatsapp_id=whatsapp_id, channel=channel)
+    user_id_cache.put(key, user_id)
+    if redis_pool is not None:
+        try:
+            await redis_pool.set(
+                f"{USER_ID_KEY_PREFIX}{key}",
+                user_id,
+                ex=int(config.USER_CACHE_TTL_SECONDS),
+            )
+        except Exception as e:
+            logger.warning(f"Unable to cache the user id in Redis: {str(e)}")
+    logger.debug(f"User id cache hit rate: {user_id_cache.get_hit_rate():.1%}")
+    return user_id
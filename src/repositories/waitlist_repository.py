@@ -0,0 +1,179 @@
+import json
+from datetime import date, datetime, time, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+
+from arq import ArqRedis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import logging
+from src.models.restaurant_model import Booking
+from src.repositories.booking_repository import load_day_occupancy, reserve_booking
+from src.utils.availability_index import RestaurantInfo, free_table, slot_mask
+
+logger = logging.getLogger(__name__)
+
+WAITLIST_KEY_PREFIX = "waitlist:"
+WAITLIST_ENTRY_KEY_PREFIX = "waitlist:entry:"
+WAITLIST_SEQUENCE_KEY = "waitlist:sequence"
+
+# Adds the entry at the end of the queue unless it is already in it, scored by a
+# global sequence so queues of different slots can be merged in joining order.
+# Returns the 0-based rank of the entry.
+JOIN_WAITLIST_SCRIPT = """
+local rank = redis.call('ZRANK', KEYS[1], ARGV[1])
+if rank then
+    return rank
+end
+local sequence = redis.call('INCR', KEYS[3])
+redis.call('ZADD', KEYS[1], sequence, ARGV[1])
+redis.call('EXPIREAT', KEYS[1], ARGV[3])
+redis.call('SET', KEYS[2], ARGV[2], 'EXAT', ARGV[3])
+return redis.call('ZRANK', KEYS[1], ARGV[1])
+"""
+
+
+class WaitlistEntry(NamedTuple):
+    # The idempotency key of the booking asked for, so joining twice keeps one
+    # entry and a promotion retried by arq books the table once
+    entry_id: str
+    uid: str
+    party_size: int
+    customer_name: str
+    customer_phone: str
+
+
+def waitlist_key(restaurant_id: int, booking_date: date, start_slot: int) -> str:
+    return (
+        f"{WAITLIST_KEY_PREFIX}{restaurant_id}:{booking_date.isoformat()}:{start_slot}"
+    )
+
+
+def _expires_at(booking_date: date) -> int:
+    """Queues and entries expire the day after the booking date"""
+    return int(datetime.combine(booking_date + timedelta(days=1), time()).timestamp())
+
+
+async def join_waitlist(
+    redis_pool: ArqRedis,
+    restaurant_id: int,
+    booking_date: date,
+    start_slot: int,
+    entry: WaitlistEntry,
+) -> int:
+    """Queue the entry for the slot, returns its 1-based position"""
+    script = redis_pool.register_script(JOIN_WAITLIST_SCRIPT)
+    rank = await script(
+        keys=[
+            waitlist_key(restaurant_id, booking_date, start_slot),
+            f"{WAITLIST_ENTRY_KEY_PREFIX}{entry.entry_id}",
+            WAITLIST_SEQUENCE_KEY,
+        ],
+        args=[
+            entry.entry_id,
+            json.dumps(entry._asdict()),
+            _expires_at(booking_date),
+        ],
+    )
+    return rank + 1
+
+
+async def get_waitlist_position(
+    redis_pool: ArqRedis, key: str, entry_id: str
+) -> Optional[int]:
+    """1-based position of the entry in the queue, None when it is not queued"""
+    rank = await redis_pool.zrank(key, entry_id)
+    if rank is None:
+        return None
+    return rank + 1
+
+
+async def leave_waitlist(redis_pool: ArqRedis, key: str, entry_id: str) -> bool:
+    """Remove the entry from the queue, False when it was not queued"""
+    async with redis_pool.pipeline(transaction=True) as pipe:
+        pipe.zrem(key, entry_id)
+        pipe.delete(f"{WAITLIST_ENTRY_KEY_PREFIX}{entry_id}")
+        removed, _ = await pipe.execute()
+    return removed == 1
+
+
+async def peek_waitlist(
+    redis_pool: ArqRedis, key: str, count: int
+) -> List[Tuple[float, WaitlistEntry]]:
+    """First count entries of the queue with their joining sequence, oldest first"""
+    members = await redis_pool.zrange(key, 0, count - 1, withscores=True)
+    if not members:
+        return []
+    values = await redis_pool.mget(
+        [f"{WAITLIST_ENTRY_KEY_PREFIX}{member.decode()}" for member, _ in members]
+    )
+    entries = []
+    for (member, sequence), value in zip(members, values):
+        if value is None:
+            logger.warning(f"Waitlist entry {member.decode()} has no details")
+            continue
+        entries.append((sequence, WaitlistEntry(**json.loads(value))))
+    return entries
+
+
+async def promote_waitlist(
+    db: AsyncSession,
+    redis_pool: ArqRedis,
+    restaurant: RestaurantInfo,
+    booking_date: date,
+    start_slot: int,
+    end_slot: int,
+    scan: int,
+) -> List[Tuple[WaitlistEntry, Booking]]:
+    """Book the waiting parties that fit once the slots from start_slot to end_slot free up.
+
+    The first scan entries of every slot whose booking would overlap the freed slots
+    are tried in joining order, so the party waiting longest is served first and a
+    large party at the head of a queue does not hold the smaller ones behind it.
+    """
+    first = max(restaurant.open_slot, start_slot - restaurant.booking_slots + 1)
+    last = min(restaurant.close_slot - restaurant.booking_slots, end_slot - 1)
+    candidates = []
+    for slot in range(first, last + 1):
+        key = waitlist_key(restaurant.id, booking_date, slot)
+        for sequence, entry in await peek_waitlist(redis_pool, key, scan):
+            candidates.append((sequence, slot, entry))
+    candidates.sort(key=lambda candidate: candidate[0])
+
+    if not candidates:
+        return []
+
+    # Entries are only tried once they fit the saved bookings, reserve_booking checks
+    # again under the lock. The read transaction ends before it takes the lock.
+    occupancy = await load_day_occupancy(db, restaurant.id, booking_date)
+    await db.commit()
+    promoted = []
+    # Smallest party that found no table, per slot, larger ones will not fit either
+    unseated = {}
+    for _, slot, entry in candidates:
+        if entry.party_size >= unseated.get(slot, float("inf")):
+            continue
+        if free_table(restaurant, occupancy, entry.party_size, slot) is None:
+            unseated[slot] = entry.party_size
+            continue
+        result = await reserve_booking(
+            db=db,
+            restaurant=restaurant,
+            booking_date=booking_date,
+            start_slot=slot,
+            party_size=entry.party_size,
+            customer_name=entry.customer_name,
+            customer_phone=entry.customer_phone,
+            idempotency_key=entry.entry_id,
+        )
+        if result is None:
+            unseated[slot] = entry.party_size
+            continue
+        await leave_waitlist(
+            redis_pool, waitlist_key(restaurant.id, booking_date, slot), entry.entry_id
+        )
+        table_id = result.booking.table_id
+        occupancy[table_id] = occupancy.get(table_id, 0) | slot_mask(
+            slot, slot + restaurant.booking_slots
+        )
+        promoted.append((entry, result.booking))
+    return promoted
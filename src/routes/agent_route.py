@@ -1,56 +1,168 @@
+import hashlib
 import json
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter
+from arq import ArqRedis
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
-from agents import ItemHelpers, Runner
+from agents import ItemHelpers
 from openai.types.responses import ResponseTextDeltaEvent
-from openai import OpenAI, AsyncOpenAI
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.custom_agents import table_booking_agent
+from src.custom_agents.agent_runner import (
+    GuardrailTripped,
+    run_table_booking_agent,
+    stream_table_booking_agent,
+)
+from src.database import get_database, get_database_session
+from src.queue import get_redis_pool
+from src.repositories.session_repository import (
+    SessionState,
+    load_session,
+    refresh_session_summary,
+    save_session_turn,
+)
+from src.repositories.summary_repository import get_summary
 from src.schemas.schemas import AgentChatRequest, ChatHistory, AgentChatResponse
 from src import config
-from src.custom_agents.guard_rail_agent import guardrail_agent
-from src.schemas.schemas import TableBookingOutput, UserInfo
-from src.utils.prompts import GAURDRAIL_FAIL_PROMPT
-
+from src.schemas.schemas import UserInfo
+from src.utils.conversation_memory import (
+    API_CONVERSATION_PREFIX,
+    Turn,
+    build_window,
+    refresh_summary,
+)
+from src.utils.metrics import TURNS, timed
+from src.utils.openai_client import ModelUnavailable
+from src.utils.refusal import get_refusal, stream_refusal
 
 router = APIRouter(prefix=f"/api/{config.API_VERSION}/agent", tags=["AGENT"])
 
-client = OpenAI(api_key=config.OPENAI_API_KEY)
-async_client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+# History entries identifying a stateless conversation, a summary is only reused by
+# requests that start with the same entries
+CONVERSATION_KEY_ENTRIES = 3
+
+
+def format_stream_event(payload: Dict[str, Any]) -> str:
+    """Frame a stream event for the configured transport"""
+    if config.STREAM_TRANSPORT == "sse":
+        return f"data: {json.dumps(payload)}\n\n"
+    return f"{json.dumps(payload)}\n"
+
+
+def format_chat_history(chat_history: List[ChatHistory], start: int = 0) -> List[Turn]:
+    """Messages of the history entries from start on, positioned by entry number"""
+    turns = []
+    for position, ch in enumerate(chat_history[start:], start=start + 1):
+        turns.append(
+            Turn(position=position, message={"role": "user", "content": ch.query})
+        )
+        turns.append(
+            Turn(
+                position=position, message={"role": "assistant", "content": ch.response}
+            )
+        )
+    return turns
+
 
+def get_api_conversation_id(user_id: str, chat_history: List[ChatHistory]) -> str:
+    """Summary key of a stateless conversation, from the user and its first entries"""
+    digest = hashlib.sha256(user_id.encode())
+    for ch in chat_history[:CONVERSATION_KEY_ENTRIES]:
+        digest.update(f"\0{ch.query}\0{ch.response}".encode())
+    return f"{API_CONVERSATION_PREFIX}{digest.hexdigest()[:48]}"
 
-def format_chat_history(
+
+async def build_session_input(
+    db: AsyncSession,
     agent_chat_request: AgentChatRequest,
-) -> List[ChatHistory]:
-    formatted_messages = []
-    for ch in agent_chat_request.chat_history:
-        formatted_messages.append({"role": "user", "content": ch.query})
-        formatted_messages.append({"role": "assistant", "content": ch.response})
-    formatted_messages.append({"role": "user", "content": agent_chat_request.query})
-    return formatted_messages
+    background_tasks: BackgroundTasks,
+) -> Tuple[List[Dict[str, str]], SessionState]:
+    """Agent input from the conversation kept by the server for the session"""
+    state = await load_session(
+        db=db,
+        user_id=agent_chat_request.user_id,
+        session_id=agent_chat_request.session_id,
+    )
+    window = build_window(
+        turns=state.turns, query=agent_chat_request.query, summary=state.summary
+    )
+    if window.needs_summary:
+        background_tasks.add_task(
+            refresh_session_summary,
+            session_key=state.key,
+            user_id=state.user_id,
+        )
+    return window.input, state
 
 
-@router.post("/chat/stream", response_model=None)
-async def handle_post_chat_stream(agent_chat_request: AgentChatRequest):
-    formatted_chat_history = format_chat_history(agent_chat_request=agent_chat_request)
+async def build_agent_input(
+    db: AsyncSession,
+    agent_chat_request: AgentChatRequest,
+    background_tasks: BackgroundTasks,
+) -> Tuple[List[Dict[str, str]], Optional[SessionState]]:
+    """Agent input within the token budget, entries already summarized are left out.
 
-    async def generate():
-        input_checks = await Runner.run(
-            starting_agent=guardrail_agent, input=formatted_chat_history
+    With a session id the server side conversation is used and its state returned so
+    the turn can be saved, otherwise the history comes from the request. When the
+    history does not fit, the summary is refreshed after the response is sent.
+    """
+    if agent_chat_request.session_id is not None:
+        return await build_session_input(
+            db=db,
+            agent_chat_request=agent_chat_request,
+            background_tasks=background_tasks,
+        )
+    conversation_id = get_api_conversation_id(
+        user_id=agent_chat_request.user_id,
+        chat_history=agent_chat_request.chat_history,
+    )
+    summary = await get_summary(db=db, conversation_id=conversation_id)
+    start, summary_content = 0, None
+    # A summary past the end of the history belongs to an earlier conversation
+    if summary is not None and summary.summarized_until <= len(
+        agent_chat_request.chat_history
+    ):
+        start, summary_content = summary.summarized_until, summary.content
+    turns = format_chat_history(agent_chat_request.chat_history, start=start)
+    window = build_window(
+        turns=turns, query=agent_chat_request.query, summary=summary_content
+    )
+    if window.needs_summary:
+        background_tasks.add_task(
+            refresh_summary,
+            conversation_id=conversation_id,
+            turns=turns,
+            summary=summary_content,
         )
+    return window.input, None
 
-        final_output = input_checks.final_output_as(TableBookingOutput)
 
-        if final_output.is_table_booking:
-            result = Runner.run_streamed(
-                starting_agent=table_booking_agent,
-                input=formatted_chat_history,
-                context=UserInfo(uid=agent_chat_request.user_id),
-            )
+@router.post("/chat/stream", response_model=None)
+async def handle_post_chat_stream(
+    agent_chat_request: AgentChatRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_database),
+    redis_pool: ArqRedis = Depends(get_redis_pool),
+):
+    with timed("history_fetch"):
+        formatted_chat_history, session_state = await build_agent_input(
+            db=db,
+            agent_chat_request=agent_chat_request,
+            background_tasks=background_tasks,
+        )
 
-            async for event in result.stream_events():
+    async def generate():
+        answer = []
+        outcome = "answered"
+        try:
+            async for event in stream_table_booking_agent(
+                input=formatted_chat_history,
+                context=UserInfo(uid=agent_chat_request.user_id, redis_pool=redis_pool),
+                mode=config.GUARDRAIL_MODE_CHAT_STREAM,
+            ):
                 """We'll ignore the raw responses event deltas
                 If you want to stream the information use this."""
 
@@ -58,7 +170,9 @@ async def handle_post_chat_stream(agent_chat_request: AgentChatRequest):
                 if event.type == "raw_response_event" and isinstance(
                     event.data, ResponseTextDeltaEvent
                 ):
-                    yield json.dumps({"type": "answer", "content": event.data.delta})
+                    yield format_stream_event(
+                        {"type": "answer", "content": event.data.delta}
+                    )
 
                 # When the agent updates
                 elif event.type == "agent_updated_stream_event":
@@ -67,84 +181,105 @@ async def handle_post_chat_stream(agent_chat_request: AgentChatRequest):
                 # When items are generated
                 elif event.type == "run_item_stream_event":
                     if event.item.type == "tool_call_item":
-                        yield json.dumps(
+                        yield format_stream_event(
                             {"type": "tool_name", "content": event.item.raw_item.name}
                         )
-                        yield json.dumps(
+                        yield format_stream_event(
                             {
                                 "type": "tool_arguments",
                                 "content": event.item.raw_item.arguments,
                             }
                         )
                     elif event.item.type == "tool_call_output_item":
-                        yield json.dumps(
+                        yield format_stream_event(
                             {"type": "tool_output", "content": event.item.output}
                         )
                     # When final answer
                     elif event.item.type == "message_output_item":
-                        yield json.dumps(
-                            {
-                                "type": "final_answer",
-                                "content": ItemHelpers.text_message_output(event.item),
-                            }
+                        final_answer = ItemHelpers.text_message_output(event.item)
+                        answer.append(final_answer)
+                        yield format_stream_event(
+                            {"type": "final_answer", "content": final_answer}
                         )
                     else:
                         # Ignore other event types
                         pass
-        else:
-            completion = client.chat.completions.create(
-                model=config.OPENAI_AGENT_MODEL,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": GAURDRAIL_FAIL_PROMPT.format(
-                            query=agent_chat_request.query
-                        ),
-                    },
-                ],
-                stream=True,
+        except GuardrailTripped:
+            outcome = "refused"
+            async for content in stream_refusal(query=agent_chat_request.query):
+                answer.append(content)
+                yield format_stream_event({"type": "answer", "content": content})
+        except ModelUnavailable:
+            # The response has started, the error is sent as the last event
+            TURNS.inc(channel="chat_stream", outcome="unavailable")
+            yield format_stream_event(
+                {"type": "error", "content": config.ERROR_MESSAGE}
             )
-            for chunk in completion:
-                if (
-                    chunk.choices[0].delta.content is not None
-                    and chunk.choices[0].delta.content != ""
-                ):
-                    yield json.dumps(
-                        {"type": "answer", "content": chunk.choices[0].delta.content}
+            return
+        except Exception:
+            TURNS.inc(channel="chat_stream", outcome="error")
+            raise
+        TURNS.inc(channel="chat_stream", outcome=outcome)
+
+        if session_state is not None and answer:
+            # The request's session may already be closed once streaming starts
+            with timed("persistence"):
+                session_db = await get_database_session()
+                try:
+                    await save_session_turn(
+                        db=session_db,
+                        state=session_state,
+                        query=agent_chat_request.query,
+                        response="".join(answer),
                     )
+                finally:
+                    await session_db.close()
 
-    return StreamingResponse(generate(), media_type="application/json")
+    return StreamingResponse(
+        generate(), media_type=STREAM_MEDIA_TYPES[config.STREAM_TRANSPORT]
+    )
 
 
 @router.post("/chat", response_model=AgentChatResponse)
-async def handle_post_chat(agent_chat_request: AgentChatRequest):
-    formatted_chat_history = format_chat_history(agent_chat_request=agent_chat_request)
-
-    input_checks = await Runner.run(
-        starting_agent=guardrail_agent, input=formatted_chat_history
-    )
-
-    final_output = input_checks.final_output_as(TableBookingOutput)
+async def handle_post_chat(
+    agent_chat_request: AgentChatRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_database),
+    redis_pool: ArqRedis = Depends(get_redis_pool),
+):
+    with timed("history_fetch"):
+        formatted_chat_history, session_state = await build_agent_input(
+            db=db,
+            agent_chat_request=agent_chat_request,
+            background_tasks=background_tasks,
+        )
 
-    if final_output.is_table_booking:
-        result = await Runner.run(
-            starting_agent=table_booking_agent,
+    outcome = "answered"
+    try:
+        response = await run_table_booking_agent(
             input=formatted_chat_history,
-            context=UserInfo(uid=agent_chat_request.user_id),
+            context=UserInfo(uid=agent_chat_request.user_id, redis_pool=redis_pool),
+            mode=config.GUARDRAIL_MODE_CHAT,
         )
-        return AgentChatResponse(type="text", content=result.final_output)
-    else:
-        completion = await async_client.chat.completions.create(
-            model=config.OPENAI_AGENT_MODEL,
-            messages=[
-                {
-                    "role": "user",
-                    "content": GAURDRAIL_FAIL_PROMPT.format(
-                        query=agent_chat_request.query
-                    ),
-                },
-            ],
-        )
-        return AgentChatResponse(
-            type="text", content=completion.choices[0].message.content
+    except GuardrailTripped:
+        outcome = "refused"
+        response = await get_refusal(query=agent_chat_request.query)
+    except ModelUnavailable:
+        TURNS.inc(channel="chat", outcome="unavailable")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=config.ERROR_MESSAGE,
         )
+    except Exception:
+        TURNS.inc(channel="chat", outcome="error")
+        raise
+    TURNS.inc(channel="chat", outcome=outcome)
+    if session_state is not None:
+        with timed("persistence"):
+            await save_session_turn(
+                db=db,
+                state=session_state,
+                query=agent_chat_request.query,
+                response=response,
+            )
+    return AgentChatResponse(type="text", content=response)
@@ -1,11 +1,53 @@
-from fastapi import APIRouter, status
+from fastapi import APIRouter, Request, Response, status
 
-from src.schemas.schemas import HealthResponse
+from src.queue import get_redis_pool_stats
+from src.repositories.user_repository import user_id_cache
+from src.schemas.schemas import HealthResponse, ReadinessResponse
+from src.utils.availability_cache import availability_cache
 from src import config
+from src import logging
 
 router = APIRouter(prefix=f"/api/{config.API_VERSION}", tags=["HOME"])
 
+logger = logging.getLogger(__name__)
+
 
 @router.get("/health", response_model=HealthResponse)
 async def get_health():
     return HealthResponse(message="ALL IS WELL", status=status.HTTP_200_OK)
+
+
+@router.get("/health/ready", response_model=ReadinessResponse)
+async def get_readiness(request: Request, response: Response):
+    redis_pool = request.app.state.redis_pool
+    pool_stats = get_redis_pool_stats(redis_pool)
+    user_cache_stats = user_id_cache.get_stats()
+    availability_cache_stats = availability_cache.get_stats()
+    try:
+        await redis_pool.ping()
+    except Exception as e:
+        logger.error(f"Redis is not reachable: {str(e)}")
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return ReadinessResponse(
+            message="REDIS UNAVAILABLE",
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            redis_pool=pool_stats,
+            user_cache=user_cache_stats,
+            availability_cache=availability_cache_stats,
+        )
+    if pool_stats["saturation"] >= 1:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return ReadinessResponse(
+            message="REDIS POOL SATURATED",
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            redis_pool=pool_stats,
+            user_cache=user_cache_stats,
+            availability_cache=availability_cache_stats,
+        )
+    return ReadinessResponse(
+        message="READY",
+        status=status.HTTP_200_OK,
+        redis_pool=pool_stats,
+        user_cache=user_cache_stats,
+        availability_cache=availability_cache_stats,
+    )
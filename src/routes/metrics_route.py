@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+
+from src.utils.metrics import (
+    load_published_snapshots,
+    process_name,
+    registry,
+    render_metrics,
+)
+from src import config
+from src import logging
+
+router = APIRouter(prefix=f"/api/{config.API_VERSION}", tags=["HOME"])
+
+logger = logging.getLogger(__name__)
+
+PROCESS_NAME = process_name("api")
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    """Metrics of this process and of the workers, in the Prometheus text format"""
+    snapshots = [(PROCESS_NAME, registry.snapshot())]
+    try:
+        snapshots.extend(await load_published_snapshots(request.app.state.redis_pool))
+    except Exception as e:
+        logger.error(f"Unable to load the worker metrics: {str(e)}")
+    return PlainTextResponse(
+        render_metrics(snapshots), media_type="text/plain; version=0.0.4"
+    )
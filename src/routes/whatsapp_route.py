@@ -1,23 +1,58 @@
+import asyncio
 import hmac
 import hashlib
-import json
+import time
+from datetime import date
 from typing import Dict, Any
 
-from agents import Runner
 from arq import ArqRedis
 from fastapi import APIRouter, HTTPException, Request, Query, Depends
 import httpx
-from sqlalchemy import select
-from openai import AsyncOpenAI
+from pydantic import ValidationError
 
 from src import config
 from src import logging
-from src.custom_agents.table_booking_agent import table_booking_agent
+from src.custom_agents.agent_runner import GuardrailTripped, run_table_booking_turn
 from src.database import get_database_session
-from src.models.chat_model import Message, User
-from src.custom_agents.guard_rail_agent import guardrail_agent
-from src.schemas.schemas import TableBookingOutput, UserInfo
-from src.utils.prompts import GAURDRAIL_FAIL_PROMPT
+from src.queue import (
+    MAILBOX_LOCK_KEY_PREFIX,
+    InboundSpool,
+    get_inbound_spool,
+    get_redis_pool,
+    has_mail,
+    ingest_inbound_messages,
+    pop_mailbox,
+    wait_for_mailbox_quiet,
+)
+from src.repositories.booking_repository import booking_reference, digits_only
+from src.repositories.message_repository import build_turn_rows, save_turn
+from src.repositories.user_repository import get_user_id
+from src.repositories.waitlist_repository import promote_waitlist
+from src.schemas.schemas import UserInfo
+from src.schemas.whatsapp_schemas import WhatsAppWebhookPayload
+from src.utils.conversation_memory import (
+    WHATSAPP_CONVERSATION_PREFIX,
+    build_window,
+    get_stored_turns,
+    refresh_stored_summary,
+)
+from src.utils.metrics import (
+    RESPONSE_CACHE_LOOKUPS,
+    RESPONSE_CACHE_SAVED_SECONDS,
+    STAGE_SECONDS,
+    TURNS,
+    timed,
+)
+from src.utils.availability_index import (
+    availability_index,
+    slot_to_time,
+    time_to_slot,
+)
+from src.utils.openai_client import ModelUnavailable
+from src.utils.refusal import get_refusal
+from src.utils.relative_dates import local_now
+from src.utils.response_cache import response_cache
+from src.utils.whatsapp_sender import WhatsAppSender
 
 router = APIRouter(prefix=f"/api/{config.API_VERSION}/whatsapp", tags=["WhatsApp"])
 
@@ -30,9 +65,9 @@ async def handle_get_webhook(
     hub_verify_token: str = Query(None, alias="hub.verify_token"),
     hub_challenge: str = Query(None, alias="hub.challenge"),
 ):
-    logger.info(hub_challenge)
-    logger.info(hub_mode)
-    logger.info(hub_verify_token)
+    logger.debug(hub_challenge)
+    logger.debug(hub_mode)
+    logger.debug(hub_verify_token)
     if hub_mode == "subscribe" and hub_verify_token == config.VERIFY_TOKEN:
         logger.info("Webhook verified successfully")
         return int(hub_challenge)
@@ -53,154 +88,260 @@ def verify_webhook_signature(payload: bytes, signature: str) -> bool:
     return hmac.compare_digest(f"sha256={expected_signature}", signature)
 
 
-GRAPH_API_VERSION = "v22.0"
-GRAPH_API_URL = f"https://graph.facebook.com/{GRAPH_API_VERSION}"
+async def send_whatsapp_message(
+    sender: WhatsAppSender, phone_number: str, message: str
+) -> Dict[str, Any]:
+    try:
+        return await sender.send_text(phone_number=phone_number, message=message)
+    except httpx.HTTPStatusError as e:
+        logger.error(
+            f"HTTP error sending message: {e.response.status_code} - {e.response.text}"
+        )
+        raise HTTPException(status_code=e.response.status_code, detail=e.response.text)
+    except Exception as e:
+        logger.error(f"Error sending message: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 
-async_client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
+async def refresh_whatsapp_summary(ctx: Any, user_id: int, from_number: str) -> None:
+    """Fold the oldest turns of a WhatsApp conversation into its summary"""
+    await refresh_stored_summary(
+        user_id=user_id,
+        conversation_id=f"{WHATSAPP_CONVERSATION_PREFIX}{from_number}",
+    )
+    return None
 
 
-async def send_whatsapp_message(phone_number: str, message: str) -> Dict[str, Any]:
-    url = f"{GRAPH_API_URL}/{config.PHONE_NUMBER_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {config.ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": phone_number,
-        "type": "text",
-        "text": {"body": message},
-    }
-    async with httpx.AsyncClient() as client:
+async def promote_waitlist_entries(
+    ctx: Any, restaurant_id: int, booking_date: str, start_slot: int, end_slot: int
+) -> None:
+    """Book the waitlist entries a cancelled booking makes room for, and tell them"""
+    restaurant = availability_index.restaurants.get(restaurant_id)
+    if restaurant is None:
+        logger.error(f"Restaurant {restaurant_id} is not in the availability index")
+        return None
+    booking_day = date.fromisoformat(booking_date)
+    db = await get_database_session()
+    try:
+        promoted = await promote_waitlist(
+            db=db,
+            redis_pool=ctx["redis"],
+            restaurant=restaurant,
+            booking_date=booking_day,
+            start_slot=start_slot,
+            end_slot=end_slot,
+            scan=config.WAITLIST_PROMOTION_SCAN,
+        )
+    finally:
+        await db.close()
+    for entry, booking in promoted:
+        booking_slot = time_to_slot(booking.start_time)
+        availability_index.add_booking(
+            restaurant_id=restaurant_id,
+            table_id=booking.table_id,
+            booking_date=booking_day,
+            start_slot=booking_slot,
+            end_slot=booking_slot + restaurant.booking_slots,
+        )
+        message = (
+            f"Good news {entry.customer_name}, a table for {entry.party_size} at "
+            f"{restaurant.name} on {booking_day.strftime('%d/%m/%Y')} at "
+            f"{slot_to_time(booking_slot)} is now booked for you from the waitlist. "
+            f"Your booking reference is #{booking_reference(booking.id)}."
+        )
         try:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            logger.error(
-                f"HTTP error sending message: {e.response.status_code} - {e.response.text}"
-            )
-            raise HTTPException(
-                status_code=e.response.status_code, detail=e.response.text
+            await send_whatsapp_message(
+                sender=ctx["whatsapp_sender"],
+                phone_number=digits_only(entry.customer_phone),
+                message=message,
             )
-        except Exception as e:
-            logger.error(f"Error sending message: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e))
+        except HTTPException:
+            # The booking stands, the customer can still ask for it by phone number
+            logger.error(f"Unable to notify waitlist entry {entry.entry_id}")
+    logger.info(f"Promoted {len(promoted)} waitlist entries at {restaurant.name}")
+    return None
 
 
-async def process_whatsapp_message(ctx: Any, from_number: str, query: str) -> None:
+async def handle_whatsapp_turn(ctx: Any, from_number: str, query: str) -> None:
+    outcome = "answered"
     try:
         db = await get_database_session()
-        logger.info("Creating a new database session...")
-
-        logger.info("Getting DB User...")
-        result = await db.execute(select(User).filter(User.whatsapp_id == from_number))
-        db_user = result.scalars().first()
-        if not db_user:
-            db_user = User(whatsapp_id=from_number)
-            db.add(db_user)
-            await db.commit()
-            await db.refresh(db_user)
-        logger.info(db_user)
-
-        logger.info("Getting previous messages...")
-        result = await db.execute(
-            select(Message)
-            .filter(Message.user_id == db_user.id)
-            .order_by(Message.created_at.desc())
-            .limit(config.CHAT_HISTORY_LIMIT)
-        )
-        chat_history = result.scalars().all()
-        formatted_chat_history = [
-            {"role": msg.role.value, "content": msg.content} for msg in chat_history
-        ]
-        formatted_chat_history.append({"role": "user", "content": query})
-        logger.info(formatted_chat_history)
-
-        logger.info("Asking assistant...")
-        input_checks = await Runner.run(
-            starting_agent=guardrail_agent, input=formatted_chat_history
-        )
-        final_output = input_checks.final_output_as(TableBookingOutput)
-        logger.info("Gaurdrail response:")
-        logger.info(final_output)
-        if final_output.is_table_booking:
-            result = await Runner.run(
-                starting_agent=table_booking_agent,
-                input=formatted_chat_history,
-                context=UserInfo(uid=from_number),
+        logger.debug("Creating a new database session...")
+
+        logger.debug("Getting DB User...")
+        with timed("user_lookup"):
+            user_id = await get_user_id(
+                db=db,
+                whatsapp_id=from_number,
+                redis_pool=ctx["redis"] if config.USER_CACHE_REDIS else None,
             )
-            response = result.final_output
-        else:
-            completion = await async_client.chat.completions.create(
-                model=config.OPENAI_AGENT_MODEL,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": GAURDRAIL_FAIL_PROMPT.format(query=query),
-                    },
-                ],
+        logger.debug(f"User {user_id}")
+
+        logger.debug("Getting previous messages...")
+        message_writer = ctx.get("message_writer")
+        conversation_id = f"{WHATSAPP_CONVERSATION_PREFIX}{from_number}"
+        with timed("history_fetch"):
+            if message_writer is not None and message_writer.has_pending(user_id):
+                # The previous turn of the user may still be in the write-behind buffer
+                await message_writer.flush()
+            summary, turns = await get_stored_turns(
+                db=db, user_id=user_id, conversation_id=conversation_id
+            )
+        window = build_window(turns=turns, query=query, summary=summary)
+        formatted_chat_history = window.input
+        logger.debug(formatted_chat_history)
+        logger.debug(f"Prompt of {window.prompt_tokens} tokens")
+
+        cached, cache_query = None, None
+        # Only questions opening a conversation are answered alike for everyone,
+        # later ones may lean on the date or party size given earlier
+        if config.RESPONSE_CACHE_ENABLED and len(formatted_chat_history) == 1:
+            cache_query = response_cache.prepare(
+                query=query, today=local_now(config.RESTAURANT_TIMEZONE).date()
+            )
+        if cache_query is not None:
+            cached = response_cache.lookup(cache_query)
+            RESPONSE_CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+
+        logger.debug("Asking assistant...")
+        try:
+            if cached is not None:
+                outcome = "cached"
+                response = cached.response
+                RESPONSE_CACHE_SAVED_SECONDS.inc(cached.cost)
+            else:
+                start = time.perf_counter()
+                reply = await run_table_booking_turn(
+                    input=formatted_chat_history,
+                    context=UserInfo(uid=from_number, redis_pool=ctx["redis"]),
+                    mode=config.GUARDRAIL_MODE_WHATSAPP,
+                )
+                response = reply.output
+                if cache_query is not None:
+                    response_cache.store(
+                        query=cache_query,
+                        response=response,
+                        tool_calls=reply.tool_calls,
+                        cost=time.perf_counter() - start,
+                    )
+        except GuardrailTripped as e:
+            logger.debug("Gaurdrail response:")
+            logger.debug(e.output)
+            outcome = "refused"
+            response = await get_refusal(query=query)
+        except ModelUnavailable as e:
+            # The customer is told rather than left without a reply, the apology
+            # is not kept in the conversation
+            logger.error(f"Model unavailable for {from_number}: {str(e)}")
+            outcome = "unavailable"
+            await send_whatsapp_message(
+                sender=ctx["whatsapp_sender"],
+                phone_number=from_number,
+                message=config.ERROR_MESSAGE,
             )
-            response = completion.choices[0].message.content
-        logger.info(response)
+            return None
+        logger.debug(response)
 
-        logger.info("Saving message...")
-        db.add(Message(user_id=db_user.id, role="user", content=query))
-        await db.commit()
-        db.add(Message(user_id=db_user.id, role="assistant", content=response))
-        await db.commit()
+        if message_writer is None:
+            logger.debug("Saving message...")
+            with timed("persistence"):
+                await save_turn(db=db, user_id=user_id, query=query, response=response)
+
+        with timed("whatsapp_send"):
+            await send_whatsapp_message(
+                sender=ctx["whatsapp_sender"],
+                phone_number=from_number,
+                message=response,
+            )
 
-        await send_whatsapp_message(phone_number=from_number, message=response)
+        if message_writer is not None:
+            message_writer.add(
+                build_turn_rows(user_id=user_id, query=query, response=response)
+            )
+
+        if window.needs_summary:
+            # Its own job so the summary does not hold the sender's next turn, the
+            # job id keeps one refresh per conversation queued or running
+            await ctx["redis"].enqueue_job(
+                "refresh_whatsapp_summary",
+                user_id,
+                from_number,
+                _job_id=f"summary:{conversation_id}",
+            )
     except Exception as e:
+        outcome = "error"
         logger.error(f"Error processing message: {str(e)}")
     finally:
+        TURNS.inc(channel="whatsapp", outcome=outcome)
         await db.close()
-        logger.info("Database session closed...")
+        logger.debug("Database session closed...")
         return None
 
 
+async def process_whatsapp_message(ctx: Any, from_number: str) -> None:
+    """Answer the pending messages of a sender as one turn, one job per sender at a time"""
+    redis_pool = ctx["redis"]
+    # The job is due after the debounce window, the wait is counted from then
+    STAGE_SECONDS.observe(
+        max(0.0, time.time() - ctx["score"] / 1000), stage="queue_wait"
+    )
+    lock = redis_pool.lock(
+        f"{MAILBOX_LOCK_KEY_PREFIX}{from_number}",
+        timeout=config.WORKER_JOB_TIMEOUT_SECONDS,
+    )
+    # The mailbox is checked again after releasing the lock, as a job for a message
+    # that arrived meanwhile found the lock taken and left it to us
+    while await has_mail(redis_pool=redis_pool, from_number=from_number):
+        if not await lock.acquire(blocking=False):
+            logger.info(f"Messages from {from_number} are handled by another job")
+            return None
+        try:
+            await wait_for_mailbox_quiet(redis_pool=redis_pool, from_number=from_number)
+            queries = await pop_mailbox(redis_pool=redis_pool, from_number=from_number)
+            if queries:
+                logger.info(f"Merged {len(queries)} messages from {from_number}")
+                await handle_whatsapp_turn(
+                    ctx=ctx, from_number=from_number, query="\n".join(queries)
+                )
+        finally:
+            await lock.release()
+    return None
+
+
 @router.post("/webhook", status_code=200)
 async def handle_post_webhook(
-    request: Request, redis_pool: ArqRedis = Depends(config.get_redis_pool)
+    request: Request,
+    redis_pool: ArqRedis = Depends(get_redis_pool),
+    spool: InboundSpool = Depends(get_inbound_spool),
 ):
     try:
         body = await request.body()
-        signature = request.headers.get("X-Hub-Signature-256", "")
-        if config.APP_SECRET and not verify_webhook_signature(body, signature):
-            logger.warning("Invalid webhook signature")
-            raise HTTPException(status_code=403, detail="Invalid signature")
-        data = json.loads(body.decode("utf-8"))
-        if "entry" in data:
-            for entry in data["entry"]:
-                if "changes" in entry:
-                    for change in entry["changes"]:
-                        if change.get("field") == "messages":
-                            value = change.get("value", {})
-                            if "messages" in value:
-                                message = value["messages"][0]
-                                from_number = message.get("from")
-                                message_type = message.get("type")
-                                content = None
-                                if message_type == "text":
-                                    content = message.get("text", {}).get("body", "")
-                                if content:
-                                    logger.info(
-                                        f"Received message from {from_number}: {content}"
-                                    )
-                                    job = await redis_pool.enqueue_job(
-                                        "process_whatsapp_message", from_number, content
-                                    )
-                                    logger.info(f"Job Id: {job.job_id}")
-                            elif "statuses" in value:
-                                for status in value["statuses"]:
-                                    logger.info(
-                                        f"Message status update: {status.get('status')} for message {status.get('id')}"
-                                    )
+        with timed("webhook_parse"):
+            signature = request.headers.get("X-Hub-Signature-256", "")
+            if config.APP_SECRET and not verify_webhook_signature(body, signature):
+                logger.warning("Invalid webhook signature")
+                raise HTTPException(status_code=403, detail="Invalid signature")
+            payload = WhatsAppWebhookPayload.model_validate_json(body)
+            inbound_messages = payload.get_inbound_messages()
+        for status in payload.get_statuses():
+            logger.debug(
+                f"Message status update: {status.status} for message {status.id}"
+            )
+        if inbound_messages:
+            with timed("enqueue"):
+                await ingest_inbound_messages(
+                    redis_pool=redis_pool, spool=spool, messages=inbound_messages
+                )
         return "OK"
-    except json.JSONDecodeError:
-        logger.error("Invalid JSON in webhook payload")
-        raise HTTPException(status_code=400, detail="Invalid JSON")
+    except HTTPException:
+        raise
+    except ValidationError as e:
+        logger.error(f"Invalid webhook payload: {e.error_count()} errors")
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    except asyncio.QueueFull:
+        # Not acking makes Meta redeliver the webhook later
+        logger.error("Webhook spool is full")
+        raise HTTPException(status_code=503, detail="Busy")
     except Exception as e:
         logger.error(f"Error processing webhook: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
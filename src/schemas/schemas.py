@@ -1,13 +1,48 @@
-from typing import List
+from typing import Any, List, Optional
 
 from pydantic import BaseModel, Field
 
+from src import config
+
 
 class HealthResponse(BaseModel):
     message: str
     status: int
 
 
+class RedisPoolStats(BaseModel):
+    in_use: int
+    available: int
+    max_connections: int
+    saturation: float
+
+
+class UserCacheStats(BaseModel):
+    local_hits: int
+    redis_hits: int
+    misses: int
+    hit_rate: float
+    size: int
+
+
+class AvailabilityCacheStats(BaseModel):
+    hits: int
+    misses: int
+    stale: int
+    hit_rate: float
+    size: int
+    lookup_ms: float
+    saved_ms: float
+
+
+class ReadinessResponse(BaseModel):
+    message: str
+    status: int
+    redis_pool: RedisPoolStats
+    user_cache: UserCacheStats
+    availability_cache: AvailabilityCacheStats
+
+
 class ChatHistory(BaseModel):
     query: str
     response: str
@@ -17,6 +52,11 @@ class AgentChatRequest(BaseModel):
     query: str
     chat_history: List[ChatHistory] = Field(default_factory=list, alias=["chatHistory"])
     user_id: str = Field(alias=["userId"])
+    # When set the server keeps the conversation and chat_history is ignored. The
+    # session belongs to user_id, the client picks a random id that is hard to guess
+    session_id: Optional[str] = Field(
+        default=None, alias=["sessionId"], min_length=16, max_length=64
+    )
 
 
 class AgentChatResponse(BaseModel):
@@ -27,7 +67,18 @@ class AgentChatResponse(BaseModel):
 class TableBookingOutput(BaseModel):
     is_table_booking: bool
     reasoning: str
+    confidence: float = Field(description="Confidence of the decision, from 0 to 1")
+
+
+class InboundMessage(BaseModel):
+    message_id: str
+    from_number: str
+    text: str
 
 
 class UserInfo(BaseModel):
     uid: str
+    # ArqRedis pool of the process running the agent, used by the waitlist tools
+    redis_pool: Optional[Any] = Field(default=None, exclude=True, repr=False)
+    # Relative dates of the conversation are resolved in this timezone
+    timezone: str = config.RESTAURANT_TIMEZONE
@@ -0,0 +1,101 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from src.schemas.schemas import InboundMessage
+
+
+class WhatsAppText(BaseModel):
+    body: str
+
+
+class WhatsAppReply(BaseModel):
+    id: str
+    title: str
+    description: Optional[str] = None
+
+
+class WhatsAppInteractive(BaseModel):
+    type: str
+    button_reply: Optional[WhatsAppReply] = None
+    list_reply: Optional[WhatsAppReply] = None
+
+
+class WhatsAppButton(BaseModel):
+    text: str
+    payload: Optional[str] = None
+
+
+class WhatsAppMessage(BaseModel):
+    id: str
+    from_number: str = Field(alias="from")
+    timestamp: str
+    type: str
+    text: Optional[WhatsAppText] = None
+    interactive: Optional[WhatsAppInteractive] = None
+    button: Optional[WhatsAppButton] = None
+
+    def get_content(self) -> Optional[str]:
+        """Text typed by the user or the title of the button or list item they picked"""
+        if self.type == "text" and self.text:
+            return self.text.body
+        if self.type == "interactive" and self.interactive:
+            reply = self.interactive.button_reply or self.interactive.list_reply
+            return reply.title if reply else None
+        if self.type == "button" and self.button:
+            return self.button.text
+        return None
+
+
+class WhatsAppStatus(BaseModel):
+    id: str
+    status: str
+    timestamp: Optional[str] = None
+    recipient_id: Optional[str] = None
+
+
+class WhatsAppValue(BaseModel):
+    messaging_product: Optional[str] = None
+    messages: List[WhatsAppMessage] = Field(default_factory=list)
+    statuses: List[WhatsAppStatus] = Field(default_factory=list)
+
+
+class WhatsAppChange(BaseModel):
+    field: str
+    value: WhatsAppValue
+
+
+class WhatsAppEntry(BaseModel):
+    id: Optional[str] = None
+    changes: List[WhatsAppChange] = Field(default_factory=list)
+
+
+class WhatsAppWebhookPayload(BaseModel):
+    object: Optional[str] = None
+    entry: List[WhatsAppEntry] = Field(default_factory=list)
+
+    def get_inbound_messages(self) -> List[InboundMessage]:
+        inbound_messages = []
+        for entry in self.entry:
+            for change in entry.changes:
+                if change.field != "messages":
+                    continue
+                for message in change.value.messages:
+                    content = message.get_content()
+                    if content:
+                        inbound_messages.append(
+                            InboundMessage(
+                                message_id=message.id,
+                                from_number=message.from_number,
+                                text=content,
+                            )
+                        )
+        return inbound_messages
+
+    def get_statuses(self) -> List[WhatsAppStatus]:
+        return [
+            status
+            for entry in self.entry
+            for change in entry.changes
+            for status in change.value.statuses
+        ]
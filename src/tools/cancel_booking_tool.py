@@ -0,0 +1,88 @@
+from agents import FunctionTool, RunContextWrapper
+from pydantic import BaseModel, Field
+
+from src.database import get_database_session
+from src.repositories.booking_repository import cancel_booking, parse_booking_reference
+from src.repositories.restaurant_repository import reload_day
+from src.schemas.schemas import UserInfo
+from src import logging
+from src.utils.availability_index import (
+    availability_index,
+    slot_to_time,
+    time_to_slot,
+)
+from src.utils.relative_dates import DATE_FORMAT
+
+logger = logging.getLogger(__name__)
+
+
+class CancelBookingToolInput(BaseModel):
+    booking_reference: str = Field(description="Booking reference, digits after #")
+    customer_phone: str = Field(description="Contact phone number of the booking")
+
+
+async def cancel_booking_by_reference(
+    ctx: RunContextWrapper[UserInfo], args: CancelBookingToolInput
+) -> str:
+    """Cancel a booking and let the waitlist take the freed table"""
+    logger.debug("Inside the Cancel Booking.")
+    logger.debug(args)
+    logger.debug(ctx)
+    booking_id = parse_booking_reference(args.booking_reference)
+    if booking_id is None:
+        return "The booking reference should be the digits after #."
+
+    db = await get_database_session()
+    try:
+        booking = await cancel_booking(
+            db=db, booking_id=booking_id, customer_phone=args.customer_phone
+        )
+        if booking is not None:
+            await reload_day(
+                db=db,
+                index=availability_index,
+                restaurant_id=booking.restaurant_id,
+                booking_date=booking.date,
+            )
+    except Exception as e:
+        logger.error(f"Unable to cancel the booking: {str(e)}")
+        return "The booking could not be cancelled, please try again."
+    finally:
+        await db.close()
+    if booking is None:
+        return (
+            f"I could not find a booking #{args.booking_reference.lstrip('#')} "
+            f"made with the phone number {args.customer_phone}."
+        )
+
+    start_slot = time_to_slot(booking.start_time)
+    if ctx.context.redis_pool is not None:
+        await ctx.context.redis_pool.enqueue_job(
+            "promote_waitlist",
+            booking.restaurant_id,
+            booking.date.isoformat(),
+            start_slot,
+            time_to_slot(booking.end_time, end_of_day=True),
+        )
+    else:
+        logger.warning(f"No Redis pool, waitlist not promoted for booking {booking.id}")
+    return (
+        f"The booking for {booking.customer_name} on "
+        f"{booking.date.strftime(DATE_FORMAT)} at {slot_to_time(start_slot)} "
+        "is cancelled."
+    )
+
+
+async def run_cancel_booking(ctx: RunContextWrapper[UserInfo], args: str) -> str:
+    """Validate and run the cancel booking function"""
+    parsed_args = CancelBookingToolInput.model_validate_json(args)
+    return await cancel_booking_by_reference(ctx=ctx, args=parsed_args)
+
+
+CancelBookingTool = FunctionTool(
+    name="cancel_booking",
+    description="Cancel a booking by its reference and the phone number it was made with.",
+    params_json_schema=CancelBookingToolInput.model_json_schema(),
+    on_invoke_tool=run_cancel_booking,
+    strict_json_schema=False,
+)
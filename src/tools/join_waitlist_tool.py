@@ -1,45 +1,101 @@
-from random import random
-
 from agents import RunContextWrapper, FunctionTool
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 
+from src.repositories.booking_repository import booking_idempotency_key
+from src.repositories.waitlist_repository import WaitlistEntry, join_waitlist
 from src.schemas.schemas import UserInfo
 from src import logging
+from src.utils.availability_index import slot_to_time, time_to_slot
+from src.utils.relative_dates import (
+    DATE_FORMAT,
+    TIME_FORMAT,
+    is_past,
+    local_now,
+    parse_date,
+    parse_time,
+)
+from src.utils.restaurant_catalog import resolve_restaurant
 
 logger = logging.getLogger(__name__)
 
 
 class JoinWaitlistToolInput(BaseModel):
     restaurant_name: str = Field(description="Name of the restaurant to join waitlist")
-    date: str = Field(description="Desired date, format dd/mm/yyyy")
-    time: str = Field(description="Desired time, format hh:mm")
-    number_of_person: int = Field(description="Number of people in the party")
+    date: str = Field(
+        description="Desired date, format dd/mm/yyyy, or tomorrow or a weekday"
+    )
+    time: str = Field(description="Desired time, format hh:mm or like 8pm")
+    number_of_person: int = Field(ge=1, description="Number of people in the party")
     customer_name: str = Field(description="Name of the customer joining waitlist")
     customer_phone: str = Field(description="Contact phone number for notifications")
 
 
-async def join_waitlist(
+async def join_waitlist_entry(
     ctx: RunContextWrapper[UserInfo], args: JoinWaitlistToolInput
 ) -> str:
-    """Add a customer to the waiting list for a restaurant"""
-    # In a real implementation, this would call an API to add to waitlist
-    logger.info("Inside the Join Waitlist.")
-    logger.info(args)
-    logger.info(ctx)
-    waitlist_position = int(random() * 10) + 1
-    return f"""Added {args.customer_name} to the waitlist for {args.restaurant_name} on {args.date} at {args.time}. You are currently position #{waitlist_position} on 
-    the waitlist. We'll contact you at {args.customer_phone} if a table becomes available."""
+    """Add a customer to the waiting list for a restaurant, date and time"""
+    logger.debug("Inside the Join Waitlist.")
+    logger.debug(args)
+    logger.debug(ctx)
+    if ctx.context.redis_pool is None:
+        return "The waitlist is not available right now, please try again later."
+    restaurant, unresolved = resolve_restaurant(args.restaurant_name)
+    if restaurant is None:
+        return unresolved
+    now = local_now(ctx.context.timezone)
+    try:
+        booking_date = parse_date(args.date, now.date())
+        start_time = parse_time(args.time)
+    except ValueError:
+        return "The date should be dd/mm/yyyy and the time hh:mm."
+    # No table frees up for a time that has passed, and entries of past dates expire
+    # at once while the customer would be given a position
+    if is_past(booking_date, start_time, now):
+        return (
+            f"{booking_date.strftime(DATE_FORMAT)} at {start_time.strftime(TIME_FORMAT)}"
+            " has already passed, the waitlist is only for later times."
+        )
+    start_slot = time_to_slot(start_time)
+
+    entry = WaitlistEntry(
+        entry_id=booking_idempotency_key(
+            uid=ctx.context.uid,
+            restaurant_id=restaurant.id,
+            booking_date=booking_date,
+            start_slot=start_slot,
+            party_size=args.number_of_person,
+            customer_name=args.customer_name,
+            customer_phone=args.customer_phone,
+        ),
+        uid=ctx.context.uid,
+        party_size=args.number_of_person,
+        customer_name=args.customer_name,
+        customer_phone=args.customer_phone,
+    )
+    position = await join_waitlist(
+        redis_pool=ctx.context.redis_pool,
+        restaurant_id=restaurant.id,
+        booking_date=booking_date,
+        start_slot=start_slot,
+        entry=entry,
+    )
+    return f"""Added {args.customer_name} to the waitlist for {restaurant.name} on {booking_date.strftime(DATE_FORMAT)} at {slot_to_time(start_slot)}. You are currently position #{position} on 
+    the waitlist. When a table frees up it is booked for you and we'll let you know at {args.customer_phone}."""
 
 
 async def run_join_waitlist(ctx: RunContextWrapper[UserInfo], args: str) -> str:
     """Validate and run the join waitlist function"""
-    parsed_args = JoinWaitlistToolInput.model_validate_json(args)
-    return await join_waitlist(ctx=ctx, args=parsed_args)
+    try:
+        parsed_args = JoinWaitlistToolInput.model_validate_json(args)
+    except ValidationError as e:
+        error = e.errors()[0]
+        return f"Invalid {'.'.join(map(str, error['loc']))}: {error['msg']}."
+    return await join_waitlist_entry(ctx=ctx, args=parsed_args)
 
 
 JoinWaitlistTool = FunctionTool(
     name="join_waitlist",
-    description="Add a customer to the waiting list for a restaurant.",
+    description="Add a customer to the waiting list for a restaurant, or give their position when they already are on it.",
     params_json_schema=JoinWaitlistToolInput.model_json_schema(),
     on_invoke_tool=run_join_waitlist,
     strict_json_schema=False,
@@ -0,0 +1,68 @@
+from agents import RunContextWrapper, FunctionTool
+from pydantic import ValidationError
+
+from src.repositories.booking_repository import booking_idempotency_key
+from src.repositories.waitlist_repository import leave_waitlist, waitlist_key
+from src.schemas.schemas import UserInfo
+from src import logging
+from src.tools.join_waitlist_tool import JoinWaitlistToolInput
+from src.utils.availability_index import slot_to_time, time_to_slot
+from src.utils.relative_dates import DATE_FORMAT, local_now, parse_date, parse_time
+from src.utils.restaurant_catalog import resolve_restaurant
+
+logger = logging.getLogger(__name__)
+
+
+async def leave_waitlist_entry(
+    ctx: RunContextWrapper[UserInfo], args: JoinWaitlistToolInput
+) -> str:
+    """Remove a customer from the waiting list they joined with the same details"""
+    logger.debug("Inside the Leave Waitlist.")
+    logger.debug(args)
+    logger.debug(ctx)
+    if ctx.context.redis_pool is None:
+        return "The waitlist is not available right now, please try again later."
+    restaurant, unresolved = resolve_restaurant(args.restaurant_name)
+    if restaurant is None:
+        return unresolved
+    try:
+        booking_date = parse_date(args.date, local_now(ctx.context.timezone).date())
+        start_slot = time_to_slot(parse_time(args.time))
+    except ValueError:
+        return "The date should be dd/mm/yyyy and the time hh:mm."
+
+    removed = await leave_waitlist(
+        redis_pool=ctx.context.redis_pool,
+        key=waitlist_key(restaurant.id, booking_date, start_slot),
+        entry_id=booking_idempotency_key(
+            uid=ctx.context.uid,
+            restaurant_id=restaurant.id,
+            booking_date=booking_date,
+            start_slot=start_slot,
+            party_size=args.number_of_person,
+            customer_name=args.customer_name,
+            customer_phone=args.customer_phone,
+        ),
+    )
+    if not removed:
+        return f"{args.customer_name} is not on the waitlist for {restaurant.name} on {booking_date.strftime(DATE_FORMAT)} at {slot_to_time(start_slot)}."
+    return f"Removed {args.customer_name} from the waitlist for {restaurant.name} on {booking_date.strftime(DATE_FORMAT)} at {slot_to_time(start_slot)}."
+
+
+async def run_leave_waitlist(ctx: RunContextWrapper[UserInfo], args: str) -> str:
+    """Validate and run the leave waitlist function"""
+    try:
+        parsed_args = JoinWaitlistToolInput.model_validate_json(args)
+    except ValidationError as e:
+        error = e.errors()[0]
+        return f"Invalid {'.'.join(map(str, error['loc']))}: {error['msg']}."
+    return await leave_waitlist_entry(ctx=ctx, args=parsed_args)
+
+
+LeaveWaitlistTool = FunctionTool(
+    name="leave_waitlist",
+    description="Remove a customer from the waiting list, with the details they joined it with.",
+    params_json_schema=JoinWaitlistToolInput.model_json_schema(),
+    on_invoke_tool=run_leave_waitlist,
+    strict_json_schema=False,
+)
@@ -1,20 +1,42 @@
-from random import random
-
 from agents import FunctionTool, RunContextWrapper
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 
+from src import config
+from src.database import get_database_session
+from src.repositories.booking_repository import (
+    booking_idempotency_key,
+    booking_reference,
+    reserve_booking,
+)
 from src.schemas.schemas import UserInfo
 from src import logging
+from src.tools.table_availability_tool import format_alternatives, upcoming
+from src.utils.availability_index import (
+    availability_index,
+    slot_to_time,
+    time_to_slot,
+)
+from src.utils.relative_dates import (
+    DATE_FORMAT,
+    TIME_FORMAT,
+    is_past,
+    local_now,
+    parse_date,
+    parse_time,
+)
+from src.utils.restaurant_catalog import resolve_restaurant
 
 logger = logging.getLogger(__name__)
 
 
 class SaveBookingToolInput(BaseModel):
     restaurant_name: str = Field(description="Name of the restaurant to book")
-    date: str = Field(description="Reservation date, format dd/mm/yyyy")
-    time: str = Field(description="Reservation time, format hh:mm")
+    date: str = Field(
+        description="Reservation date, format dd/mm/yyyy, or tomorrow or a weekday"
+    )
+    time: str = Field(description="Reservation time, format hh:mm or like 8pm")
     number_of_person: int = Field(
-        description="Number of people to book reservation for"
+        ge=1, description="Number of people to book reservation for"
     )
     customer_name: str = Field(description="Name of the customer making the booking")
     customer_phone: str = Field(description="Contact phone number for the booking")
@@ -23,25 +45,119 @@ class SaveBookingToolInput(BaseModel):
 async def save_booking(
     ctx: RunContextWrapper[UserInfo], args: SaveBookingToolInput
 ) -> str:
-    """Save a confirmed booking to the reservation system"""
-    # In a real implementation, this would call an API to create the booking
-    logger.info("Inside the Save Booking.")
-    logger.info(args)
-    logger.info(ctx)
-    booking_id = int(random() * 10000)
-    return f"""Booking confirmed at {args.restaurant_name} for {args.customer_name} on {args.date} at {args.time} for {args.number_of_person} people. Your booking reference 
-    is #{booking_id}."""
+    """Reserve a table in the database, at most once per customer and booking"""
+    logger.debug("Inside the Save Booking.")
+    logger.debug(args)
+    logger.debug(ctx)
+    # A booking is only made for a restaurant named exactly or by the start of its name
+    restaurant, unresolved = resolve_restaurant(args.restaurant_name, allow_fuzzy=False)
+    if restaurant is None:
+        return unresolved
+    now = local_now(ctx.context.timezone)
+    try:
+        booking_date = parse_date(args.date, now.date())
+        start_time = parse_time(args.time)
+    except ValueError:
+        return "The date should be dd/mm/yyyy and the time hh:mm."
+    if is_past(booking_date, start_time, now):
+        return (
+            f"{booking_date.strftime(DATE_FORMAT)} at {start_time.strftime(TIME_FORMAT)}"
+            " has already passed, bookings can only be made for a later time."
+        )
+    start_slot = time_to_slot(start_time)
+    if (
+        start_slot < restaurant.open_slot
+        or start_slot + restaurant.booking_slots > restaurant.close_slot
+    ):
+        return (
+            f"{restaurant.name} takes bookings from {slot_to_time(restaurant.open_slot)}"
+            f" to {slot_to_time(restaurant.close_slot - restaurant.booking_slots)}."
+        )
+    if not any(table.capacity >= args.number_of_person for table in restaurant.tables):
+        return f"{restaurant.name} has no table for {args.number_of_person} people."
+
+    db = await get_database_session()
+    try:
+        result = await reserve_booking(
+            db=db,
+            restaurant=restaurant,
+            booking_date=booking_date,
+            start_slot=start_slot,
+            party_size=args.number_of_person,
+            customer_name=args.customer_name,
+            customer_phone=args.customer_phone,
+            idempotency_key=booking_idempotency_key(
+                uid=ctx.context.uid,
+                restaurant_id=restaurant.id,
+                booking_date=booking_date,
+                start_slot=start_slot,
+                party_size=args.number_of_person,
+                customer_name=args.customer_name,
+                customer_phone=args.customer_phone,
+            ),
+        )
+    except Exception as e:
+        logger.error(f"Unable to save the booking: {str(e)}")
+        return "The booking could not be saved, please try again."
+    finally:
+        await db.close()
+
+    if result is None:
+        alternatives = upcoming(
+            availability_index.find_alternatives(
+                restaurant_id=restaurant.id,
+                booking_date=booking_date,
+                party_size=args.number_of_person,
+                preferred_slot=start_slot,
+                days=config.AVAILABILITY_ALTERNATIVE_DAYS,
+                limit=config.AVAILABILITY_ALTERNATIVES_LIMIT,
+            ),
+            now,
+        )
+        unavailable = (
+            f"No table for {args.number_of_person} is free at {restaurant.name} "
+            f"on {booking_date.strftime(DATE_FORMAT)} at {slot_to_time(start_slot)}"
+            " anymore."
+        )
+        if not alternatives:
+            return f"{unavailable} The customer can join the waitlist."
+        return (
+            f"{unavailable} The closest available times are "
+            f"{format_alternatives(alternatives, booking_date)}."
+        )
+
+    booking = result.booking
+    if result.created:
+        # The booking id is not passed, ids of other processes' bookings committed
+        # after this one can be lower and the refresher still has to load them
+        availability_index.add_booking(
+            restaurant_id=restaurant.id,
+            table_id=booking.table_id,
+            booking_date=booking_date,
+            start_slot=start_slot,
+            end_slot=start_slot + restaurant.booking_slots,
+        )
+    return (
+        f"Booking confirmed at {restaurant.name} for {booking.customer_name} on "
+        f"{booking_date.strftime(DATE_FORMAT)} at {slot_to_time(start_slot)} for "
+        f"{booking.party_size} people. "
+        f"Your booking reference is #{booking_reference(booking.id)}."
+    )
 
 
 async def run_save_booking(ctx: RunContextWrapper[UserInfo], args: str) -> str:
     """Validate and run the save booking function"""
-    parsed_args = SaveBookingToolInput.model_validate_json(args)
+    try:
+        parsed_args = SaveBookingToolInput.model_validate_json(args)
+    except ValidationError as e:
+        error = e.errors()[0]
+        return f"Invalid {'.'.join(map(str, error['loc']))}: {error['msg']}."
     return await save_booking(ctx=ctx, args=parsed_args)
 
 
 SaveBookingTool = FunctionTool(
     name="save_booking",
-    description="Confirm and save the booking at the restaurant.",
+    description="Confirm and save the booking at the restaurant. Saving the same booking again returns the first confirmation.",
     params_json_schema=SaveBookingToolInput.model_json_schema(),
     on_invoke_tool=run_save_booking,
     strict_json_schema=False,
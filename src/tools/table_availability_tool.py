@@ -1,10 +1,28 @@
+from datetime import date, datetime, time
 from typing import List
 
 from agents import FunctionTool, RunContextWrapper
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 
+from src import config
 from src.schemas.schemas import UserInfo
 from src import logging
+from src.utils.availability_cache import availability_cache
+from src.utils.availability_index import (
+    SlotOption,
+    slot_start_time,
+    slot_to_time,
+    time_to_slot,
+)
+from src.utils.relative_dates import (
+    DATE_FORMAT,
+    TIME_FORMAT,
+    is_past,
+    local_now,
+    parse_date,
+    parse_time,
+)
+from src.utils.restaurant_catalog import resolve_restaurant
 
 logger = logging.getLogger(__name__)
 
@@ -13,36 +31,118 @@ class FetchTableAvailabilityToolInput(BaseModel):
     restaurant_name: str = Field(
         description="Name of the restaurant to get table information"
     )
-    date: str = Field(description="Reservation date, format dd/mm/yyyy")
+    date: str = Field(
+        description="Reservation date, format dd/mm/yyyy, or tomorrow or a weekday"
+    )
     time_window: List[str] = Field(
-        description="Reservation time window, start time, end time, end time can be 00:00, format hh:mm"
+        description="Reservation time window, start time, end time, end time can be 00:00, format hh:mm or like 8pm"
     )
     number_of_person: int = Field(
-        description="Number of people to book reservation for"
+        ge=1, description="Number of people to book reservation for"
+    )
+
+
+def _format_times(options: List[SlotOption]) -> str:
+    return ", ".join(slot_to_time(option.start_slot) for option in options)
+
+
+def upcoming(options: List[SlotOption], now: datetime) -> List[SlotOption]:
+    """The options that have not started yet, earlier ones of today are skipped"""
+    return [
+        option
+        for option in options
+        if not is_past(option.date, slot_start_time(option.start_slot), now)
+    ]
+
+
+def format_alternatives(options: List[SlotOption], requested: date) -> str:
+    by_date = {}
+    for option in options:
+        by_date.setdefault(option.date, []).append(option)
+    return "; ".join(
+        f"{_format_times(day_options)}"
+        f"{'' if day == requested else ' on ' + day.strftime(DATE_FORMAT)}"
+        for day, day_options in by_date.items()
     )
 
 
 async def fetch_table_availability(
     ctx: RunContextWrapper[UserInfo], args: FetchTableAvailabilityToolInput
 ) -> str:
-    """Call the actual API here"""
-    logger.info("Inside the Fetch Table Availability.")
-    logger.info(args)
-    logger.info(ctx)
-    return f"We have seats available at {args.restaurant_name} for {args.date}."
+    """Look the request up in the in-memory availability index, through its cache"""
+    logger.debug("Inside the Fetch Table Availability.")
+    logger.debug(args)
+    logger.debug(ctx)
+    restaurant, unresolved = resolve_restaurant(args.restaurant_name)
+    if restaurant is None:
+        return unresolved
+    now = local_now(ctx.context.timezone)
+    try:
+        booking_date = parse_date(args.date, now.date())
+        window_start = parse_time(args.time_window[0])
+        window_end = parse_time(args.time_window[-1])
+    except (ValueError, IndexError):
+        return "The date should be dd/mm/yyyy and the time window hh:mm, hh:mm."
+    # 00:00 ends the window at midnight, the end of the requested date
+    if booking_date < now.date() or (
+        window_end != time(0) and is_past(booking_date, window_end, now)
+    ):
+        return (
+            f"{booking_date.strftime(DATE_FORMAT)} until"
+            f" {window_end.strftime(TIME_FORMAT)} has already passed, only later"
+            " times can be booked."
+        )
+    start_slot = time_to_slot(window_start)
+    if booking_date == now.date():
+        # The slot in progress has already started
+        start_slot = max(start_slot, time_to_slot(now.time()) + 1)
+    if not any(table.capacity >= args.number_of_person for table in restaurant.tables):
+        return f"{restaurant.name} has no table for {args.number_of_person} people."
+
+    lookup = availability_cache.lookup(
+        restaurant_id=restaurant.id,
+        booking_date=booking_date,
+        party_size=args.number_of_person,
+        window_start=start_slot,
+        window_end=time_to_slot(window_end, end_of_day=True),
+        alternative_days=config.AVAILABILITY_ALTERNATIVE_DAYS,
+        alternatives_limit=config.AVAILABILITY_ALTERNATIVES_LIMIT,
+    )
+    options = lookup.options
+    if options:
+        return (
+            f"Tables for {args.number_of_person} are available at {restaurant.name} "
+            f"on {booking_date.strftime(DATE_FORMAT)} at {_format_times(options)}."
+        )
+    alternatives = upcoming(lookup.alternatives, now)
+    unavailable = (
+        f"No table for {args.number_of_person} is available at {restaurant.name} "
+        f"on {booking_date.strftime(DATE_FORMAT)} between "
+        f"{window_start.strftime(TIME_FORMAT)} and {window_end.strftime(TIME_FORMAT)}."
+    )
+    if not alternatives:
+        return unavailable
+    return (
+        f"{unavailable} The closest available times are "
+        f"{format_alternatives(alternatives, booking_date)}."
+    )
 
 
 async def run_fetch_table_availability(
     ctx: RunContextWrapper[UserInfo], args: str
 ) -> str:
     """The arguments are passed here as a string, we need to validate it using the Pydantic Model."""
-    parsed_args = FetchTableAvailabilityToolInput.model_validate_json(args)
+    try:
+        parsed_args = FetchTableAvailabilityToolInput.model_validate_json(args)
+    except ValidationError as e:
+        error = e.errors()[0]
+        return f"Invalid {'.'.join(map(str, error['loc']))}: {error['msg']}."
     return await fetch_table_availability(ctx=ctx, args=parsed_args)
 
 
 FetchTableAvailabilityTool = FunctionTool(
     name="fetch_table_availability",
-    description="Fetch the table availability at the restaurant via API call.",
+    description="Fetch the table availability at the restaurant, with the closest available times when the window is full.",
     params_json_schema=FetchTableAvailabilityToolInput.model_json_schema(),
     on_invoke_tool=run_fetch_table_availability,
     strict_json_schema=False,
@@ -0,0 +1,145 @@
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from src import config
+from src.utils.availability_index import (
+    AvailabilityIndex,
+    SlotOption,
+    availability_index,
+)
+from src.utils.metrics import (
+    AVAILABILITY_CACHE_LOOKUPS,
+    AVAILABILITY_CACHE_SAVED_SECONDS,
+)
+
+
+class AvailabilityLookup(NamedTuple):
+    options: List[SlotOption]
+    # Only looked up when no option is within the window
+    alternatives: List[SlotOption]
+
+
+class AvailabilityCache:
+    """Availability lookups by normalized request, each kept up to ttl_seconds.
+
+    Least recently used entries are evicted beyond max_size. The key is the
+    restaurant id, date, party size and window in slots, so requests spelling the
+    restaurant or times differently share an entry. An entry keeps the index
+    versions of the restaurant's info and of the dates it read and is a miss once
+    one of them changed, so a booking saved or cancelled here, applied by the
+    refresher, or new opening hours or tables invalidate the entries of their
+    restaurant without scanning the cache.
+
+    Lookups run without awaiting, so concurrent identical ones in a process never
+    overlap and the first one's result serves the others.
+    """
+
+    def __init__(self, index: AvailabilityIndex, max_size: int, ttl_seconds: float):
+        self.index = index
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # Lookup, versions of the info and dates it read, expiry and the index time
+        self.entries: "OrderedDict[Tuple, Tuple]" = OrderedDict()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "stale": 0}
+        # Index time spent on misses, and the time the hits would have spent
+        self.lookup_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def _versions(
+        self, restaurant_id: int, booking_date: date, days: int
+    ) -> Tuple[int, ...]:
+        """Info version of the restaurant, then the versions of the dates read"""
+        return (self.index.get_info_version(restaurant_id),) + tuple(
+            self.index.get_day_version(
+                restaurant_id, booking_date + timedelta(days=day)
+            )
+            for day in range(days + 1)
+        )
+
+    def lookup(
+        self,
+        restaurant_id: int,
+        booking_date: date,
+        party_size: int,
+        window_start: int,
+        window_end: int,
+        alternative_days: int,
+        alternatives_limit: int,
+    ) -> AvailabilityLookup:
+        key = (restaurant_id, booking_date, party_size, window_start, window_end)
+        entry = self.entries.get(key)
+        if entry is not None:
+            result, versions, expires_at, cost = entry
+            if time.monotonic() < expires_at and versions == self._versions(
+                restaurant_id, booking_date, len(versions) - 2
+            ):
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self.saved_seconds += cost
+                AVAILABILITY_CACHE_LOOKUPS.inc(result="hit")
+                AVAILABILITY_CACHE_SAVED_SECONDS.inc(cost)
+                return result
+            del self.entries[key]
+            self.stats["stale"] += 1
+            AVAILABILITY_CACHE_LOOKUPS.inc(result="stale")
+        self.stats["misses"] += 1
+        AVAILABILITY_CACHE_LOOKUPS.inc(result="miss")
+
+        start = time.perf_counter()
+        options = self.index.find_slots(
+            restaurant_id=restaurant_id,
+            booking_date=booking_date,
+            party_size=party_size,
+            window_start=window_start,
+            window_end=window_end,
+        )
+        alternatives = []
+        days = 0
+        if not options:
+            alternatives = self.index.find_alternatives(
+                restaurant_id=restaurant_id,
+                booking_date=booking_date,
+                party_size=party_size,
+                preferred_slot=window_start,
+                days=alternative_days,
+                limit=alternatives_limit,
+            )
+            days = alternative_days
+        cost = time.perf_counter() - start
+        self.lookup_seconds += cost
+
+        result = AvailabilityLookup(options=options, alternatives=alternatives)
+        self.entries[key] = (
+            result,
+            self._versions(restaurant_id, booking_date, days),
+            time.monotonic() + self.ttl_seconds,
+            cost,
+        )
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return result
+
+    def get_hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        if total == 0:
+            return 0.0
+        return self.stats["hits"] / total
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "hit_rate": self.get_hit_rate(),
+            "size": len(self.entries),
+            "lookup_ms": self.lookup_seconds * 1000,
+            "saved_ms": self.saved_seconds * 1000,
+        }
+
+
+availability_cache = AvailabilityCache(
+    index=availability_index,
+    max_size=config.AVAILABILITY_CACHE_SIZE,
+    ttl_seconds=config.AVAILABILITY_CACHE_TTL_SECONDS,
+)
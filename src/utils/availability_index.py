@@ -0,0 +1,215 @@
+from datetime import date, time, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+
+def time_to_slot(value: time, end_of_day: bool = False) -> int:
+    """Slot starting at the time, with end_of_day 00:00 is the midnight ending the day"""
+    slot = (value.hour * 60 + value.minute) // SLOT_MINUTES
+    if end_of_day and slot == 0:
+        return SLOTS_PER_DAY
+    return slot
+
+
+def slot_to_time(slot: int) -> str:
+    minutes = (slot % SLOTS_PER_DAY) * SLOT_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def slot_start_time(slot: int) -> time:
+    """Time the slot starts at, the end of day slot is 00:00"""
+    minutes = (slot % SLOTS_PER_DAY) * SLOT_MINUTES
+    return time(minutes // 60, minutes % 60)
+
+
+def slot_mask(start_slot: int, end_slot: int) -> int:
+    """Bitset of the slots from start_slot up to, not including, end_slot"""
+    return ((1 << (end_slot - start_slot)) - 1) << start_slot
+
+
+class TableInfo(NamedTuple):
+    id: int
+    label: str
+    capacity: int
+
+
+class RestaurantInfo(NamedTuple):
+    id: int
+    name: str
+    open_slot: int
+    close_slot: int
+    booking_slots: int
+    # Smallest tables first, so the first free one wastes the fewest seats
+    tables: Tuple[TableInfo, ...]
+
+
+class SlotOption(NamedTuple):
+    """A table free for a whole booking starting at start_slot on date"""
+
+    date: date
+    start_slot: int
+    table: TableInfo
+
+
+def free_table(
+    restaurant: RestaurantInfo,
+    occupancy: Dict[int, int],
+    party_size: int,
+    start_slot: int,
+) -> Optional[TableInfo]:
+    """Smallest table seating the party and free for a whole booking from start_slot"""
+    need = slot_mask(start_slot, start_slot + restaurant.booking_slots)
+    for table in restaurant.tables:
+        if table.capacity >= party_size and not occupancy.get(table.id, 0) & need:
+            return table
+    return None
+
+
+class AvailabilityIndex:
+    """Occupied 15 minute slots of every table, by restaurant and date.
+
+    The occupancy of a table on a date is an integer used as a bitset of the
+    SLOTS_PER_DAY slots, so checking a table for a booking is one AND. Dates
+    without bookings are not stored.
+    """
+
+    def __init__(self):
+        self.restaurants: Dict[int, RestaurantInfo] = {}
+        self.occupancy: Dict[Tuple[int, date], Dict[int, int]] = {}
+        # Highest booking id applied, bookings made by other processes after it are
+        # loaded by the availability refresher
+        self.last_booking_id = 0
+        # Bumped from one counter whenever the occupancy of a restaurant on a date
+        # changes, results cached with an older version are stale
+        self.version = 0
+        self.day_versions: Dict[Tuple[int, date], int] = {}
+        # Per restaurant, the last change of its details and of any of its dates
+        self.info_versions: Dict[int, int] = {}
+        self.restaurant_versions: Dict[int, int] = {}
+
+    def add_restaurant(self, restaurant: RestaurantInfo) -> None:
+        self.restaurants[restaurant.id] = restaurant
+        self.version += 1
+        self.info_versions[restaurant.id] = self.version
+        self.restaurant_versions[restaurant.id] = self.version
+
+    def _touch(self, key: Tuple[int, date]) -> None:
+        self.version += 1
+        self.day_versions[key] = self.version
+        self.restaurant_versions[key[0]] = self.version
+
+    def get_day_version(self, restaurant_id: int, booking_date: date) -> int:
+        return self.day_versions.get((restaurant_id, booking_date), 0)
+
+    def get_info_version(self, restaurant_id: int) -> int:
+        return self.info_versions.get(restaurant_id, 0)
+
+    def get_restaurant_version(self, restaurant_id: int) -> int:
+        return self.restaurant_versions.get(restaurant_id, 0)
+
+    def add_booking(
+        self,
+        restaurant_id: int,
+        table_id: int,
+        booking_date: date,
+        start_slot: int,
+        end_slot: int,
+        booking_id: Optional[int] = None,
+    ) -> None:
+        tables = self.occupancy.setdefault((restaurant_id, booking_date), {})
+        occupied = tables.get(table_id, 0) | slot_mask(start_slot, end_slot)
+        # The refresher applies recent bookings again, those change nothing
+        if occupied != tables.get(table_id):
+            tables[table_id] = occupied
+            self._touch((restaurant_id, booking_date))
+        if booking_id is not None:
+            self.last_booking_id = max(self.last_booking_id, booking_id)
+
+    def remove_booking(
+        self,
+        restaurant_id: int,
+        table_id: int,
+        booking_date: date,
+        start_slot: int,
+        end_slot: int,
+    ) -> None:
+        tables = self.occupancy.get((restaurant_id, booking_date))
+        if tables is None or table_id not in tables:
+            return None
+        tables[table_id] &= ~slot_mask(start_slot, end_slot)
+        self._touch((restaurant_id, booking_date))
+        return None
+
+    def replace_day(
+        self, restaurant_id: int, booking_date: date, occupancy: Dict[int, int]
+    ) -> None:
+        """Set the occupancy of the restaurant's tables on a date, after cancellations"""
+        if occupancy:
+            self.occupancy[(restaurant_id, booking_date)] = occupancy
+        else:
+            self.occupancy.pop((restaurant_id, booking_date), None)
+        self._touch((restaurant_id, booking_date))
+
+    def evict_before(self, first_date: date) -> None:
+        """Forget the occupancy of the dates before first_date"""
+        for key in [key for key in self.occupancy if key[1] < first_date]:
+            del self.occupancy[key]
+        for key in [key for key in self.day_versions if key[1] < first_date]:
+            del self.day_versions[key]
+
+    def find_slots(
+        self,
+        restaurant_id: int,
+        booking_date: date,
+        party_size: int,
+        window_start: int,
+        window_end: int,
+    ) -> List[SlotOption]:
+        """Start slots within the window with a table free for the whole booking.
+
+        Each option holds the smallest such table. The window is clipped to the
+        opening hours, a booking has to end by closing time.
+        """
+        restaurant = self.restaurants[restaurant_id]
+        tables = self.occupancy.get((restaurant_id, booking_date), {})
+        first = max(window_start, restaurant.open_slot)
+        last = min(window_end, restaurant.close_slot - restaurant.booking_slots)
+        options = []
+        for start_slot in range(first, last + 1):
+            table = free_table(restaurant, tables, party_size, start_slot)
+            if table is not None:
+                options.append(SlotOption(booking_date, start_slot, table))
+        return options
+
+    def find_alternatives(
+        self,
+        restaurant_id: int,
+        booking_date: date,
+        party_size: int,
+        preferred_slot: int,
+        days: int,
+        limit: int,
+    ) -> List[SlotOption]:
+        """Free start slots closest to the preferred one, that day first, then the next days"""
+        restaurant = self.restaurants[restaurant_id]
+        ranked = []
+        for day in range(days + 1):
+            option_date = booking_date + timedelta(days=day)
+            for option in self.find_slots(
+                restaurant_id=restaurant_id,
+                booking_date=option_date,
+                party_size=party_size,
+                window_start=restaurant.open_slot,
+                window_end=restaurant.close_slot,
+            ):
+                distance = abs(option.start_slot - preferred_slot)
+                ranked.append(((day, distance, option.start_slot), option))
+            if len(ranked) >= limit:
+                break
+        ranked.sort(key=lambda item: item[0])
+        return [option for _, option in ranked[:limit]]
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,187 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import config
+from src import logging
+from src.database import get_database_session
+from src.repositories.history_repository import format_chat_history, get_chat_history
+from src.repositories.summary_repository import get_summary, save_summary
+from src.utils.openai_client import create_chat_completion
+from src.utils.prompts import CONVERSATION_SUMMARY_PROMPT
+from src.utils.tokenizer import count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_CONVERSATION_PREFIX = "whatsapp:"
+API_CONVERSATION_PREFIX = "api:"
+SESSION_CONVERSATION_PREFIX = "session:"
+
+
+class Turn(NamedTuple):
+    """A message of the conversation and its position.
+
+    Messages up to the summary's position are folded into the summary.
+    """
+
+    position: int
+    message: Dict[str, str]
+
+
+class ConversationWindow(NamedTuple):
+    """Agent input of a turn, within the token budget"""
+
+    input: List[Dict[str, str]]
+    prompt_tokens: int
+    # The history did not fit, older turns should be folded into the summary
+    needs_summary: bool
+
+
+def _summary_message(summary: str) -> Dict[str, str]:
+    return {
+        "role": "system",
+        "content": f"Summary of the earlier conversation: {summary}",
+    }
+
+
+def _align_to_user(turns: List[Turn]) -> List[Turn]:
+    """Drop leading assistant messages so the turns start with a user message"""
+    start = 0
+    while start < len(turns) and turns[start].message["role"] != "user":
+        start += 1
+    return turns[start:]
+
+
+def build_window(
+    turns: List[Turn],
+    query: str,
+    summary: Optional[str] = None,
+    token_budget: int = config.CONVERSATION_TOKEN_BUDGET,
+) -> ConversationWindow:
+    """Agent input made of the summary, the latest turns that fit and the query.
+
+    The summary and the query are always sent, turns are added newest first until
+    the next one would exceed the budget.
+    """
+    query_message = {"role": "user", "content": query}
+    prefix = [_summary_message(summary)] if summary else []
+    used = count_message_tokens(query_message) + sum(
+        count_message_tokens(message) for message in prefix
+    )
+    start = len(turns)
+    while start > 0:
+        tokens = count_message_tokens(turns[start - 1].message)
+        if used + tokens > token_budget:
+            break
+        used += tokens
+        start -= 1
+    window = _align_to_user(turns[start:])
+    used -= sum(
+        count_message_tokens(turn.message)
+        for turn in turns[start : len(turns) - len(window)]
+    )
+    return ConversationWindow(
+        input=prefix + [turn.message for turn in window] + [query_message],
+        prompt_tokens=used,
+        needs_summary=len(window) < len(turns),
+    )
+
+
+def select_turns_to_fold(
+    turns: List[Turn], keep_tokens: int = config.CONVERSATION_SUMMARY_KEEP_TOKENS
+) -> List[Turn]:
+    """Oldest turns to fold so the rest fits in keep_tokens and starts with a user message.
+
+    Folding below the window budget leaves room for a few more turns, so the summary
+    is refreshed once every few turns rather than on every one.
+    """
+    remaining = sum(count_message_tokens(turn.message) for turn in turns)
+    fold = 0
+    while fold < len(turns) and remaining > keep_tokens:
+        remaining -= count_message_tokens(turns[fold].message)
+        fold += 1
+    while fold < len(turns) and turns[fold].message["role"] != "user":
+        fold += 1
+    return turns[:fold]
+
+
+async def summarize(summary: Optional[str], turns: List[Turn]) -> str:
+    """Fold the turns into the previous summary with the model"""
+    transcript = "\n".join(
+        f"{turn.message['role']}: {turn.message['content']}" for turn in turns
+    )
+    completion = await create_chat_completion(
+        model=config.OPENAI_SUMMARY_MODEL,
+        messages=[
+            {
+                "role": "user",
+                "content": CONVERSATION_SUMMARY_PROMPT.format(
+                    summary=summary or "None", transcript=transcript
+                ),
+            },
+        ],
+        max_tokens=config.CONVERSATION_SUMMARY_MAX_TOKENS,
+    )
+    return completion.choices[0].message.content
+
+
+async def refresh_summary(
+    conversation_id: str, turns: List[Turn], summary: Optional[str] = None
+) -> None:
+    """Fold the oldest unsummarized turns into the conversation's persisted summary.
+
+    Meant to run after the reply is sent, failures are logged and the turns are
+    folded on a later refresh.
+    """
+    turns_to_fold = select_turns_to_fold(turns)
+    if not turns_to_fold:
+        return None
+    db = None
+    try:
+        content = await summarize(summary=summary, turns=turns_to_fold)
+        db = await get_database_session()
+        await save_summary(
+            db=db,
+            conversation_id=conversation_id,
+            content=content,
+            summarized_until=turns_to_fold[-1].position,
+        )
+        logger.info(
+            f"Folded {len(turns_to_fold)} messages into the summary of {conversation_id}"
+        )
+    except Exception as e:
+        logger.error(f"Unable to refresh the summary of {conversation_id}: {str(e)}")
+    finally:
+        if db is not None:
+            await db.close()
+    return None
+
+
+async def get_stored_turns(
+    db: AsyncSession, user_id: int, conversation_id: str
+) -> Tuple[Optional[str], List[Turn]]:
+    """Summary of a stored conversation and the messages it does not cover yet"""
+    summary = await get_summary(db=db, conversation_id=conversation_id)
+    chat_history = await get_chat_history(
+        db=db,
+        user_id=user_id,
+        after_id=summary.summarized_until if summary is not None else None,
+    )
+    turns = [
+        Turn(position=msg.id, message=message)
+        for msg, message in zip(chat_history, format_chat_history(chat_history))
+    ]
+    return (summary.content if summary is not None else None), turns
+
+
+async def refresh_stored_summary(user_id: int, conversation_id: str) -> None:
+    """Fold the oldest turns of a conversation stored in the messages table"""
+    db = await get_database_session()
+    try:
+        summary, turns = await get_stored_turns(
+            db=db, user_id=user_id, conversation_id=conversation_id
+        )
+    finally:
+        await db.close()
+    await refresh_summary(conversation_id=conversation_id, turns=turns, summary=summary)
+    return None
@@ -0,0 +1,177 @@
+import math
+import re
+from typing import Any, List, Tuple, Union
+
+from src.schemas.schemas import TableBookingOutput
+
+# (pattern, weight, label), positive weights vote for table booking, negative against
+GUARDRAIL_RULES: List[Tuple[re.Pattern, float, str]] = [
+    (
+        re.compile(
+            r"^\s*(hi+|hello|hey+|hiya|hola|namaste|greetings|good (morning|afternoon|evening))"
+            r"(\s+there)?[\s!.,]*$",
+            re.IGNORECASE,
+        ),
+        3.0,
+        "greeting",
+    ),
+    (
+        re.compile(
+            r"^\s*(thanks|thank you|thx|ok|okay|yes|yeah|yep|no|nope|sure|great|perfect|bye|goodbye)"
+            r"(\s+(so much|a lot|please|thanks|thank you))?[\s!.]*$",
+            re.IGNORECASE,
+        ),
+        3.0,
+        "acknowledgement",
+    ),
+    (
+        re.compile(r"\b(waitlist|wait list|waiting list)\b", re.IGNORECASE),
+        2.5,
+        "waitlist",
+    ),
+    # Below the threshold alone, a periodic or pivot table is not a booking
+    (
+        re.compile(r"\b(table|tables)\b", re.IGNORECASE),
+        1.0,
+        "table",
+    ),
+    # Booking words alone are weak, flights and hotels are booked too
+    (
+        re.compile(
+            r"\b(book|booking|bookings|reserve|reservation|reservations)\b",
+            re.IGNORECASE,
+        ),
+        1.0,
+        "booking",
+    ),
+    (
+        re.compile(
+            r"\b(restaurant|restaurants|cafe|bistro|diner|dinner|lunch|breakfast|brunch|menu|seat|seats|party)\b",
+            re.IGNORECASE,
+        ),
+        1.5,
+        "restaurant",
+    ),
+    (
+        re.compile(
+            r"\b(party of|for)\s+(\d+|two|three|four|five|six|seven|eight|nine|ten)\b"
+            r"|\b\d+\s+(people|persons|person|guests|pax|of us)\b",
+            re.IGNORECASE,
+        ),
+        2.0,
+        "party size",
+    ),
+    (
+        re.compile(
+            r"\b\d{1,2}(:\d{2})?\s*(am|pm)\b|\b\d{1,2}:\d{2}\b|\b\d{1,2}/\d{1,2}(/\d{2,4})?\b"
+            r"|\b(today|tonight|tomorrow|monday|tuesday|wednesday|thursday|friday|saturday|sunday|weekend)\b",
+            re.IGNORECASE,
+        ),
+        1.2,
+        "date or time",
+    ),
+    (
+        re.compile(
+            r"\b(available|availability|opening hours|open|cancel)\b", re.IGNORECASE
+        ),
+        1.0,
+        "availability",
+    ),
+    (
+        re.compile(
+            r"\b(python|javascript|java|code|coding|function|compile|sql|program|algorithm|debug)\b",
+            re.IGNORECASE,
+        ),
+        -3.0,
+        "programming",
+    ),
+    (
+        re.compile(
+            r"\b(solve|equation|integral|derivative|calculate|square root|multiplication)\b|\d+\s*[-+*^]\s*\d+",
+            re.IGNORECASE,
+        ),
+        -2.5,
+        "math",
+    ),
+    (
+        re.compile(
+            r"\b(weather|news|stock|stocks|bitcoin|crypto|president|election|politics|capital of|translate"
+            r"|poem|essay|story|joke|movie|song|lyrics|recipe|homework|football|cricket)\b",
+            re.IGNORECASE,
+        ),
+        -3.0,
+        "general knowledge",
+    ),
+    (
+        re.compile(
+            r"\b(flight|flights|hotel|hotels|train|trains|ticket|tickets|taxi|cab|car|uber"
+            r"|appointment|doctor|dentist|haircut|room|rooms|holiday|vacation)\b",
+            re.IGNORECASE,
+        ),
+        -3.0,
+        "other bookings",
+    ),
+]
+
+# Short replies such as "4", "John" or "8pm" are answers to the agent's questions.
+# Alone the bonus stays below the confidence threshold, so a short message with no
+# other booking signal, like "who is the CEO of Apple?", is still escalated.
+FOLLOW_UP_WEIGHT = 1.0
+FOLLOW_UP_MAX_WORDS = 6
+
+
+def _message_text(message: Any) -> str:
+    content = message.get("content", "") if isinstance(message, dict) else message
+    if isinstance(content, list):
+        return " ".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return str(content)
+
+
+def classify_table_booking(
+    input: Union[str, List[Any]],
+) -> TableBookingOutput:
+    """Classify the latest user message with the local rule set.
+
+    The confidence is the logistic of the absolute rule score, so an input that
+    matches no rule gets a confidence of 0.5 and should be escalated.
+    """
+    if isinstance(input, str):
+        query, has_history = input, False
+    else:
+        user_messages = [
+            message
+            for message in input
+            if not isinstance(message, dict) or message.get("role", "user") == "user"
+        ]
+        query = _message_text(user_messages[-1]) if user_messages else ""
+        # System messages such as the current time are not part of the conversation
+        has_history = (
+            sum(
+                not isinstance(message, dict)
+                or message.get("role", "user") in ("user", "assistant")
+                for message in input
+            )
+            > 1
+        )
+
+    score = 0.0
+    matched = []
+    for pattern, weight, label in GUARDRAIL_RULES:
+        if pattern.search(query):
+            score += weight
+            matched.append(label)
+
+    if has_history and score >= 0 and 0 < len(query.split()) <= FOLLOW_UP_MAX_WORDS:
+        score += FOLLOW_UP_WEIGHT
+        matched.append("follow up")
+
+    reasoning = (
+        f"Matched rules: {', '.join(matched)}." if matched else "No rule matched."
+    )
+    return TableBookingOutput(
+        is_table_booking=score > 0,
+        reasoning=reasoning,
+        confidence=1 / (1 + math.exp(-abs(score))),
+    )
@@ -0,0 +1,343 @@
+import asyncio
+import bisect
+import dataclasses
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from agents import FunctionTool, Model, ModelResponse, RunContextWrapper, Usage
+
+from src import logging
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY_PREFIX = "metrics:"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _labels_key(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> Tuple:
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _labels_key(self.labelnames, labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        return [
+            (f"{self.name}_total", dict(zip(self.labelnames, key)), value)
+            for key, value in self.values.items()
+        ]
+
+
+class Histogram:
+    """Bucket counts kept per bucket, made cumulative when the samples are taken"""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Counts per bucket and one past the last for +Inf, then the sum
+        self.values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels_key(self.labelnames, labels)
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        for key, counts in self.values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                samples.append(
+                    (f"{self.name}_bucket", {**labels, "le": str(bound)}, cumulative)
+                )
+            samples.append((f"{self.name}_sum", labels, counts[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Counters and histograms of one process, rendered in the Prometheus text format.
+
+    Updates are plain dict operations without awaiting, so they are safe from any
+    task of the event loop and cost well under a microsecond.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+
+    def counter(
+        self, name: str, help: str, labelnames: Tuple[str, ...] = ()
+    ) -> Counter:
+        self.metrics[name] = Counter(name, help, labelnames)
+        return self.metrics[name]
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        self.metrics[name] = Histogram(name, help, labelnames, buckets)
+        return self.metrics[name]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "type": metric.type,
+                "help": metric.help,
+                "samples": metric.samples(),
+            }
+            for name, metric in self.metrics.items()
+        }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def render_metrics(snapshots: List[Tuple[str, Dict[str, Any]]]) -> str:
+    """Prometheus text of the snapshots of several processes, each labelled by name"""
+    lines = []
+    names = sorted({name for _, snapshot in snapshots for name in snapshot})
+    for name in names:
+        header = False
+        for process, snapshot in snapshots:
+            family = snapshot.get(name)
+            if family is None:
+                continue
+            if not header:
+                # Counter samples carry the _total suffix, their family is named alike
+                family_name = f"{name}_total" if family["type"] == "counter" else name
+                lines.append(f"# HELP {family_name} {family['help']}")
+                lines.append(f"# TYPE {family_name} {family['type']}")
+                header = True
+            for sample, labels, value in family["samples"]:
+                lines.append(
+                    f"{sample}{_format_labels({**labels, 'process': process})} {value}"
+                )
+    return "\n".join(lines) + "\n"
+
+
+def process_name(role: str) -> str:
+    return f"{role}:{socket.gethostname()}:{os.getpid()}"
+
+
+class MetricsPublisher:
+    """Background task saving this process's metrics to Redis for the API to export.
+
+    The arq workers serve no HTTP, so /metrics renders the snapshots they publish
+    next to the API's own. A snapshot expires when its worker stops publishing.
+    """
+
+    def __init__(self, redis_pool: Any, process: str, interval_seconds: float):
+        self.redis_pool = redis_pool
+        self.process = process
+        self.interval_seconds = interval_seconds
+        self.publish_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.publish_task = asyncio.create_task(self.run())
+
+    def stop(self) -> None:
+        self.publish_task.cancel()
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.publish()
+
+    async def publish(self) -> None:
+        try:
+            await self.redis_pool.set(
+                f"{METRICS_KEY_PREFIX}{self.process}",
+                json.dumps(registry.snapshot()),
+                ex=int(self.interval_seconds * 3) + 1,
+            )
+        except Exception as e:
+            logger.error(f"Unable to publish the metrics: {str(e)}")
+
+
+async def load_published_snapshots(redis_pool: Any) -> List[Tuple[str, Dict]]:
+    snapshots = []
+    async for key in redis_pool.scan_iter(match=f"{METRICS_KEY_PREFIX}*", count=100):
+        value = await redis_pool.get(key)
+        if value is not None:
+            snapshots.append(
+                (key.decode()[len(METRICS_KEY_PREFIX) :], json.loads(value))
+            )
+    return snapshots
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "table_booking_stage_seconds",
+    "Time spent in each stage of handling a message",
+    ("stage",),
+)
+MODEL_SECONDS = registry.histogram(
+    "table_booking_model_seconds",
+    "Time of each model call, a run makes one per turn of its agent",
+    ("agent",),
+)
+TOOL_SECONDS = registry.histogram(
+    "table_booking_tool_seconds", "Time of each tool call", ("tool",)
+)
+TOOL_ERRORS = registry.counter(
+    "table_booking_tool_errors", "Tool calls that raised", ("tool",)
+)
+MODEL_TOKENS = registry.counter(
+    "table_booking_model_tokens",
+    "Tokens used by the model calls of the agent runs",
+    ("agent", "kind"),
+)
+MODEL_REQUESTS = registry.counter(
+    "table_booking_model_requests", "Model calls of the agent runs", ("agent",)
+)
+MODEL_RETRIES = registry.counter(
+    "table_booking_model_retries",
+    "Model calls retried per model and reason",
+    ("model", "reason"),
+)
+MODEL_REJECTIONS = registry.counter(
+    "table_booking_model_rejections",
+    "Model calls that found no free slot before their deadline",
+    ("model",),
+)
+MODEL_HEDGES = registry.counter(
+    "table_booking_model_hedges",
+    "Hedged model calls per model and call that answered first",
+    ("model", "winner"),
+)
+RESPONSE_CACHE_LOOKUPS = registry.counter(
+    "table_booking_response_cache_lookups",
+    "Response cache lookups of standalone questions per result",
+    ("result",),
+)
+RESPONSE_CACHE_SAVED_SECONDS = registry.counter(
+    "table_booking_response_cache_saved_seconds",
+    "Guardrail and agent time the cached responses took when they were made",
+)
+AVAILABILITY_CACHE_LOOKUPS = registry.counter(
+    "table_booking_availability_cache_lookups",
+    "Availability cache lookups per result, stale entries are counted as misses too",
+    ("result",),
+)
+AVAILABILITY_CACHE_SAVED_SECONDS = registry.counter(
+    "table_booking_availability_cache_saved_seconds",
+    "Index time the cached availability lookups took when they were made",
+)
+USER_CACHE_LOOKUPS = registry.counter(
+    "table_booking_user_cache_lookups",
+    "User id lookups per result, a miss upserts the user in the database",
+    ("result",),
+)
+REFUSALS = registry.counter(
+    "table_booking_refusals",
+    "Refusals served per source, only generated ones call the model",
+    ("source",),
+)
+TURNS = registry.counter(
+    "table_booking_turns",
+    "Messages answered per channel and outcome",
+    ("channel", "outcome"),
+)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Observe the time of the block in the stage histogram, even when it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_usage(agent: str, usage: Usage) -> None:
+    """Count the tokens and model calls of a run from its context's usage"""
+    MODEL_REQUESTS.inc(usage.requests, agent=agent)
+    MODEL_TOKENS.inc(usage.input_tokens, agent=agent, kind="input")
+    MODEL_TOKENS.inc(usage.output_tokens, agent=agent, kind="output")
+    MODEL_TOKENS.inc(
+        usage.input_tokens_details.cached_tokens, agent=agent, kind="cached_input"
+    )
+
+
+class TimedModel(Model):
+    """Model observing the time of each of its calls, one per turn of the agent"""
+
+    def __init__(self, model: Model, agent: str):
+        self.model = model
+        self.agent = agent
+
+    async def get_response(self, *args: Any, **kwargs: Any) -> ModelResponse:
+        start = time.perf_counter()
+        try:
+            return await self.model.get_response(*args, **kwargs)
+        finally:
+            MODEL_SECONDS.observe(time.perf_counter() - start, agent=self.agent)
+
+    async def stream_response(self, *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        start = time.perf_counter()
+        try:
+            async for event in self.model.stream_response(*args, **kwargs):
+                yield event
+        finally:
+            MODEL_SECONDS.observe(time.perf_counter() - start, agent=self.agent)
+
+
+def timed_tool(tool: FunctionTool) -> FunctionTool:
+    """The tool observing the time of each call and counting the calls that raise"""
+
+    async def on_invoke_tool(ctx: RunContextWrapper[Any], args: str) -> Any:
+        start = time.perf_counter()
+        try:
+            return await tool.on_invoke_tool(ctx, args)
+        except Exception:
+            TOOL_ERRORS.inc(tool=tool.name)
+            raise
+        finally:
+            TOOL_SECONDS.observe(time.perf_counter() - start, tool=tool.name)
+
+    return dataclasses.replace(tool, on_invoke_tool=on_invoke_tool)
@@ -0,0 +1,284 @@
+import asyncio
+import random
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import openai
+from agents import Model, ModelResponse, OpenAIResponsesModel
+from openai import AsyncOpenAI
+
+from src import config
+from src import logging
+from src.utils.metrics import (
+    MODEL_HEDGES,
+    MODEL_REJECTIONS,
+    MODEL_RETRIES,
+    TimedModel,
+)
+
+logger = logging.getLogger(__name__)
+
+# Shared by the agents and routes so all model calls reuse one connection pool. Retries
+# are left to the model limiters, which also bound the calls in flight per model.
+async_client = AsyncOpenAI(
+    api_key=config.OPENAI_API_KEY,
+    timeout=config.MODEL_CALL_TIMEOUT_SECONDS,
+    max_retries=0,
+)
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class ModelUnavailable(Exception):
+    """Raised when a model call cannot complete within its deadline"""
+
+
+def _retry_reason(error: Exception) -> str:
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection"
+    return "server_error"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked to wait, from the Retry-After headers"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        try:
+            return float(response.headers[header]) / scale
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+class ModelLimiter:
+    """Bounds the calls in flight to one model and retries the failed ones.
+
+    A call waits for a free slot, then for the model, and is retried with jittered
+    exponential backoff, or after the Retry-After the provider sent, on rate limits,
+    connection and server errors. All of it happens within the call's deadline,
+    after which ModelUnavailable is raised, so a spike queues up to the deadline
+    instead of turning into a wall of rate limited calls.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_concurrency: int,
+        deadline_seconds: float,
+        max_retries: int,
+        backoff_seconds: float,
+    ):
+        self.model = model
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    async def _acquire(self, deadline: float) -> None:
+        remaining = deadline - asyncio.get_running_loop().time()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=remaining)
+        except TimeoutError as e:
+            MODEL_REJECTIONS.inc(model=self.model)
+            raise ModelUnavailable(
+                f"No free slot for {self.model} before the deadline"
+            ) from e
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline: float) -> float:
+        """Seconds before the next attempt, raises ModelUnavailable when there is none"""
+        if attempt > self.max_retries:
+            raise ModelUnavailable(f"{self.model} failed {attempt} times") from error
+        delay = _retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, self.backoff_seconds * 2 ** (attempt - 1))
+        if asyncio.get_running_loop().time() + delay >= deadline:
+            raise ModelUnavailable(
+                f"{self.model} cannot be retried before the deadline"
+            ) from error
+        MODEL_RETRIES.inc(model=self.model, reason=_retry_reason(error))
+        logger.warning(f"Retrying {self.model} in {delay:.2f}s: {str(error)}")
+        return delay
+
+    async def call(
+        self,
+        create: Callable[[], Awaitable[Any]],
+        hedge_after_seconds: Optional[float] = None,
+    ) -> Any:
+        """Run create under the limits, hedged by a second call when it is slow"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_seconds
+        attempt = 0
+        while True:
+            await self._acquire(deadline)
+            try:
+                async with asyncio.timeout_at(deadline):
+                    if hedge_after_seconds is None:
+                        return await create()
+                    return await self._hedged(create, hedge_after_seconds)
+            except RETRYABLE_ERRORS as e:
+                error = e
+            except TimeoutError as e:
+                raise ModelUnavailable(
+                    f"{self.model} did not answer before the deadline"
+                ) from e
+            finally:
+                self.semaphore.release()
+            attempt += 1
+            await asyncio.sleep(self._retry_delay(error, attempt, deadline))
+
+    async def _hedged(
+        self, create: Callable[[], Awaitable[Any]], hedge_after_seconds: float
+    ) -> Any:
+        """First answer of the call and, once it is slow, of a second identical one.
+
+        The second call is only made when a slot is free, never under overload.
+        """
+        first = asyncio.ensure_future(create())
+        try:
+            done, _ = await asyncio.wait({first}, timeout=hedge_after_seconds)
+            if done or self.semaphore.locked():
+                return await first
+            await self.semaphore.acquire()
+            try:
+                second = asyncio.ensure_future(create())
+                try:
+                    pending = {first, second}
+                    while pending:
+                        done, pending = await asyncio.wait(
+                            pending, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        for task in done:
+                            if task.exception() is None:
+                                MODEL_HEDGES.inc(
+                                    model=self.model,
+                                    winner="hedge" if task is second else "first",
+                                )
+                                return task.result()
+                    # Both failed, the first error decides whether to retry
+                    return first.result()
+                finally:
+                    second.cancel()
+            finally:
+                self.semaphore.release()
+        finally:
+            first.cancel()
+
+    async def stream(
+        self, create: Callable[[], AsyncIterator[Any]]
+    ) -> AsyncIterator[Any]:
+        """Iterate a streamed call under the limits, holding its slot to the end.
+
+        The deadline and the retries apply until the first event, a stream that
+        fails after it has been partly consumed cannot be retried.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_seconds
+        attempt = 0
+        while True:
+            await self._acquire(deadline)
+            events = create()
+            try:
+                try:
+                    first = await asyncio.wait_for(
+                        anext(events), timeout=deadline - loop.time()
+                    )
+                except StopAsyncIteration:
+                    return
+                except RETRYABLE_ERRORS as e:
+                    error = e
+                except TimeoutError as e:
+                    raise ModelUnavailable(
+                        f"{self.model} did not answer before the deadline"
+                    ) from e
+                else:
+                    yield first
+                    async for event in events:
+                        yield event
+                    return
+            finally:
+                # Also closes the call when the consumer stops early
+                await events.aclose()
+                self.semaphore.release()
+            attempt += 1
+            await asyncio.sleep(self._retry_delay(error, attempt, deadline))
+
+
+model_limiters: Dict[str, ModelLimiter] = {}
+
+
+def get_model_limiter(model: str) -> ModelLimiter:
+    """The limiter of a model, shared by every call to it from this process"""
+    if model not in model_limiters:
+        model_limiters[model] = ModelLimiter(
+            model=model,
+            max_concurrency=config.MODEL_MAX_CONCURRENCY,
+            deadline_seconds=config.MODEL_CALL_DEADLINE_SECONDS,
+            max_retries=config.MODEL_MAX_RETRIES,
+            backoff_seconds=config.MODEL_RETRY_BACKOFF_SECONDS,
+        )
+    return model_limiters[model]
+
+
+class LimitedModel(Model):
+    """Agent model whose calls go through the limiter of their model"""
+
+    def __init__(
+        self, model: Model, limiter: ModelLimiter, hedge_after_seconds: Optional[float]
+    ):
+        self.model = model
+        self.limiter = limiter
+        self.hedge_after_seconds = hedge_after_seconds
+
+    async def get_response(self, *args: Any, **kwargs: Any) -> ModelResponse:
+        return await self.limiter.call(
+            lambda: self.model.get_response(*args, **kwargs),
+            hedge_after_seconds=self.hedge_after_seconds,
+        )
+
+    async def stream_response(self, *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        async for event in self.limiter.stream(
+            lambda: self.model.stream_response(*args, **kwargs)
+        ):
+            yield event
+
+
+def create_agent_model(
+    model: str, agent: str, hedge_after_seconds: Optional[float] = None
+) -> Model:
+    """Responses model of an agent, timed per call and limited per model"""
+    return LimitedModel(
+        TimedModel(
+            OpenAIResponsesModel(model=model, openai_client=async_client),
+            agent=agent,
+        ),
+        limiter=get_model_limiter(model),
+        hedge_after_seconds=hedge_after_seconds,
+    )
+
+
+async def create_chat_completion(**kwargs: Any) -> Any:
+    """Chat completion through the limiter of its model"""
+    return await get_model_limiter(kwargs["model"]).call(
+        lambda: async_client.chat.completions.create(**kwargs)
+    )
+
+
+async def stream_chat_completion(**kwargs: Any) -> AsyncIterator[Any]:
+    """Chunks of a streamed chat completion through the limiter of its model"""
+
+    async def chunks() -> AsyncIterator[Any]:
+        completion = await async_client.chat.completions.create(**kwargs, stream=True)
+        async for chunk in completion:
+            yield chunk
+
+    async for chunk in get_model_limiter(kwargs["model"]).stream(chunks):
+        yield chunk
@@ -0,0 +1,51 @@
+import dataclasses
+from datetime import datetime
+from typing import Any, List, Sequence, Union
+
+from agents import FunctionTool, TResponseInputItem
+
+from src.utils.relative_dates import describe_time
+
+# Providers cache the longest prefix of a request already seen, in the order the
+# instructions, the tool schemas and the input items are sent. Everything that
+# changes between turns goes after the history so that prefix survives.
+
+
+def canonical_schema(schema: Any) -> Any:
+    """The JSON schema with its keys, and its required fields, sorted at every level"""
+    if isinstance(schema, dict):
+        return {
+            key: (
+                sorted(schema[key])
+                if key == "required" and isinstance(schema[key], list)
+                else canonical_schema(schema[key])
+            )
+            for key in sorted(schema)
+        }
+    if isinstance(schema, list):
+        return [canonical_schema(item) for item in schema]
+    return schema
+
+
+def stable_tools(tools: Sequence[FunctionTool]) -> List[FunctionTool]:
+    """The tools sorted by name with canonical schemas, sent alike by every process"""
+    return [
+        dataclasses.replace(
+            tool, params_json_schema=canonical_schema(tool.params_json_schema)
+        )
+        for tool in sorted(tools, key=lambda tool: tool.name)
+    ]
+
+
+def with_current_time(
+    input: Union[str, List[TResponseInputItem]], now: datetime
+) -> List[TResponseInputItem]:
+    """The agent input with the current time after the query.
+
+    The time changes every minute, in the instructions it would change the prefix
+    of every call, after the query it only differs from the next turn's input
+    where that one appends new messages anyway.
+    """
+    if isinstance(input, str):
+        input = [{"role": "user", "content": input}]
+    return [*input, {"role": "system", "content": describe_time(now)}]
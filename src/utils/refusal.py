@@ -0,0 +1,149 @@
+import asyncio
+import random
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from src import config
+from src import logging
+from src.utils.metrics import REFUSALS
+from src.utils.openai_client import create_chat_completion, stream_chat_completion
+from src.utils.prompts import (
+    GAURDRAIL_FAIL_POOL_PROMPT,
+    GAURDRAIL_FAIL_PROMPT,
+    GAURDRAIL_FAIL_TEMPLATES,
+)
+
+logger = logging.getLogger(__name__)
+
+REFUSAL_MODE_STATIC = "static"
+REFUSAL_MODE_CACHED = "cached"
+REFUSAL_MODE_GENERATE = "generate"
+
+# Served refusals by source, the hit rate is the share served without a model call
+refusal_stats: Dict[str, int] = {"template": 0, "pool": 0, "generated": 0}
+
+
+def _count_refusal(source: str) -> None:
+    refusal_stats[source] += 1
+    REFUSALS.inc(source=source)
+
+
+def get_refusal_hit_rate() -> float:
+    total = sum(refusal_stats.values())
+    if total == 0:
+        return 0.0
+    return (refusal_stats["template"] + refusal_stats["pool"]) / total
+
+
+def _get_templates() -> List[str]:
+    return GAURDRAIL_FAIL_TEMPLATES.get(
+        config.REFUSAL_LANGUAGE, GAURDRAIL_FAIL_TEMPLATES["en"]
+    )
+
+
+class RefusalPool:
+    """Pool of model generated refusals, refreshed in the background when stale"""
+
+    def __init__(self):
+        self.refusals: List[str] = []
+        self.refreshed_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def is_stale(self) -> bool:
+        return (
+            self.refreshed_at is None
+            or time.monotonic() - self.refreshed_at
+            > config.REFUSAL_POOL_REFRESH_SECONDS
+        )
+
+    async def refresh(self) -> None:
+        try:
+            completion = await create_chat_completion(
+                model=config.OPENAI_AGENT_MODEL,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": GAURDRAIL_FAIL_POOL_PROMPT.format(
+                            language=config.REFUSAL_LANGUAGE
+                        ),
+                    },
+                ],
+                n=config.REFUSAL_POOL_SIZE,
+                temperature=1.0,
+            )
+            refusals = [
+                choice.message.content
+                for choice in completion.choices
+                if choice.message.content
+            ]
+            if refusals:
+                self.refusals = refusals
+            self.refreshed_at = time.monotonic()
+            logger.info(f"Refreshed the refusal pool with {len(refusals)} refusals")
+        except Exception as e:
+            logger.error(f"Unable to refresh the refusal pool: {str(e)}")
+
+    def get(self) -> Optional[str]:
+        """Return a pooled refusal and schedule a refresh if the pool is stale"""
+        if self.is_stale() and (
+            self._refresh_task is None or self._refresh_task.done()
+        ):
+            self._refresh_task = asyncio.create_task(self.refresh())
+        if not self.refusals:
+            return None
+        return random.choice(self.refusals)
+
+
+refusal_pool = RefusalPool()
+
+
+def _get_cheap_refusal() -> Optional[str]:
+    if config.REFUSAL_MODE == REFUSAL_MODE_STATIC:
+        _count_refusal("template")
+        return random.choice(_get_templates())
+    if config.REFUSAL_MODE == REFUSAL_MODE_CACHED:
+        refusal = refusal_pool.get()
+        if refusal is None:
+            # Serve a template until the first refresh completes
+            _count_refusal("template")
+            return random.choice(_get_templates())
+        _count_refusal("pool")
+        return refusal
+    return None
+
+
+def _generate_messages(query: str) -> List[Dict[str, str]]:
+    return [
+        {
+            "role": "user",
+            "content": GAURDRAIL_FAIL_PROMPT.format(query=query),
+        },
+    ]
+
+
+async def get_refusal(query: str) -> str:
+    """Return the refusal for an out-of-scope query using the configured mode"""
+    refusal = _get_cheap_refusal()
+    if refusal is None:
+        completion = await create_chat_completion(
+            model=config.OPENAI_AGENT_MODEL, messages=_generate_messages(query)
+        )
+        _count_refusal("generated")
+        refusal = completion.choices[0].message.content
+    logger.info(f"Refusal hit rate: {get_refusal_hit_rate():.1%}")
+    return refusal
+
+
+async def stream_refusal(query: str) -> AsyncIterator[str]:
+    """Stream the refusal for an out-of-scope query using the configured mode"""
+    refusal = _get_cheap_refusal()
+    if refusal is not None:
+        logger.info(f"Refusal hit rate: {get_refusal_hit_rate():.1%}")
+        yield refusal
+        return
+    _count_refusal("generated")
+    async for chunk in stream_chat_completion(
+        model=config.OPENAI_AGENT_MODEL, messages=_generate_messages(query)
+    ):
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
@@ -0,0 +1,166 @@
+import re
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+DATE_FORMAT = "%d/%m/%Y"
+TIME_FORMAT = "%H:%M"
+
+WEEKDAYS = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+MONTHS = [
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+]
+
+_NUMERIC_DATE = re.compile(r"(\d{1,2})[/.-](\d{1,2})(?:[/.-](\d{2}|\d{4}))?")
+_ISO_DATE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})")
+_IN_DAYS = re.compile(r"in (\d{1,3}) days?")
+_WEEKDAY = re.compile(r"(?:(this|next|coming) )?([a-z]+)")
+_DAY_MONTH = re.compile(r"(\d{1,2})(?:st|nd|rd|th)? (?:of )?([a-z]+)(?: (\d{4}))?")
+_MONTH_DAY = re.compile(r"([a-z]+) (\d{1,2})(?:st|nd|rd|th)?(?: (\d{4}))?")
+_TIME = re.compile(r"(\d{1,2})(?:[:.h](\d{2}))?(?: ?([ap])\.?m\.?)?")
+
+
+def local_now(timezone: str) -> datetime:
+    """Current date and time at the restaurant"""
+    return datetime.now(ZoneInfo(timezone))
+
+
+def _clean(text: str) -> str:
+    text = " ".join(text.strip().lower().replace(",", " ").split())
+    for prefix in ("on ", "at ", "the "):
+        if text.startswith(prefix):
+            text = text[len(prefix) :]
+    return text.rstrip(".")
+
+
+def _month(name: str) -> int:
+    for number, month in enumerate(MONTHS, start=1):
+        if len(name) >= 3 and month.startswith(name):
+            return number
+    raise ValueError(f"Unknown month {name}")
+
+
+def _weekday(name: str) -> int:
+    for number, weekday in enumerate(WEEKDAYS):
+        if len(name) >= 3 and weekday.startswith(name):
+            return number
+    raise ValueError(f"Unknown weekday {name}")
+
+
+def _day_of_year(day: int, month: int, year: str, today: date) -> date:
+    """The date, in the coming twelve months when the year is left out"""
+    if year:
+        return date(int(year) + (2000 if len(year) == 2 else 0), month, day)
+    resolved = date(today.year, month, day)
+    if resolved < today:
+        resolved = date(today.year + 1, month, day)
+    return resolved
+
+
+def parse_date(text: str, today: date) -> date:
+    """Resolve a date as customers write it, relative ones from today.
+
+    Takes dd/mm/yyyy and its variants, ISO dates, "18 October", "today",
+    "tomorrow", "day after tomorrow", "in 3 days" and weekdays. A bare or "this"
+    weekday is the next one from today on, "next" is the one of the following
+    week. Raises ValueError for anything else, the agent asks the customer then.
+    """
+    text = _clean(text)
+    if text in ("today", "tonight"):
+        return today
+    if text in ("tomorrow", "tomorrow night"):
+        return today + timedelta(days=1)
+    if text in ("day after tomorrow", "the day after tomorrow"):
+        return today + timedelta(days=2)
+
+    match = _ISO_DATE.fullmatch(text)
+    if match:
+        return date(int(match[1]), int(match[2]), int(match[3]))
+    match = _NUMERIC_DATE.fullmatch(text)
+    if match:
+        return _day_of_year(int(match[1]), int(match[2]), match[3], today)
+    match = _IN_DAYS.fullmatch(text)
+    if match:
+        return today + timedelta(days=int(match[1]))
+    match = _DAY_MONTH.fullmatch(text)
+    if match:
+        return _day_of_year(int(match[1]), _month(match[2]), match[3], today)
+    match = _MONTH_DAY.fullmatch(text)
+    if match:
+        return _day_of_year(int(match[2]), _month(match[1]), match[3], today)
+    match = _WEEKDAY.fullmatch(text)
+    if match:
+        weekday = _weekday(match[2])
+        if match[1] == "next":
+            start_of_next_week = today + timedelta(days=7 - today.weekday())
+            return start_of_next_week + timedelta(days=weekday)
+        return today + timedelta(days=(weekday - today.weekday()) % 7)
+    raise ValueError(f"Unknown date {text}")
+
+
+def parse_time(text: str) -> time:
+    """Resolve a time as customers write it, "20:00", "8pm", "8.30 pm" or "noon".
+
+    An hour from 1 to 12 without minutes nor am/pm is ambiguous and raises
+    ValueError like anything else that is not a time.
+    """
+    text = _clean(text)
+    if text in ("noon", "midday"):
+        return time(12)
+    if text == "midnight":
+        return time(0)
+    match = _TIME.fullmatch(text)
+    if match is None:
+        raise ValueError(f"Unknown time {text}")
+    hour = int(match[1])
+    minute = int(match[2] or 0)
+    if match[3]:
+        if not 1 <= hour <= 12:
+            raise ValueError(f"Unknown time {text}")
+        hour = hour % 12 + (12 if match[3] == "p" else 0)
+    elif match[2] is None and 1 <= hour <= 12:
+        raise ValueError(f"Ambiguous time {text}")
+    if hour == 24 and minute == 0:
+        return time(0)
+    return time(hour, minute)
+
+
+def describe_today(now: datetime, days: int) -> str:
+    """Current date and the dates of the coming weekdays, the same all day"""
+    upcoming = ", ".join(
+        f"{WEEKDAYS[day.weekday()].capitalize()} {day.strftime(DATE_FORMAT)}"
+        for day in (
+            now.date() + timedelta(days=offset) for offset in range(1, days + 1)
+        )
+    )
+    return (
+        f"Today is {WEEKDAYS[now.weekday()].capitalize()} "
+        f"{now.strftime(DATE_FORMAT)}. The next days are {upcoming}."
+    )
+
+
+def describe_time(now: datetime) -> str:
+    return f"The time is {now.strftime(TIME_FORMAT)} ({now.tzinfo})."
+
+
+def is_past(day: date, at: time, now: datetime) -> bool:
+    """The date and time at the restaurant have gone by, now being its local time"""
+    return datetime.combine(day, at) < now.replace(tzinfo=None)
@@ -0,0 +1,297 @@
+import json
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+from datetime import date
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from src import config
+from src.utils.availability_index import AvailabilityIndex, availability_index
+from src.utils.relative_dates import MONTHS, WEEKDAYS
+from src.utils.restaurant_catalog import RestaurantCatalog, restaurant_catalog
+
+# Tools whose calls change bookings or waitlists, a turn calling one is never cached
+STATE_CHANGING_TOOLS = {
+    "save_booking",
+    "join_waitlist",
+    "leave_waitlist",
+    "cancel_booking",
+}
+# Its answer depends on the bookings of the restaurant, not only on its details
+AVAILABILITY_TOOL = "fetch_table_availability"
+
+QUESTION_WORDS = {
+    "what",
+    "when",
+    "where",
+    "which",
+    "who",
+    "how",
+    "do",
+    "does",
+    "is",
+    "are",
+    "can",
+    "could",
+    "will",
+    "would",
+    "may",
+    "have",
+    "has",
+    "any",
+}
+# Words two queries must share to be answered alike, however similar the rest is
+DATE_WORDS = {
+    "today",
+    "tonight",
+    "tomorrow",
+    "weekend",
+    "this",
+    "next",
+    "last",
+    "am",
+    "pm",
+    *WEEKDAYS,
+    *(weekday[:3] for weekday in WEEKDAYS),
+    *MONTHS,
+    *(month[:3] for month in MONTHS),
+}
+NEGATIONS = {"not", "no", "never", "without", "nothing", "none"}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CONTRACTION = re.compile(r"n't\b|n’t\b")
+_PHONE_NUMBER = re.compile(r"\d[\d\s()+-]{6,}\d")
+
+
+class CachedResponse(NamedTuple):
+    grams: Dict[str, int]
+    norm: float
+    response: str
+    # Index versions of the restaurant it depends on, stale once one changed
+    versions: Tuple[int, ...]
+    expires_at: float
+    # Guardrail and agent time the response took, saved by every hit
+    cost: float
+
+
+class CacheQuery(NamedTuple):
+    """A query reduced to what its answer depends on"""
+
+    # Restaurant, date and the words that must match exactly
+    bucket: Tuple
+    text: str
+    grams: Dict[str, int]
+    norm: float
+
+
+def _words(query: str) -> List[str]:
+    return _WORD.findall(_CONTRACTION.sub(" not", query.casefold()))
+
+
+def _grams(text: str) -> Dict[str, int]:
+    padded = f" {text} "
+    return Counter(padded[start : start + 3] for start in range(len(padded) - 2))
+
+
+def _similarity(query: CacheQuery, entry: CachedResponse) -> float:
+    if not query.norm or not entry.norm:
+        return 0.0
+    shared = sum(
+        count * entry.grams.get(gram, 0) for gram, count in query.grams.items()
+    )
+    return shared / (query.norm * entry.norm)
+
+
+def is_question(query: str, min_words: int) -> bool:
+    """Whether the query stands on its own, a question of at least min_words words.
+
+    Short replies like "4 people" or "yes" only make sense in their conversation.
+    """
+    words = _words(query)
+    if len(words) < min_words or _PHONE_NUMBER.search(query):
+        return False
+    return query.rstrip().endswith("?") or words[0] in QUESTION_WORDS
+
+
+def find_restaurant_id(
+    query: str, index: AvailabilityIndex, catalog: RestaurantCatalog
+) -> Optional[int]:
+    """The restaurant the query names, or the only one when there is one"""
+    if len(index.restaurants) == 1:
+        return next(iter(index.restaurants))
+    found = catalog.find_in_text(query)
+    if len(found) != 1:
+        return None
+    return found.pop()
+
+
+class ResponseCache:
+    """Agent responses to standalone questions, found again for near-identical ones.
+
+    A query is reduced to its restaurant, the date at the restaurant and the words
+    that change its answer, numbers, dates and negations, which must match
+    exactly. The rest of the query is compared by the cosine similarity of its
+    character trigrams to the cached queries of the same bucket, so "what are
+    your opening hours?" finds "What are ur opening hours" but "table for 10" never
+    finds "table for 2". Each entry is kept up to ttl_seconds and least recently
+    used ones are evicted beyond max_size.
+
+    An entry keeps the index versions of its restaurant, its details only or also
+    its bookings when the agent checked the availability, and is a miss once one
+    of them changed. Bookings saved here or applied by the refresher so invalidate
+    the entries of their restaurant without scanning the cache.
+    """
+
+    def __init__(
+        self,
+        index: AvailabilityIndex,
+        catalog: RestaurantCatalog,
+        max_size: int,
+        ttl_seconds: float,
+        similarity: float,
+        min_words: int,
+    ):
+        self.index = index
+        self.catalog = catalog
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.min_words = min_words
+        self.entries: "OrderedDict[Tuple, CachedResponse]" = OrderedDict()
+        # Texts of the entries in each bucket, the candidates of a lookup
+        self.buckets: Dict[Tuple, Set[str]] = {}
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "stale": 0}
+        self.saved_seconds = 0.0
+
+    def prepare(self, query: str, today: date) -> Optional[CacheQuery]:
+        """The cache form of a query, None when its answer cannot be shared"""
+        if not is_question(query, self.min_words):
+            return None
+        restaurant_id = find_restaurant_id(query, self.index, self.catalog)
+        if restaurant_id is None:
+            return None
+        name = self.catalog.name_words(restaurant_id)
+        words = [word for word in _words(query) if word not in name]
+        exact = tuple(
+            sorted(
+                {
+                    word
+                    for word in words
+                    if word.isdigit() or word in DATE_WORDS or word in NEGATIONS
+                }
+            )
+        )
+        text = " ".join(words)
+        grams = _grams(text)
+        return CacheQuery(
+            bucket=(restaurant_id, today, exact),
+            text=text,
+            grams=grams,
+            norm=math.sqrt(sum(count * count for count in grams.values())),
+        )
+
+    def _versions(self, restaurant_id: int, uses_availability: bool) -> Tuple:
+        if uses_availability:
+            return (
+                self.index.get_info_version(restaurant_id),
+                self.index.get_restaurant_version(restaurant_id),
+            )
+        return (self.index.get_info_version(restaurant_id),)
+
+    def _current_versions(self, restaurant_id: int, versions: Tuple) -> Tuple:
+        return self._versions(restaurant_id, uses_availability=len(versions) > 1)
+
+    def _remove(self, key: Tuple) -> None:
+        del self.entries[key]
+        texts = self.buckets[key[0]]
+        texts.discard(key[1])
+        if not texts:
+            del self.buckets[key[0]]
+
+    def lookup(self, query: CacheQuery) -> Optional[CachedResponse]:
+        """The entry of the closest cached query, if similar enough"""
+        best_key, best_similarity = None, self.similarity
+        now = time.monotonic()
+        for text in list(self.buckets.get(query.bucket, ())):
+            key = (query.bucket, text)
+            entry = self.entries[key]
+            if now >= entry.expires_at or entry.versions != self._current_versions(
+                query.bucket[0], entry.versions
+            ):
+                self._remove(key)
+                self.stats["stale"] += 1
+                continue
+            similarity = 1.0 if text == query.text else _similarity(query, entry)
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        if best_key is None:
+            self.stats["misses"] += 1
+            return None
+        entry = self.entries[best_key]
+        self.entries.move_to_end(best_key)
+        self.stats["hits"] += 1
+        self.saved_seconds += entry.cost
+        return entry
+
+    def store(
+        self,
+        query: CacheQuery,
+        response: str,
+        tool_calls: List[Tuple[str, str]],
+        cost: float,
+    ) -> bool:
+        """Cache the response of a turn, unless one of its tool calls rules it out.
+
+        Turns changing a booking or a waitlist, or looking up another restaurant
+        than the query's, are not cached. Returns whether the response was cached.
+        """
+        restaurant_id = query.bucket[0]
+        for name, arguments in tool_calls:
+            if name in STATE_CHANGING_TOOLS:
+                return False
+            try:
+                restaurant_name = json.loads(arguments).get("restaurant_name", "")
+            except (ValueError, AttributeError):
+                return False
+            if self.catalog.resolve(restaurant_name).restaurant_id != restaurant_id:
+                return False
+        uses_availability = any(name == AVAILABILITY_TOOL for name, _ in tool_calls)
+        key = (query.bucket, query.text)
+        self.entries[key] = CachedResponse(
+            grams=query.grams,
+            norm=query.norm,
+            response=response,
+            versions=self._versions(restaurant_id, uses_availability),
+            expires_at=time.monotonic() + self.ttl_seconds,
+            cost=cost,
+        )
+        self.entries.move_to_end(key)
+        self.buckets.setdefault(query.bucket, set()).add(query.text)
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))
+        return True
+
+    def get_hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        if total == 0:
+            return 0.0
+        return self.stats["hits"] / total
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "hit_rate": self.get_hit_rate(),
+            "size": len(self.entries),
+            "saved_ms": self.saved_seconds * 1000,
+        }
+
+
+response_cache = ResponseCache(
+    index=availability_index,
+    catalog=restaurant_catalog,
+    max_size=config.RESPONSE_CACHE_SIZE,
+    ttl_seconds=config.RESPONSE_CACHE_TTL_SECONDS,
+    similarity=config.RESPONSE_CACHE_SIMILARITY,
+    min_words=config.RESPONSE_CACHE_MIN_WORDS,
+)
@@ -0,0 +1,311 @@
+import bisect
+import itertools
+import math
+import re
+import sys
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from src import config
+from src.utils.availability_index import RestaurantInfo, availability_index
+
+_WORD = re.compile(r"[^\W_]+")
+_APOSTROPHE = re.compile(r"['’`]")
+# Query keys shorter than this are not looked up as the start of a name
+MIN_PREFIX_LENGTH = 4
+# Candidates scored exactly per search, from the words and from the grams they share
+MAX_CANDIDATES = 16
+# Postings read per search past the rarest list, grams common to thousands of
+# names like those of "trattoria" are only read while within it
+MAX_POSTINGS = 1024
+
+
+def normalize_name(name: str) -> str:
+    """Key of a name: casefolded, without accents, punctuation or a leading "the" """
+    text = unicodedata.normalize("NFKD", _APOSTROPHE.sub("", name.casefold()))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    words = _WORD.findall(text.replace("&", " and "))
+    if len(words) > 1 and words[0] == "the":
+        words = words[1:]
+    return " ".join(words)
+
+
+def name_grams(key: str) -> Set[str]:
+    """Trigrams of every word of a key, so word order does not matter"""
+    return {
+        padded[start : start + 3]
+        for padded in (f" {word} " for word in key.split())
+        for start in range(len(padded) - 2)
+    }
+
+
+def _dice(grams: Set[str], other: Tuple[str, ...]) -> float:
+    """Dice coefficient of the query's grams and an entry's, without repeats"""
+    return 2 * len(grams.intersection(other)) / (len(grams) + len(other))
+
+
+class RestaurantMatch(NamedTuple):
+    restaurant_id: int
+    # The name or alias that matched, as written in the catalog
+    name: str
+    score: float
+
+
+class RestaurantResolution(NamedTuple):
+    """The restaurant a name resolves to, or the closest ones when it is not clear"""
+
+    restaurant_id: Optional[int]
+    candidates: List[RestaurantMatch]
+    # Resolved by similarity rather than by its exact name or the start of it
+    fuzzy: bool = False
+
+
+class RestaurantCatalog:
+    """Names and aliases of the restaurants, looked up exactly, by prefix or fuzzily.
+
+    Every name and alias is an entry keyed by its normalized form. Entries are
+    indexed by that key, by the key's sorted position for prefix lookups, by
+    its words and by the character trigrams of its words. A fuzzy search scores
+    a few candidates exactly by trigram similarity (Dice coefficient): the
+    entries sharing two of the query's rarest words, for a word missing, added
+    or moved, and the entries sharing the most of its rarest trigrams, for
+    typos. Word sets are intersected from the smaller one and only the rarest
+    trigram posting lists are read, so its cost follows how common the words of
+    the query are rather than the size of the catalog.
+    """
+
+    def __init__(self, min_similarity: float, margin: float):
+        self.min_similarity = min_similarity
+        self.margin = margin
+        # Name or alias, its key and restaurant of every entry, None once removed
+        self.entries: List[Optional[Tuple[str, str, int]]] = []
+        # Trigrams of every entry's key, interned so entries share the strings
+        self.grams: List[Optional[Tuple[str, ...]]] = []
+        self.entry_ids: Dict[int, List[int]] = {}
+        self.exact: Dict[str, Set[int]] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.words: Dict[str, Set[int]] = {}
+        # Keys in order for prefix lookups, new ones are merged in on the next lookup
+        self.sorted_keys: List[str] = []
+        self.unsorted_keys: List[str] = []
+        # Most words in a key, the longest run of words a text is looked up by
+        self.max_words = 0
+
+    def __len__(self) -> int:
+        return len(self.entry_ids)
+
+    def set_names(self, restaurant_id: int, names: Iterable[str]) -> None:
+        """Replace the name and aliases of a restaurant"""
+        self.remove(restaurant_id)
+        entry_ids = []
+        keys = set()
+        for name in names:
+            key = normalize_name(name)
+            if not key or key in keys:
+                continue
+            keys.add(key)
+            entry_id = len(self.entries)
+            self.entries.append((name, key, restaurant_id))
+            grams = tuple(sys.intern(gram) for gram in name_grams(key))
+            self.grams.append(grams)
+            entry_ids.append(entry_id)
+            ids = self.exact.setdefault(key, set())
+            if not ids:
+                self.unsorted_keys.append(key)
+            ids.add(restaurant_id)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(entry_id)
+            for word in key.split():
+                self.words.setdefault(word, set()).add(entry_id)
+            self.max_words = max(self.max_words, key.count(" ") + 1)
+        self.entry_ids[restaurant_id] = entry_ids
+
+    def remove(self, restaurant_id: int) -> None:
+        for entry_id in self.entry_ids.pop(restaurant_id, ()):
+            _, key, _ = self.entries[entry_id]
+            self.entries[entry_id] = None
+            grams, self.grams[entry_id] = self.grams[entry_id], None
+            ids = self.exact[key]
+            ids.discard(restaurant_id)
+            if not ids:
+                del self.exact[key]
+            # Entries are appended in id order, so every posting list is sorted
+            for gram in grams:
+                posting = self.postings[gram]
+                del posting[bisect.bisect_left(posting, entry_id)]
+            for word in set(key.split()):
+                entries = self.words[word]
+                entries.discard(entry_id)
+                if not entries:
+                    del self.words[word]
+
+    def _keys(self) -> List[str]:
+        if self.unsorted_keys:
+            if len(self.unsorted_keys) > 100:
+                self.sorted_keys = sorted({*self.sorted_keys, *self.unsorted_keys})
+            else:
+                for key in self.unsorted_keys:
+                    position = bisect.bisect_left(self.sorted_keys, key)
+                    if self.sorted_keys[position : position + 1] != [key]:
+                        self.sorted_keys.insert(position, key)
+            self.unsorted_keys = []
+        return self.sorted_keys
+
+    def _prefixed(self, key: str) -> Set[int]:
+        """Restaurants with a name or alias starting with the key, two at most"""
+        keys = self._keys()
+        found = set()
+        position = bisect.bisect_left(keys, key)
+        while position < len(keys) and keys[position].startswith(key):
+            found |= self.exact.get(keys[position], set())
+            if len(found) > 1:
+                break
+            position += 1
+        return found
+
+    def _word_candidates(self, key: str) -> List[int]:
+        """Entries sharing two of the three rarest words of the key, closest first"""
+        postings = sorted(
+            (self.words[word] for word in set(key.split()) if word in self.words),
+            key=len,
+        )
+        shared = Counter(
+            itertools.chain.from_iterable(
+                entries & other
+                for entries, other in itertools.combinations(postings[:3], 2)
+            )
+        )
+        return sorted(
+            shared,
+            key=lambda entry_id: (
+                -shared[entry_id],
+                abs(len(self.entries[entry_id][1]) - len(key)),
+            ),
+        )[:MAX_CANDIDATES]
+
+    def _gram_candidates(self, grams: Set[str]) -> List[int]:
+        """Entries sharing the most of the rarest grams"""
+        postings = sorted((self.postings.get(gram, []) for gram in grams), key=len)
+        # An entry sharing fewer grams than this is below min_similarity whatever
+        # its length, so it shares one of the len(grams) - overlap + 1 rarest
+        overlap = max(
+            1, math.ceil(self.min_similarity * len(grams) / (2 - self.min_similarity))
+        )
+        read = 0
+        budget = MAX_POSTINGS
+        for posting in postings[: len(grams) - overlap + 1]:
+            # The rarest grams the query shares with any entry are always read, the
+            # budget only stops the search once some of them were
+            if budget < MAX_POSTINGS and len(posting) > budget:
+                break
+            budget -= len(posting)
+            read += 1
+        counts = Counter(itertools.chain.from_iterable(postings[:read]))
+        if len(counts) <= MAX_CANDIDATES:
+            return list(counts)
+        # Lowest count among the MAX_CANDIDATES highest, found from how many entries
+        # have each count rather than by ranking thousands of entries
+        kept = 0
+        for threshold, entries in sorted(
+            Counter(counts.values()).items(), reverse=True
+        ):
+            kept += entries
+            if kept >= MAX_CANDIDATES:
+                break
+        above = [entry_id for entry_id, count in counts.items() if count > threshold]
+        tied = (entry_id for entry_id, count in counts.items() if count == threshold)
+        return above + list(itertools.islice(tied, MAX_CANDIDATES - len(above)))
+
+    def search(self, name: str, limit: int = 3) -> List[RestaurantMatch]:
+        """Closest restaurants by trigram similarity of their best name or alias"""
+        query = normalize_name(name)
+        grams = name_grams(query)
+        best: Dict[int, RestaurantMatch] = {}
+        for entry_id in {
+            *self._word_candidates(query),
+            *self._gram_candidates(grams),
+        }:
+            entry_name, key, restaurant_id = self.entries[entry_id]
+            score = _dice(grams, self.grams[entry_id])
+            if score >= self.min_similarity and (
+                restaurant_id not in best or score > best[restaurant_id].score
+            ):
+                best[restaurant_id] = RestaurantMatch(restaurant_id, entry_name, score)
+        return sorted(best.values(), key=lambda match: match.score, reverse=True)[
+            :limit
+        ]
+
+    def resolve(self, name: str) -> RestaurantResolution:
+        """The restaurant a name written by a customer or the model means.
+
+        An exact name or alias wins, then the only restaurant whose name starts
+        with it, then the closest one when no other comes within margin, which is
+        returned with the matches it was picked from.
+        """
+        key = normalize_name(name)
+        if not key:
+            return RestaurantResolution(None, [])
+        ids = self.exact.get(key, set())
+        if len(ids) == 1:
+            return RestaurantResolution(next(iter(ids)), [])
+        if not ids and len(key) >= MIN_PREFIX_LENGTH:
+            ids = self._prefixed(key)
+            if len(ids) == 1:
+                return RestaurantResolution(next(iter(ids)), [])
+        matches = self.search(name)
+        if matches and not ids:
+            if len(matches) == 1 or matches[0].score - matches[1].score >= self.margin:
+                return RestaurantResolution(
+                    matches[0].restaurant_id, matches, fuzzy=True
+                )
+        return RestaurantResolution(None, matches)
+
+    def name_words(self, restaurant_id: int) -> Set[str]:
+        """Words of the name and aliases of a restaurant"""
+        return {
+            word
+            for entry_id in self.entry_ids.get(restaurant_id, ())
+            for word in self.entries[entry_id][1].split()
+        }
+
+    def find_in_text(self, text: str) -> Set[int]:
+        """Restaurants whose name or alias is written in the text, word for word"""
+        words = normalize_name(text).split()
+        found = set()
+        for start in range(len(words)):
+            for end in range(start + 1, min(start + self.max_words, len(words)) + 1):
+                found |= self.exact.get(" ".join(words[start:end]), set())
+        return found
+
+
+def resolve_restaurant(
+    name: str, allow_fuzzy: bool = True
+) -> Tuple[Optional[RestaurantInfo], str]:
+    """The restaurant a tool was given, or the reply to make when there is none.
+
+    Without allow_fuzzy a name that only resolves by similarity is answered with
+    the closest names, so a typo is confirmed before it is acted on.
+    """
+    resolution = restaurant_catalog.resolve(name)
+    if resolution.restaurant_id in availability_index.restaurants and (
+        allow_fuzzy or not resolution.fuzzy
+    ):
+        return availability_index.restaurants[resolution.restaurant_id], ""
+    names = [
+        availability_index.restaurants[match.restaurant_id].name
+        for match in resolution.candidates
+        if match.restaurant_id in availability_index.restaurants
+    ]
+    if names:
+        return None, (
+            f"I could not tell which restaurant {name} is."
+            f" Did you mean {' or '.join(names)}?"
+        )
+    return None, f"I could not find a restaurant called {name}."
+
+
+restaurant_catalog = RestaurantCatalog(
+    min_similarity=config.RESTAURANT_MATCH_SIMILARITY,
+    margin=config.RESTAURANT_MATCH_MARGIN,
+)
@@ -0,0 +1,46 @@
+import math
+import re
+from functools import lru_cache
+from typing import Any, Dict
+
+from src import logging
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Without tiktoken, text is split like the o200k pre-tokenizer does and words longer
+# than a typical BPE token are counted as several, which slightly overestimates
+WORD_PATTERN = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]+|_+")
+CHARACTERS_PER_WORD_TOKEN = 6
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Unable to load the o200k_base encoding: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return sum(
+        math.ceil(len(word) / CHARACTERS_PER_WORD_TOKEN)
+        for word in WORD_PATTERN.findall(text)
+    )
+
+
+def count_message_tokens(message: Dict[str, Any]) -> int:
+    return count_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
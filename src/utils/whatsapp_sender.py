@@ -0,0 +1,137 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from src import config
+from src import logging
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 10.0
+
+
+class RateLimiter:
+    """Token bucket limiting the number of outbound messages per second"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def create_graph_api_client() -> httpx.AsyncClient:
+    """Create the pooled HTTP/2 client used for every Graph API call of a worker"""
+    return httpx.AsyncClient(
+        base_url=config.GRAPH_API_URL,
+        headers={
+            "Authorization": f"Bearer {config.ACCESS_TOKEN}",
+            "Content-Type": "application/json",
+        },
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=config.WHATSAPP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.WHATSAPP_MAX_CONNECTIONS,
+        ),
+        timeout=config.WHATSAPP_SEND_TIMEOUT_SECONDS,
+    )
+
+
+def _get_retry_delay(response: Optional[httpx.Response], attempt: int) -> float:
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    # Full jitter exponential backoff
+    return random.uniform(
+        0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2**attempt)
+    )
+
+
+class WhatsAppSender:
+    """Send WhatsApp messages in order per recipient under a global rate limit.
+
+    Messages to the same number are sent one after the other, messages to
+    different numbers are sent concurrently. Requests failing with 429 or a 5xx
+    status are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        messages_per_second: float = config.WHATSAPP_MESSAGES_PER_SECOND,
+        max_retries: int = config.WHATSAPP_SEND_MAX_RETRIES,
+    ):
+        self.client = client
+        self.rate_limiter = RateLimiter(rate=messages_per_second)
+        self.max_retries = max_retries
+        self._number_locks: Dict[str, asyncio.Lock] = {}
+        self._number_pending: Dict[str, int] = {}
+
+    async def send_text(self, phone_number: str, message: str) -> Dict[str, Any]:
+        payload = {
+            "messaging_product": "whatsapp",
+            "to": phone_number,
+            "type": "text",
+            "text": {"body": message},
+        }
+        lock = self._number_locks.setdefault(phone_number, asyncio.Lock())
+        self._number_pending[phone_number] = (
+            self._number_pending.get(phone_number, 0) + 1
+        )
+        try:
+            async with lock:
+                return await self._post_with_retries(payload=payload)
+        finally:
+            self._number_pending[phone_number] -= 1
+            if self._number_pending[phone_number] == 0:
+                del self._number_pending[phone_number]
+                del self._number_locks[phone_number]
+
+    async def _post_with_retries(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        url = f"/{config.PHONE_NUMBER_ID}/messages"
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            try:
+                response = await self.client.post(url, json=payload)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = _get_retry_delay(response=None, attempt=attempt)
+                logger.warning(f"Retrying message send in {delay:.2f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            if (
+                response.status_code in RETRY_STATUS_CODES
+                and attempt < self.max_retries
+            ):
+                delay = _get_retry_delay(response=response, attempt=attempt)
+                logger.warning(
+                    f"Retrying message send in {delay:.2f}s: status {response.status_code}"
+                )
+                await asyncio.sleep(delay)
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
@@ -1,18 +1,64 @@
-from arq.connections import RedisSettings
+from arq import func
 
-from src.routes.whatsapp_route import process_whatsapp_message
+from src import config
+from src.repositories.message_repository import MessageWriter
+from src.repositories.restaurant_repository import (
+    AvailabilityRefresher,
+    load_availability_index,
+)
+from src.routes.whatsapp_route import (
+    process_whatsapp_message,
+    promote_waitlist_entries,
+    refresh_whatsapp_summary,
+)
+from src.utils.availability_index import availability_index
+from src.utils.metrics import MetricsPublisher, process_name
+from src.utils.restaurant_catalog import restaurant_catalog
+from src.utils.whatsapp_sender import WhatsAppSender, create_graph_api_client
 
 
 class WorkerSettings:
-    functions = [process_whatsapp_message]
-    redis_settings = RedisSettings(host="localhost", port=6379, database=0)
+    # No result is kept for summary refreshes so their job id only blocks duplicates
+    # while one is queued or running
+    functions = [
+        process_whatsapp_message,
+        func(refresh_whatsapp_summary, keep_result=0),
+        func(promote_waitlist_entries, name="promote_waitlist", keep_result=0),
+    ]
+    redis_settings = config.REDIS_SETTINGS
+    max_jobs = config.WORKER_MAX_JOBS
+    job_timeout = config.WORKER_JOB_TIMEOUT_SECONDS
 
     @staticmethod
     async def on_startup(ctx):
+        ctx["whatsapp_sender"] = WhatsAppSender(client=create_graph_api_client())
+        if config.MESSAGE_WRITE_BEHIND:
+            ctx["message_writer"] = MessageWriter(
+                batch_size=config.MESSAGE_WRITE_BATCH_SIZE,
+                flush_seconds=config.MESSAGE_WRITE_FLUSH_SECONDS,
+            )
+            ctx["message_writer"].start()
+        await load_availability_index(availability_index, catalog=restaurant_catalog)
+        ctx["availability_refresher"] = AvailabilityRefresher(
+            index=availability_index,
+            interval_seconds=config.AVAILABILITY_REFRESH_SECONDS,
+            catalog=restaurant_catalog,
+        )
+        ctx["availability_refresher"].start()
+        ctx["metrics_publisher"] = MetricsPublisher(
+            redis_pool=ctx["redis"],
+            process=process_name("worker"),
+            interval_seconds=config.METRICS_PUSH_SECONDS,
+        )
+        ctx["metrics_publisher"].start()
         print("Worker started...")
-        pass
 
     @staticmethod
     async def on_shutdown(ctx):
+        await ctx["whatsapp_sender"].aclose()
+        ctx["availability_refresher"].stop()
+        ctx["metrics_publisher"].stop()
+        await ctx["metrics_publisher"].publish()
+        if "message_writer" in ctx:
+            await ctx["message_writer"].stop()
         print("Worker stopped...")
-        pass